@@ -1,7 +1,7 @@
 from .env import find_env_file, is_env_enabled, load_env, log_env_loaded
 from .providers import create_adapter
 from .render import RendererConfig
-from .runtime import RuntimeContext, RuntimeOptions, run_cli
+from .runtime import RuntimeContext, RuntimeOptions, arun_cli, run_cli
 from .tools import ToolRegistry
 from .tracing import build_langsmith_run_config, maybe_trace_request_payload
 
@@ -10,6 +10,7 @@ __all__ = [
     "RuntimeContext",
     "RuntimeOptions",
     "ToolRegistry",
+    "arun_cli",
     "build_langsmith_run_config",
     "create_adapter",
     "find_env_file",
@@ -2,24 +2,227 @@ from __future__ import annotations
 
 import json
 import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
 
+try:
+    import zstandard
+except ModuleNotFoundError:  # optional dependency
+    zstandard = None
+
+try:
+    import msgpack
+except ModuleNotFoundError:  # optional dependency
+    msgpack = None
+
+
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 64
+WRITE_BEHIND_MAX_PENDING = 8
+WRITE_BEHIND_CLOSE_TIMEOUT_S = 10.0
+DEFAULT_CODEC = "zlib"
+LEGACY_CODEC = "json"
+
+# Preset compression dictionaries by version: the keys and values every
+# LangChain message dict repeats, so even single-message rows compress well.
+# A row's codec tag names the version it was written with (`zlib1`,
+# `zstd1`). Never edit a dictionary in place: add the next version, point
+# `_DICT_VERSION` at it, and keep the old ones so existing rows still decode.
+_DICT_V1 = (
+    b'{"type":"human","data":{"content":"'
+    b'{"type":"ai","data":{"content":"","response_metadata":{"finish_reason":"stop",'
+    b'"model_name":"kimi-k2.5","model_provider":"openai","system_fingerprint":null},'
+    b'"tool_calls":[{"name":"memory_upsert","args":{"content":"","kind":"semantic"},'
+    b'"id":"","type":"tool_call"}],"usage_metadata":{"input_tokens":0,'
+    b'"output_tokens":0,"total_tokens":0,"input_token_details":{"cache_read":0},'
+    b'"output_token_details":{"reasoning":0}},"additional_kwargs":{}'
+    b'{"type":"tool","data":{"content":"Memory saved for active user. id=",'
+    b'"name":"memory_upsert","tool_call_id":"'
+)
+_DICTIONARIES: Dict[int, bytes] = {1: _DICT_V1}
+_DICT_VERSION = 1
+# Tags written before they carried a dictionary version.
+_UNVERSIONED_TAGS = {"zlib": 1, "zstd": 1}
+_ZLIB_LEVEL = 6
+_ZSTD_LEVEL = 3
+
+
+@dataclass(frozen=True)
+class CheckpointCodec:
+    tag: str
+    encode: Callable[[Dict[str, Any]], bytes]
+    decode: Callable[[bytes], Dict[str, Any]]
+
+
+def _compact_message_dict(item: Dict[str, Any]) -> Dict[str, Any]:
+    # Drop the defaults LangChain repeats on every message; messages_from_dict
+    # restores them on load.
+    data = {
+        key: value
+        for key, value in item.get("data", {}).items()
+        if key != "type"
+        and value is not None
+        and value != {}
+        and value != []
+        and not (key == "example" and value is False)
+        and not (key == "status" and value == "success")
+    }
+    data.setdefault("content", item.get("data", {}).get("content", ""))
+    return {"type": item.get("type"), "data": data}
+
+
+def _json_bytes(item: Dict[str, Any]) -> bytes:
+    return json.dumps(item, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _zlib_codec(version: int) -> CheckpointCodec:
+    zdict = _DICTIONARIES[version]
+
+    def encode(item: Dict[str, Any]) -> bytes:
+        compressor = zlib.compressobj(_ZLIB_LEVEL, zdict=zdict)
+        return compressor.compress(_json_bytes(item)) + compressor.flush()
+
+    def decode(payload: bytes) -> Dict[str, Any]:
+        decompressor = zlib.decompressobj(zdict=zdict)
+        return json.loads(decompressor.decompress(payload) + decompressor.flush())
+
+    return CheckpointCodec(f"zlib{version}", encode, decode)
+
+
+def _zstd_codec(version: int) -> CheckpointCodec:
+    zstd_dict = zstandard.ZstdCompressionDict(_DICTIONARIES[version])
+    return CheckpointCodec(
+        f"zstd{version}",
+        lambda item: zstandard.ZstdCompressor(
+            level=_ZSTD_LEVEL, dict_data=zstd_dict
+        ).compress(_json_bytes(item)),
+        lambda payload: json.loads(
+            zstandard.ZstdDecompressor(dict_data=zstd_dict).decompress(payload)
+        ),
+    )
+
+
+def _build_codecs() -> Tuple[Dict[str, CheckpointCodec], Dict[str, CheckpointCodec]]:
+    # Returns writers by codec name and readers by row tag; readers cover
+    # every dictionary version, writers only the current one.
+    families: Dict[str, Callable[[int], CheckpointCodec]] = {"zlib": _zlib_codec}
+    if zstandard is not None:
+        families["zstd"] = _zstd_codec
+    writers: Dict[str, CheckpointCodec] = {}
+    readers: Dict[str, CheckpointCodec] = {}
+    for name, build in families.items():
+        for version in _DICTIONARIES:
+            codec = build(version)
+            readers[codec.tag] = codec
+        writers[name] = readers[f"{name}{_DICT_VERSION}"]
+    for tag, version in _UNVERSIONED_TAGS.items():
+        versioned = readers.get(f"{tag}{version}")
+        if versioned is not None:
+            readers[tag] = versioned
+    if msgpack is not None:
+        writers["msgpack"] = readers["msgpack"] = CheckpointCodec(
+            "msgpack",
+            lambda item: msgpack.packb(item, use_bin_type=True),
+            lambda payload: msgpack.unpackb(payload, raw=False),
+        )
+    return writers, readers
+
+
+_CODECS, _ROW_DECODERS = _build_codecs()
+
+
+def available_codecs() -> List[str]:
+    """Codec names usable for writes; `json` is the uncompressed legacy format."""
+    return [LEGACY_CODEC, *_CODECS]
+
 
 class CheckpointStoreError(RuntimeError):
     pass
 
 
 class SqliteCheckpointStore:
-    def __init__(self, db_path: Path) -> None:
+    """Thread-scoped ST checkpoints stored as one row per message.
+
+    Rows are keyed by `(thread_id, seq)` so a turn only inserts the messages
+    appended since the last save. Threads written by the legacy
+    `thread_checkpoints` blob format are migrated on first access.
+
+    The store owns one long-lived WAL-mode connection, so concurrent CLI
+    processes sharing the database do not block each other's readers. Call
+    `close()` on shutdown.
+
+    New rows are written with `codec` (compact JSON + zlib by default) into the
+    `payload` BLOB column and tagged per row; rows tagged `json` keep the legacy
+    `message_json` text and are still read transparently.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        synchronous: str = "NORMAL",
+        codec: str = DEFAULT_CODEC,
+    ) -> None:
+        level = synchronous.strip().upper()
+        if level not in SYNCHRONOUS_LEVELS:
+            raise CheckpointStoreError(
+                f"invalid sqlite synchronous level '{synchronous}'; "
+                f"expected one of {', '.join(SYNCHRONOUS_LEVELS)}"
+            )
+        codec_tag = codec.strip().lower()
+        if codec_tag not in available_codecs():
+            raise CheckpointStoreError(
+                f"checkpoint codec '{codec}' is unavailable; "
+                f"expected one of {', '.join(available_codecs())}"
+            )
         self.path = db_path
+        self.synchronous = level
+        self.codec = codec_tag
         self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
         self._init_db()
 
-    def _connect(self) -> sqlite3.Connection:
-        return sqlite3.connect(self.path)
+    def _open(self) -> sqlite3.Connection:
+        # Statements below are constant SQL strings, so sqlite3's per-connection
+        # statement cache reuses their prepared form across turns.
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        return conn
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._open()
+            with self._conn:
+                yield self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except sqlite3.Error as exc:
+            raise CheckpointStoreError(
+                f"failed closing checkpoint database at {self.path}: {exc}"
+            ) from exc
 
     def _init_db(self) -> None:
         try:
@@ -33,52 +236,295 @@ class SqliteCheckpointStore:
                     )
                     """
                 )
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS thread_messages (
+                        thread_id TEXT NOT NULL,
+                        seq INTEGER NOT NULL,
+                        message_json TEXT NOT NULL,
+                        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                        PRIMARY KEY (thread_id, seq)
+                    ) WITHOUT ROWID
+                    """
+                )
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS thread_summaries (
+                        thread_id TEXT PRIMARY KEY,
+                        summary TEXT NOT NULL,
+                        upto_seq INTEGER NOT NULL,
+                        updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+                    )
+                    """
+                )
+                columns = {
+                    row[1] for row in conn.execute("PRAGMA table_info(thread_messages)")
+                }
+                if "codec" not in columns:
+                    conn.execute(
+                        "ALTER TABLE thread_messages "
+                        f"ADD COLUMN codec TEXT NOT NULL DEFAULT '{LEGACY_CODEC}'"
+                    )
+                if "payload" not in columns:
+                    conn.execute("ALTER TABLE thread_messages ADD COLUMN payload BLOB")
         except sqlite3.Error as exc:
             raise CheckpointStoreError(
                 f"failed to initialize checkpoint database at {self.path}: {exc}"
             ) from exc
 
+    @property
+    def row_tag(self) -> str:
+        """Tag stored on new rows: the codec name plus its dictionary version, if any."""
+        codec = _CODECS.get(self.codec)
+        return codec.tag if codec is not None else self.codec
+
+    def _encode_row(self, item: Dict[str, Any]) -> Tuple[str, Optional[bytes]]:
+        if self.codec == LEGACY_CODEC:
+            return json.dumps(item), None
+        return "", _CODECS[self.codec].encode(_compact_message_dict(item))
+
+    def _decode_row(
+        self,
+        codec: str,
+        message_json: str,
+        payload: Optional[bytes],
+    ) -> Dict[str, Any]:
+        if codec == LEGACY_CODEC:
+            return json.loads(message_json)
+        decoder = _ROW_DECODERS.get(codec)
+        if decoder is None:
+            raise CheckpointStoreError(
+                f"checkpoint row uses codec '{codec}', which is not installed here"
+            )
+        return decoder.decode(payload or b"")
+
+    def _insert_rows(
+        self,
+        conn: sqlite3.Connection,
+        thread_id: str,
+        items: List[Dict[str, Any]],
+        start_seq: int,
+    ) -> None:
+        rows = []
+        for seq, item in enumerate(items, start=start_seq):
+            message_json, payload = self._encode_row(item)
+            rows.append((thread_id, seq, message_json, self.row_tag, payload))
+        conn.executemany(
+            "INSERT INTO thread_messages (thread_id, seq, message_json, codec, payload) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def _migrate_legacy(self, conn: sqlite3.Connection, thread_id: str) -> None:
+        # Legacy rows hold the whole history as one JSON blob; explode them into
+        # per-message rows once, then drop the blob so later saves stay deltas.
+        row = conn.execute(
+            "SELECT history_json FROM thread_checkpoints WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchone()
+        if row is None:
+            return
+        payload = json.loads(row[0])
+        existing = conn.execute(
+            "SELECT COUNT(*) FROM thread_messages WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchone()[0]
+        if not existing:
+            self._insert_rows(conn, thread_id, payload, start_seq=0)
+        conn.execute("DELETE FROM thread_checkpoints WHERE thread_id = ?", (thread_id,))
+
+    def _next_seq(self, conn: sqlite3.Connection, thread_id: str) -> int:
+        row = conn.execute(
+            "SELECT MAX(seq) FROM thread_messages WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchone()
+        return 0 if row is None or row[0] is None else int(row[0]) + 1
+
+    def _decode_messages(
+        self,
+        thread_id: str,
+        items: List[Dict[str, Any]],
+    ) -> List[BaseMessage]:
+        if not items:
+            return []
+        try:
+            return list(messages_from_dict(items))
+        except Exception as exc:  # noqa: BLE001
+            raise CheckpointStoreError(
+                f"failed decoding checkpoint payload for thread '{thread_id}': {exc}"
+            ) from exc
+
+    def _decode_rows(
+        self,
+        thread_id: str,
+        rows: List[Tuple[Any, ...]],
+    ) -> List[Dict[str, Any]]:
+        try:
+            return [self._decode_row(*row) for row in rows]
+        except CheckpointStoreError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            raise CheckpointStoreError(
+                f"failed decoding checkpoint payload for thread '{thread_id}': {exc}"
+            ) from exc
+
     def load(self, thread_id: str) -> List[BaseMessage]:
+        return self.load_range(thread_id, 0)
+
+    def count(self, thread_id: str) -> int:
         try:
             with self._connect() as conn:
-                row = conn.execute(
-                    "SELECT history_json FROM thread_checkpoints WHERE thread_id = ?",
-                    (thread_id,),
-                ).fetchone()
+                self._migrate_legacy(conn, thread_id)
+                return self._next_seq(conn, thread_id)
         except sqlite3.Error as exc:
             raise CheckpointStoreError(
                 f"failed reading checkpoint for thread '{thread_id}': {exc}"
             ) from exc
+        except ValueError as exc:
+            raise CheckpointStoreError(
+                f"failed decoding legacy checkpoint for thread '{thread_id}': {exc}"
+            ) from exc
 
-        if row is None:
-            return []
+    def load_range(
+        self,
+        thread_id: str,
+        start_seq: int,
+        end_seq: Optional[int] = None,
+    ) -> List[BaseMessage]:
+        """Load messages with `start_seq <= seq < end_seq` (to the tail if None)."""
+        try:
+            with self._connect() as conn:
+                self._migrate_legacy(conn, thread_id)
+                if end_seq is None:
+                    rows = conn.execute(
+                        "SELECT codec, message_json, payload FROM thread_messages "
+                        "WHERE thread_id = ? AND seq >= ? ORDER BY seq",
+                        (thread_id, max(0, start_seq)),
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT codec, message_json, payload FROM thread_messages "
+                        "WHERE thread_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                        (thread_id, max(0, start_seq), end_seq),
+                    ).fetchall()
+        except sqlite3.Error as exc:
+            raise CheckpointStoreError(
+                f"failed reading checkpoint for thread '{thread_id}': {exc}"
+            ) from exc
+        except ValueError as exc:
+            raise CheckpointStoreError(
+                f"failed decoding legacy checkpoint for thread '{thread_id}': {exc}"
+            ) from exc
+        return self._decode_messages(thread_id, self._decode_rows(thread_id, rows))
+
+    def load_tail(self, thread_id: str, limit: int) -> Tuple[int, List[BaseMessage]]:
+        """Load roughly the last `limit` messages and return `(start_seq, messages)`.
 
+        The window is widened backwards so it never starts on a ToolMessage
+        whose tool call lives in an older, unloaded message.
+        """
         try:
-            payload = json.loads(row[0])
-            return list(messages_from_dict(payload))
-        except Exception as exc:  # noqa: BLE001
+            with self._connect() as conn:
+                self._migrate_legacy(conn, thread_id)
+                start_seq = max(0, self._next_seq(conn, thread_id) - max(0, limit))
+                rows = conn.execute(
+                    "SELECT codec, message_json, payload FROM thread_messages "
+                    "WHERE thread_id = ? AND seq >= ? ORDER BY seq",
+                    (thread_id, start_seq),
+                ).fetchall()
+                items = self._decode_rows(thread_id, rows)
+                while start_seq > 0 and items and items[0].get("type") == "tool":
+                    start_seq -= 1
+                    row = conn.execute(
+                        "SELECT codec, message_json, payload FROM thread_messages "
+                        "WHERE thread_id = ? AND seq = ?",
+                        (thread_id, start_seq),
+                    ).fetchone()
+                    if row is None:
+                        break
+                    items[:0] = self._decode_rows(thread_id, [row])
+        except sqlite3.Error as exc:
             raise CheckpointStoreError(
-                f"failed decoding checkpoint payload for thread '{thread_id}': {exc}"
+                f"failed reading checkpoint for thread '{thread_id}': {exc}"
+            ) from exc
+        except ValueError as exc:
+            raise CheckpointStoreError(
+                f"failed decoding legacy checkpoint for thread '{thread_id}': {exc}"
             ) from exc
+        return start_seq, self._decode_messages(thread_id, items)
 
-    def save(self, thread_id: str, history: List[BaseMessage]) -> None:
+    def load_summary(self, thread_id: str) -> Tuple[str, int]:
+        """Return the rolling context summary and the seq it covers up to."""
         try:
-            payload = json.dumps(messages_to_dict(history))
             with self._connect() as conn:
-                conn.execute(
-                    """
-                    INSERT INTO thread_checkpoints (thread_id, history_json, updated_at)
-                    VALUES (?, ?, datetime('now'))
-                    ON CONFLICT(thread_id) DO UPDATE SET
-                        history_json = excluded.history_json,
-                        updated_at = datetime('now')
-                    """,
-                    (thread_id, payload),
+                row = conn.execute(
+                    "SELECT summary, upto_seq FROM thread_summaries WHERE thread_id = ?",
+                    (thread_id,),
+                ).fetchone()
+        except sqlite3.Error as exc:
+            raise CheckpointStoreError(
+                f"failed reading context summary for thread '{thread_id}': {exc}"
+            ) from exc
+        if row is None:
+            return "", 0
+        return str(row[0]), int(row[1])
+
+    def save(
+        self,
+        thread_id: str,
+        history: List[BaseMessage],
+        start_seq: int = 0,
+        summary: Optional[Tuple[str, int]] = None,
+    ) -> None:
+        """Persist `history`, inserting only messages beyond the stored tail.
+
+        `history[0]` has sequence number `start_seq`, so a partially restored
+        window can be saved without loading older messages. If the window
+        ends before what is stored (for example after a rollback), rows past
+        its end are removed so the stored thread matches. `summary` is an
+        optional `(text, upto_seq)` rolling summary written in the same
+        transaction.
+        """
+        try:
+            with self._connect() as conn:
+                self._migrate_legacy(conn, thread_id)
+                if summary is not None:
+                    conn.execute(
+                        """
+                        INSERT INTO thread_summaries (thread_id, summary, upto_seq, updated_at)
+                        VALUES (?, ?, ?, datetime('now'))
+                        ON CONFLICT(thread_id) DO UPDATE SET
+                            summary = excluded.summary,
+                            upto_seq = excluded.upto_seq,
+                            updated_at = datetime('now')
+                        """,
+                        (thread_id, summary[0], summary[1]),
+                    )
+                next_seq = self._next_seq(conn, thread_id)
+                end_seq = start_seq + len(history)
+                if end_seq < next_seq:
+                    conn.execute(
+                        "DELETE FROM thread_messages WHERE thread_id = ? AND seq >= ?",
+                        (thread_id, end_seq),
+                    )
+                    return
+                if start_seq > next_seq:
+                    raise CheckpointStoreError(
+                        f"checkpoint window for thread '{thread_id}' starts at seq "
+                        f"{start_seq} but only {next_seq} messages are stored"
+                    )
+                new_messages = history[next_seq - start_seq :]
+                if not new_messages:
+                    return
+                self._insert_rows(
+                    conn, thread_id, messages_to_dict(new_messages), start_seq=next_seq
                 )
         except sqlite3.Error as exc:
             raise CheckpointStoreError(
                 f"failed writing checkpoint for thread '{thread_id}': {exc}"
             ) from exc
+        except CheckpointStoreError:
+            raise
         except Exception as exc:  # noqa: BLE001
             raise CheckpointStoreError(
                 f"failed serializing checkpoint for thread '{thread_id}': {exc}"
@@ -87,12 +533,179 @@ class SqliteCheckpointStore:
     def clear(self, thread_id: str) -> bool:
         try:
             with self._connect() as conn:
-                cursor = conn.execute(
+                legacy = conn.execute(
                     "DELETE FROM thread_checkpoints WHERE thread_id = ?",
                     (thread_id,),
                 )
-                return (cursor.rowcount or 0) > 0
+                messages = conn.execute(
+                    "DELETE FROM thread_messages WHERE thread_id = ?",
+                    (thread_id,),
+                )
+                conn.execute(
+                    "DELETE FROM thread_summaries WHERE thread_id = ?",
+                    (thread_id,),
+                )
+                return ((legacy.rowcount or 0) + (messages.rowcount or 0)) > 0
         except sqlite3.Error as exc:
             raise CheckpointStoreError(
                 f"failed clearing checkpoint for thread '{thread_id}': {exc}"
             ) from exc
+
+
+@dataclass
+class _PendingSave:
+    history: List[BaseMessage]
+    start_seq: int
+    summary: Optional[Tuple[str, int]]
+
+
+class WriteBehindCheckpointStore:
+    """Write-behind wrapper that persists checkpoints on a background thread.
+
+    `save()` snapshots the history and returns immediately; queued saves for
+    the same thread coalesce into the latest snapshot. The queue holds at most
+    `max_pending` threads and `save()` blocks when it is full.
+
+    Durability: a turn is durable once the writer has committed it. `/exit`,
+    SIGINT/SIGQUIT and `close()` flush the queue first, and `clear()` drops the
+    thread's queued snapshot and waits for in-flight writes. A hard kill
+    (SIGKILL, power loss) can lose the turns still queued at that moment.
+    Write failures are kept and returned by `take_error()`.
+    """
+
+    def __init__(
+        self,
+        store: SqliteCheckpointStore,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+    ) -> None:
+        self.store = store
+        self.max_pending = max(1, max_pending)
+        self._pending: "OrderedDict[str, _PendingSave]" = OrderedDict()
+        self._writing: Optional[str] = None
+        self._errors: List[CheckpointStoreError] = []
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="checkpoint-writer",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                thread_id, pending = self._pending.popitem(last=False)
+                self._writing = thread_id
+                self._cond.notify_all()
+            try:
+                self.store.save(
+                    thread_id,
+                    pending.history,
+                    start_seq=pending.start_seq,
+                    summary=pending.summary,
+                )
+            except CheckpointStoreError as exc:
+                error = exc
+            except Exception as exc:  # noqa: BLE001
+                error = CheckpointStoreError(
+                    f"failed writing checkpoint for thread '{thread_id}': {exc}"
+                )
+            else:
+                error = None
+            with self._cond:
+                if error is not None:
+                    self._errors.append(error)
+                self._writing = None
+                self._cond.notify_all()
+
+    def save(
+        self,
+        thread_id: str,
+        history: List[BaseMessage],
+        start_seq: int = 0,
+        summary: Optional[Tuple[str, int]] = None,
+    ) -> None:
+        snapshot = _PendingSave(list(history), start_seq, summary)
+        with self._cond:
+            if self._closed:
+                raise CheckpointStoreError(
+                    f"checkpoint writer is closed; cannot save thread '{thread_id}'"
+                )
+            while (
+                thread_id not in self._pending
+                and len(self._pending) >= self.max_pending
+            ):
+                self._cond.wait()
+            previous = self._pending.get(thread_id)
+            if snapshot.summary is None and previous is not None:
+                snapshot.summary = previous.summary
+            self._pending[thread_id] = snapshot
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and self._writing is None,
+                timeout=timeout,
+            )
+
+    def take_error(self) -> Optional[CheckpointStoreError]:
+        with self._cond:
+            if not self._errors:
+                return None
+            errors, self._errors = self._errors, []
+        return errors[-1]
+
+    def load(self, thread_id: str) -> List[BaseMessage]:
+        self.flush()
+        return self.store.load(thread_id)
+
+    def count(self, thread_id: str) -> int:
+        self.flush()
+        return self.store.count(thread_id)
+
+    def load_range(
+        self,
+        thread_id: str,
+        start_seq: int,
+        end_seq: Optional[int] = None,
+    ) -> List[BaseMessage]:
+        self.flush()
+        return self.store.load_range(thread_id, start_seq, end_seq)
+
+    def load_tail(self, thread_id: str, limit: int) -> Tuple[int, List[BaseMessage]]:
+        self.flush()
+        return self.store.load_tail(thread_id, limit)
+
+    def load_summary(self, thread_id: str) -> Tuple[str, int]:
+        self.flush()
+        return self.store.load_summary(thread_id)
+
+    def clear(self, thread_id: str) -> bool:
+        with self._cond:
+            self._pending.pop(thread_id, None)
+            self._cond.notify_all()
+        self.flush()
+        return self.store.clear(thread_id)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=WRITE_BEHIND_CLOSE_TIMEOUT_S)
+        try:
+            if self._thread.is_alive():
+                raise CheckpointStoreError(
+                    "checkpoint writer did not finish within "
+                    f"{WRITE_BEHIND_CLOSE_TIMEOUT_S:.0f}s; last turns may not be persisted"
+                )
+            error = self.take_error()
+            if error is not None:
+                raise error
+        finally:
+            self.store.close()
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+# Rough chars-per-token ratio for budget estimates; provider tokenizers differ
+# but this keeps the estimate cheap and provider-agnostic.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_MESSAGE_CHARS = 2000
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of an earlier part of a conversation between "
+    "a user and an assistant. Merge the previous summary with the new transcript "
+    "excerpt into one concise summary. Keep user facts, decisions, open questions, "
+    "names, and anything later turns may refer back to. Drop pleasantries. "
+    "Reply with the summary text only."
+)
+
+
+@dataclass
+class ContextWindowConfig:
+    token_budget: int = 32_000
+    keep_last: int = 20
+
+
+@dataclass
+class ContextWindowPlan:
+    start: int
+    evict_from: int
+    estimated_tokens: int
+
+    @property
+    def needs_summary(self) -> bool:
+        return self.start > self.evict_from
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, dict):
+                parts.append(str(part.get("text", "")))
+            else:
+                parts.append(str(part))
+        return "\n".join(parts)
+    return str(content)
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    chars = len(_content_text(message.content))
+    if isinstance(message, AIMessage) and message.tool_calls:
+        chars += len(json.dumps(message.tool_calls, default=str))
+    return MESSAGE_OVERHEAD_TOKENS + chars // CHARS_PER_TOKEN
+
+
+def estimate_text_tokens(text: str) -> int:
+    return MESSAGE_OVERHEAD_TOKENS + len(text) // CHARS_PER_TOKEN
+
+
+def safe_window_start(history: List[BaseMessage], index: int) -> int:
+    """Move `index` back so the window never starts inside a tool-call group."""
+    index = max(0, min(index, len(history)))
+    while 0 < index < len(history) and history[index].type == "tool":
+        index -= 1
+    return index
+
+
+def plan_window(
+    history: List[BaseMessage],
+    resident_start: int,
+    fixed_tokens: int,
+    config: ContextWindowConfig,
+) -> ContextWindowPlan:
+    """Pick where the prompt window starts within `history`.
+
+    `resident_start` is the first message not yet covered by the rolling
+    summary. If everything from there fits in the budget, nothing is evicted.
+    Otherwise the window shrinks to the last `keep_last` messages (and further
+    while still over budget), and `[evict_from, start)` must be summarized.
+    """
+    resident_start = max(0, min(resident_start, len(history)))
+    costs = [estimate_tokens(message) for message in history[resident_start:]]
+    total = fixed_tokens + sum(costs)
+    if total <= config.token_budget:
+        return ContextWindowPlan(resident_start, resident_start, total)
+
+    start = max(
+        resident_start,
+        safe_window_start(history, max(resident_start, len(history) - config.keep_last)),
+    )
+    tokens = fixed_tokens + sum(costs[start - resident_start :])
+    last_human = max(
+        (idx for idx, message in enumerate(history) if isinstance(message, HumanMessage)),
+        default=len(history) - 1,
+    )
+    while tokens > config.token_budget and start < last_human:
+        tokens -= costs[start - resident_start]
+        start += 1
+        while start < last_human and history[start].type == "tool":
+            tokens -= costs[start - resident_start]
+            start += 1
+    return ContextWindowPlan(start, resident_start, tokens)
+
+
+def format_transcript(messages: List[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        text = _content_text(message.content).strip()
+        if len(text) > SUMMARY_MESSAGE_CHARS:
+            text = f"{text[: SUMMARY_MESSAGE_CHARS - 3]}..."
+        if isinstance(message, AIMessage) and message.tool_calls:
+            calls = ", ".join(
+                f"{call.get('name')}({json.dumps(call.get('args', {}), default=str)})"
+                for call in message.tool_calls
+            )
+            text = f"{text}\n[called tools: {calls}]".strip()
+        if text:
+            lines.append(f"{message.type}: {text}")
+    return "\n".join(lines)
+
+
+async def asummarize_with_model(
+    model: Any,
+    previous_summary: str,
+    evicted: List[BaseMessage],
+    run_config: Optional[dict] = None,
+) -> str:
+    """Fold `evicted` into `previous_summary`; models without `ainvoke` run on a thread."""
+    prompt = (
+        f"Previous summary:\n{previous_summary or '(none)'}\n\n"
+        f"New transcript excerpt:\n{format_transcript(evicted)}"
+    )
+    request = [SystemMessage(content=SUMMARY_INSTRUCTIONS), HumanMessage(content=prompt)]
+    kwargs = {"config": run_config} if run_config else {}
+    if hasattr(model, "ainvoke"):
+        response = await model.ainvoke(request, **kwargs)
+    else:
+        response = await asyncio.to_thread(model.invoke, request, **kwargs)
+    return _content_text(getattr(response, "content", "")).strip()
+
+
+def summary_message(summary: str) -> SystemMessage:
+    return SystemMessage(
+        content=(
+            "Summary of earlier conversation (older turns were condensed; "
+            f"may omit details):\n{summary}"
+        )
+    )
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+# Near-duplicates are facts whose character shingles overlap at least this
+# much (Jaccard). MinHash banding only proposes candidates; every candidate
+# pair is confirmed on the exact shingle sets before it is merged. Facts that
+# differ in any number ("2 kids" vs "3 kids") are never near-duplicates.
+NEAR_DUPLICATE_THRESHOLD = 0.85
+SHINGLE_SIZE = 5
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_NUMBER_RE = re.compile(r"\d+")
+_SIGNATURE_SIZE = MINHASH_BANDS * MINHASH_ROWS
+
+
+def normalize_content(text: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form used for dedup keys."""
+    return " ".join(_WORD_RE.findall(text.casefold()))
+
+
+def content_key(kind: str, content: str) -> str:
+    """Stable digest of `(kind, normalized content)`; equal keys are exact duplicates."""
+    raw = f"{kind}\0{normalize_content(content)}".encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _shingles(normalized: str) -> Set[int]:
+    if len(normalized) <= SHINGLE_SIZE:
+        pieces: Iterable[str] = (normalized,)
+    else:
+        pieces = (
+            normalized[idx : idx + SHINGLE_SIZE]
+            for idx in range(len(normalized) - SHINGLE_SIZE + 1)
+        )
+    return {
+        int.from_bytes(hashlib.blake2b(piece.encode("utf-8"), digest_size=8).digest(), "little")
+        for piece in pieces
+    }
+
+
+def _minhash_bands(shingles: Set[int]) -> List[Tuple[int, ...]]:
+    # One-permutation MinHash: shingle hashes are already uniform, so the low
+    # bits pick a bin and each bin keeps its minimum. One pass per record
+    # instead of one per hash function.
+    signature = [-1] * _SIGNATURE_SIZE
+    for value in shingles:
+        slot = value % _SIGNATURE_SIZE
+        rest = value // _SIGNATURE_SIZE
+        if signature[slot] < 0 or rest < signature[slot]:
+            signature[slot] = rest
+    return [
+        tuple(signature[band * MINHASH_ROWS : (band + 1) * MINHASH_ROWS])
+        for band in range(MINHASH_BANDS)
+    ]
+
+
+def _jaccard(left: Set[int], right: Set[int]) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+@dataclass
+class CompactionResult:
+    records: List[Dict[str, Any]]
+    exact_duplicates: int
+    near_duplicates: int
+
+    @property
+    def merged(self) -> int:
+        return self.exact_duplicates + self.near_duplicates
+
+
+def _find(parent: List[int], idx: int) -> int:
+    while parent[idx] != idx:
+        parent[idx] = parent[parent[idx]]
+        idx = parent[idx]
+    return idx
+
+
+def compact_records(records: List[Dict[str, Any]]) -> CompactionResult:
+    """Merge exact and near-duplicate records of the same `kind`.
+
+    Near-duplicates must also share their `subject`, if any.
+
+    `records` is oldest-first. Each duplicate group collapses into its member
+    with the newest `updated_at` (later position wins ties), which keeps its
+    id and place in file order and inherits the group's earliest `created_at`.
+    """
+    parent = list(range(len(records)))
+    exact_duplicates = 0
+    by_key: Dict[str, int] = {}
+    representatives: List[int] = []
+    for position, record in enumerate(records):
+        key = content_key(str(record.get("kind", "")), str(record.get("content", "")))
+        first = by_key.get(key)
+        if first is None:
+            by_key[key] = position
+            representatives.append(position)
+        else:
+            parent[position] = first
+            exact_duplicates += 1
+
+    shingles: Dict[int, Set[int]] = {}
+    buckets: Dict[Tuple[Any, ...], List[int]] = {}
+    for position in representatives:
+        record = records[position]
+        normalized = normalize_content(str(record.get("content", "")))
+        if not normalized:
+            continue
+        shingles[position] = _shingles(normalized)
+        scope = (
+            str(record.get("kind", "")),
+            normalize_content(str(record.get("subject") or "")),
+            tuple(_NUMBER_RE.findall(normalized)),
+        )
+        for band, signature in enumerate(_minhash_bands(shingles[position])):
+            buckets.setdefault((*scope, band, signature), []).append(position)
+
+    near_duplicates = 0
+    checked: Set[Tuple[int, int]] = set()
+    for members in buckets.values():
+        for left_idx, left in enumerate(members):
+            for right in members[left_idx + 1 :]:
+                if (left, right) in checked:
+                    continue
+                checked.add((left, right))
+                left_root, right_root = _find(parent, left), _find(parent, right)
+                if left_root == right_root:
+                    continue
+                if _jaccard(shingles[left], shingles[right]) >= NEAR_DUPLICATE_THRESHOLD:
+                    parent[max(left_root, right_root)] = min(left_root, right_root)
+                    near_duplicates += 1
+
+    groups: Dict[int, List[int]] = {}
+    for position in range(len(records)):
+        groups.setdefault(_find(parent, position), []).append(position)
+    kept: List[Tuple[int, Dict[str, Any]]] = []
+    for members in groups.values():
+        winner = max(members, key=lambda idx: (str(records[idx].get("updated_at", "")), idx))
+        record = records[winner]
+        if len(members) > 1:
+            created = min(str(records[idx].get("created_at", "")) for idx in members)
+            if created and created != record.get("created_at"):
+                record = {**record, "created_at": created}
+        kept.append((winner, record))
+    kept.sort(key=lambda item: item[0])
+    return CompactionResult(
+        [record for _position, record in kept],
+        exact_duplicates,
+        near_duplicates,
+    )
@@ -2,17 +2,304 @@ from __future__ import annotations
 
 import hashlib
 import json
+import mmap
+import os
+import re
+import tempfile
+import threading
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .lt_compaction import compact_records, content_key
+from .lt_retention import (
+    RETENTION_SWEEP_BATCH,
+    RetentionPolicy,
+    RetentionResult,
+    select_expired,
+)
+from .lt_search import Bm25Index
+from .lt_vectors import Embedder, VectorIndex, VectorIndexError
+
+try:
+    import fcntl
+except ModuleNotFoundError:  # not available on Windows
+    fcntl = None
+
+REVERSE_READ_BLOCK_SIZE = 64 * 1024
+VECTOR_SUFFIXES = (".vec.f32", ".vec.ids", ".vec.json")
+LOCK_SUFFIX = ".lock"
+# Automatic compaction runs once a file reaches COMPACT_SIZE_BYTES and has
+# grown by COMPACT_GROWTH_RATIO since it was last compacted in this process,
+# or once stale lines (exact duplicates, superseded versions, tombstones)
+# make up COMPACT_DUPLICATE_RATIO of its indexed records.
+COMPACT_SIZE_BYTES = 1024 * 1024
+COMPACT_GROWTH_RATIO = 1.5
+COMPACT_DUPLICATE_RATIO = 0.2
+COMPACT_MIN_RECORDS = 20
+# Retention sweeps compact a file once the tombstones they wrote since its
+# last compaction reach this fraction of its surviving records.
+COMPACT_TOMBSTONE_RATIO = 0.2
+CACHE_MAX_USERS = 64
+CACHE_RECENT_DEPTH = 32
+
+StatKey = Tuple[int, int, int]
 
 
 class LongTermMemoryStoreError(RuntimeError):
     pass
 
 
+def iter_lines_reverse(
+    handle: BinaryIO,
+    block_size: int = REVERSE_READ_BLOCK_SIZE,
+) -> Iterator[Tuple[int, bytes]]:
+    """Yield `(byte_offset, line)` pairs from the end of a file backwards.
+
+    Reads fixed-size blocks from the tail, so returning the newest k lines
+    costs O(k) regardless of how large the file is.
+    """
+    handle.seek(0, 2)
+    position = handle.tell()
+    remainder = b""
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        handle.seek(position)
+        block = handle.read(read_size) + remainder
+        lines = block.split(b"\n")
+        remainder = lines[0]
+        line_start = position + len(remainder) + 1
+        offsets = []
+        for line in lines[1:]:
+            offsets.append((line_start, line))
+            line_start += len(line) + 1
+        yield from reversed(offsets)
+    if remainder:
+        yield 0, remainder
+
+
+def iter_buffer_lines_reverse(buffer: Any) -> Iterator[Tuple[int, bytes]]:
+    """Yield `(byte_offset, line)` pairs from the end of a bytes-like buffer.
+
+    Lines are located with `rfind` on the raw buffer; only the returned line
+    slices are copied out, so an mmap of a large file is never read in full
+    unless the caller keeps iterating.
+    """
+    end = len(buffer)
+    while end > 0:
+        start = buffer.rfind(b"\n", 0, end) + 1
+        yield start, buffer[start:end]
+        end = start - 1
+
+
+@contextmanager
+def _mapped(handle: BinaryIO) -> Iterator[Any]:
+    # Map only up to the last newline. Bytes past it can only be a torn line,
+    # and another process may truncate those; touching a truncated mapped
+    # page would raise SIGBUS.
+    handle.seek(0, 2)
+    size = handle.tell()
+    clean_end = 0
+    position = size
+    while position > 0 and not clean_end:
+        read_size = min(REVERSE_READ_BLOCK_SIZE, position)
+        position -= read_size
+        handle.seek(position)
+        newline = handle.read(read_size).rfind(b"\n")
+        if newline >= 0:
+            clean_end = position + newline + 1
+    if not clean_end:
+        yield b""
+        return
+    buffer = mmap.mmap(handle.fileno(), clean_end, access=mmap.ACCESS_READ)
+    try:
+        yield buffer
+    finally:
+        buffer.close()
+
+
+def _ends_cleanly(path: Path) -> bool:
+    """True if `path` is missing, empty, or ends with a newline."""
+    try:
+        with path.open("rb") as handle:
+            handle.seek(0, 2)
+            if handle.tell() == 0:
+                return True
+            handle.seek(-1, 2)
+            return handle.read(1) == b"\n"
+    except FileNotFoundError:
+        return True
+
+
+def _stat_key(path: Path) -> Optional[StatKey]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+@dataclass
+class _UserCacheEntry:
+    stat_key: StatKey
+    # Newest-first valid records; `complete` means the whole file is covered.
+    recent: List[Dict[str, Any]]
+    complete: bool
+    # Every live record oldest-first (None where a later version superseded
+    # it) plus its BM25 index, built on first search or upsert.
+    records: Optional[List[Optional[Dict[str, Any]]]] = None
+    index: Optional[Bm25Index] = None
+    positions: Optional[Dict[str, int]] = None
+    # Upsert hash index: `content_key` of the content, and of the subject when
+    # set, -> position of the newest record with that key.
+    content_keys: Optional[Dict[str, int]] = None
+    subject_keys: Optional[Dict[str, int]] = None
+    # File lines compaction would drop: exact duplicates, superseded
+    # versions, and tombstones.
+    stale: int = 0
+    # Embedding sidecar, attached (and synced with `records`) on first
+    # semantic search.
+    vectors: Optional[VectorIndex] = None
+
+
+@dataclass
+class CompactionReport:
+    records_before: int
+    records_after: int
+    bytes_before: int
+    bytes_after: int
+    folded_lines: int = 0
+
+    @property
+    def merged(self) -> int:
+        return self.records_before - self.records_after
+
+    @property
+    def reclaimed_bytes(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+def _is_tombstone(parsed: Dict[str, Any]) -> bool:
+    return parsed.get("op") == "tombstone"
+
+
+# Lines this store writes start with the id (tombstones with their op first),
+# so the id can be read off the raw bytes to skip superseded lines unparsed.
+_CANONICAL_ID_RE = re.compile(rb'\{(?:"op": "tombstone", )?"id": "([^"\\]*)"')
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _peek_id(line: bytes) -> Optional[bytes]:
+    match = _CANONICAL_ID_RE.match(line)
+    return match.group(1) if match else None
+
+
+def _record_keys(record: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    kind = str(record.get("kind", ""))
+    subject = record.get("subject")
+    return (
+        content_key(kind, str(record.get("content", ""))),
+        content_key(kind, str(subject)) if subject else None,
+    )
+
+
+def _index_record(entry: _UserCacheEntry, record: Dict[str, Any]) -> None:
+    assert entry.records is not None and entry.index is not None
+    position = len(entry.records)
+    entry.records.append(record)
+    entry.index.add(position, str(record.get("content", "")))
+    if entry.positions is not None:
+        entry.positions[str(record["id"])] = position
+    content, subject = _record_keys(record)
+    if entry.content_keys is not None:
+        if content in entry.content_keys:
+            entry.stale += 1
+        entry.content_keys[content] = position
+    if entry.subject_keys is not None and subject is not None:
+        entry.subject_keys[subject] = position
+
+
+def _unindex_record(entry: _UserCacheEntry, position: int) -> None:
+    assert entry.records is not None and entry.index is not None
+    record = entry.records[position]
+    if record is None:
+        return
+    entry.records[position] = None
+    entry.index.remove(position)
+    entry.stale += 1
+    if entry.positions is not None and entry.positions.get(str(record["id"])) == position:
+        del entry.positions[str(record["id"])]
+    content, subject = _record_keys(record)
+    for keys, key, slot in ((entry.content_keys, content, 0), (entry.subject_keys, subject, 1)):
+        if keys is None or key is None or keys.get(key) != position:
+            continue
+        # An older live record may share the key; upserts must still find it.
+        for older in range(position - 1, -1, -1):
+            candidate = entry.records[older]
+            if candidate is not None and _record_keys(candidate)[slot] == key:
+                keys[key] = older
+                break
+        else:
+            del keys[key]
+
+
+def _indexed_cache_entry(
+    stat_key: StatKey,
+    records: List[Dict[str, Any]],
+    stale: int = 0,
+) -> _UserCacheEntry:
+    entry = _UserCacheEntry(
+        stat_key,
+        list(reversed(records[-CACHE_RECENT_DEPTH:])),
+        complete=len(records) <= CACHE_RECENT_DEPTH,
+        records=[],
+        index=Bm25Index(),
+        positions={},
+        content_keys={},
+        subject_keys={},
+        stale=stale,
+    )
+    for record in records:
+        _index_record(entry, record)
+    return entry
+
+
 class JsonlLongTermMemoryStore:
+    """Per-user JSONL long-term memory.
+
+    Recent records are cached per user and revalidated against the file's
+    `(mtime_ns, size, inode)`, so unchanged files are not re-read. The cache
+    holds at most `cache_max_users` users and evicts least recently used.
+
+    `upsert` updates a matching record instead of appending a duplicate: it
+    writes a tombstone line for the old version followed by the new one, and
+    readers keep only the newest version of each id.
+
+    With an `embedder`, each appended record is also embedded once and added
+    to a per-user vector sidecar used by `semantic_search`.
+
+    `compact` merges duplicate records and rewrites the file atomically;
+    `maybe_compact` does so only past the size or duplicate-ratio thresholds.
+
+    With a `retention` policy, `enforce_retention` deletes records past
+    their TTL or beyond the count/byte bounds by appending tombstones;
+    `RetentionSweeper` calls it from a background thread.
+
+    Writers in every process serialize on an fcntl lock on a per-user
+    `<key>.lock` file, and each write is one `write(2)` on an `O_APPEND`
+    descriptor, so concurrent appends never interleave within a line. With
+    `fsync=True` each write is also fsynced. Readers take no lock. A torn
+    trailing line left by a crash is truncated once, the first time the
+    user's file is touched.
+    """
+
     REQUIRED_FIELDS = {
         "id",
         "user_id",
@@ -21,10 +308,56 @@ class JsonlLongTermMemoryStore:
         "created_at",
         "updated_at",
     }
+    _REQUIRED_KEY_BYTES = tuple(f'"{field}":'.encode("ascii") for field in REQUIRED_FIELDS)
 
-    def __init__(self, memory_dir: Path) -> None:
+    def __init__(
+        self,
+        memory_dir: Path,
+        cache_max_users: int = CACHE_MAX_USERS,
+        embedder: Optional[Embedder] = None,
+        fsync: bool = False,
+        retention: Optional[RetentionPolicy] = None,
+    ) -> None:
         self.memory_dir = memory_dir
+        self.embedder = embedder
+        self.fsync = fsync
+        self.retention = retention
         self.memory_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_max_users = max(1, cache_max_users)
+        self._cache: "OrderedDict[str, _UserCacheEntry]" = OrderedDict()
+        self._cache_lock = threading.RLock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._cache_evictions = 0
+        self._compacted_sizes: Dict[str, int] = {}
+        # user_key -> (retention tombstones since the last compaction, live
+        # records left by the latest sweep); read by `maybe_compact`.
+        self._retention_tombstones: Dict[str, Tuple[int, int]] = {}
+        # user_key -> writer lock for that user within this process. It is
+        # taken before the user's fcntl lock, and `_cache_lock` (which only
+        # guards the cache dict) is never held while waiting on either.
+        self._user_locks: Dict[str, threading.RLock] = {}
+        # user_key -> (lock fd, depth), guarded by that user's writer lock;
+        # the fcntl lock is per open file, so nested acquisitions in this
+        # process reuse the held descriptor.
+        self._held_locks: Dict[str, Tuple[int, int]] = {}
+        self._tails_checked: set = set()
+
+    def cache_stats(self) -> Dict[str, int]:
+        with self._cache_lock:
+            return {
+                "hits": self._cache_hits,
+                "misses": self._cache_misses,
+                "evictions": self._cache_evictions,
+                "users": len(self._cache),
+            }
+
+    def _cache_put(self, user_key: str, entry: _UserCacheEntry) -> None:
+        self._cache[user_key] = entry
+        self._cache.move_to_end(user_key)
+        while len(self._cache) > self.cache_max_users:
+            self._cache.popitem(last=False)
+            self._cache_evictions += 1
 
     def _user_key(self, user_id: str) -> str:
         raw = str(user_id)
@@ -35,49 +368,341 @@ class JsonlLongTermMemoryStore:
     def _user_path(self, user_id: str) -> Path:
         return self.memory_dir / f"{self._user_key(user_id)}.jsonl"
 
+    def _user_lock(self, user_key: str) -> threading.RLock:
+        with self._cache_lock:
+            lock = self._user_locks.get(user_key)
+            if lock is None:
+                lock = self._user_locks[user_key] = threading.RLock()
+            return lock
+
+    @contextmanager
+    def _file_lock(self, user_key: str) -> Iterator[None]:
+        # Never called with the cache lock held: a writer blocked here on
+        # another thread or process must not stall readers of the cache.
+        with self._user_lock(user_key):
+            held = self._held_locks.get(user_key)
+            if held is not None:
+                self._held_locks[user_key] = (held[0], held[1] + 1)
+                try:
+                    yield
+                finally:
+                    fd, depth = self._held_locks[user_key]
+                    self._held_locks[user_key] = (fd, depth - 1)
+                return
+            if fcntl is None:
+                yield
+                return
+            lock_path = self.memory_dir / f"{user_key}{LOCK_SUFFIX}"
+            try:
+                fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError as exc:
+                raise LongTermMemoryStoreError(
+                    f"failed locking long-term memory at {lock_path}: {exc}"
+                ) from exc
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self._held_locks[user_key] = (fd, 1)
+                yield
+            finally:
+                self._held_locks.pop(user_key, None)
+                os.close(fd)
+
+    def _repair_tail(self, user_key: str, path: Path) -> None:
+        # Called without the cache lock. A crash mid-append can leave a last
+        # line without its newline; drop it (or, if it is a complete record,
+        # terminate it) so it is neither re-warned about nor glued to the
+        # next append.
+        self._tails_checked.add(user_key)
+        if _ends_cleanly(path):
+            return
+        with self._file_lock(user_key):
+            try:
+                with path.open("rb+") as handle:
+                    handle.seek(0, 2)
+                    size = handle.tell()
+                    if size == 0:
+                        return
+                    handle.seek(size - 1)
+                    if handle.read(1) == b"\n":
+                        return
+                    offset, tail = next(iter_lines_reverse(handle))
+                    try:
+                        parsed = json.loads(tail)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        parsed = None
+                    if isinstance(parsed, dict) and "id" in parsed:
+                        handle.seek(size)
+                        handle.write(b"\n")
+                        return
+                    handle.truncate(offset)
+            except FileNotFoundError:
+                return
+            except OSError as exc:
+                raise LongTermMemoryStoreError(
+                    f"failed repairing long-term memory file {path}: {exc}"
+                ) from exc
+            print(
+                "Long-term memory warning: truncated torn trailing line "
+                f"({size - offset} bytes at byte {offset}) in {path}."
+            )
+
+    def _append_bytes(self, path: Path, payload: bytes) -> None:
+        # One write(2) on an O_APPEND descriptor keeps each record line whole
+        # even with other processes appending; loop only on a short write.
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            view = memoryview(payload)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
     def load_recent(self, user_id: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Return the newest `k` valid records, newest first, reading from the tail."""
         if k <= 0:
             return []
+        user_key = self._user_key(user_id)
         path = self._user_path(user_id)
-        if not path.exists():
-            return []
+        if user_key not in self._tails_checked:
+            self._repair_tail(user_key, path)
+        stat_key = _stat_key(path)
+        with self._cache_lock:
+            if stat_key is None:
+                self._cache.pop(user_key, None)
+                return []
+            entry = self._cache.get(user_key)
+            if (
+                entry is not None
+                and entry.stat_key == stat_key
+                and (entry.complete or len(entry.recent) >= k)
+            ):
+                self._cache_hits += 1
+                self._cache.move_to_end(user_key)
+                return list(entry.recent[:k])
+            self._cache_misses += 1
+
+        depth = max(k, CACHE_RECENT_DEPTH)
+        records = self._scan_recent(path, user_id, depth)
+        self._cache_scanned(
+            user_key,
+            path,
+            _UserCacheEntry(stat_key, records, complete=len(records) < depth),
+        )
+        return list(records[:k])
+
+    def _cache_scanned(self, user_key: str, path: Path, entry: _UserCacheEntry) -> None:
+        # Scans run outside the cache lock. Cache the result only if the file
+        # is still the version it was stat'ed at, so a writer's fresher entry
+        # is never replaced by an older view.
+        with self._cache_lock:
+            if _stat_key(path) == entry.stat_key:
+                self._cache_put(user_key, entry)
+
+    def _parse_line(
+        self,
+        raw_line: bytes,
+        offset: int,
+        path: Path,
+        canonical: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        line = raw_line.strip()
+        if not line:
+            return None
+        if (
+            not canonical
+            and not line.startswith(b'{"op": "tombstone"')
+            and not all(map(line.__contains__, self._REQUIRED_KEY_BYTES))
+        ):
+            # Fast path: a foreign line missing a required key is rejected
+            # from the raw bytes without decoding it. Lines this store wrote
+            # skip the substring search; the key check below still runs.
+            print(
+                "Long-term memory warning: skipping invalid record "
+                f"line at byte {offset} in {path} (missing required fields)."
+            )
+            return None
+        try:
+            parsed = _JSON_DECODER.decode(line.decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+            print(
+                "Long-term memory warning: skipping malformed JSONL "
+                f"line at byte {offset} in {path}: {exc}"
+            )
+            return None
+        if not isinstance(parsed, dict):
+            print(
+                "Long-term memory warning: skipping invalid record "
+                f"line at byte {offset} in {path} (JSON value is not an object)."
+            )
+            return None
+        if _is_tombstone(parsed) and "id" in parsed:
+            return parsed
+        if not parsed.keys() >= self.REQUIRED_FIELDS:
+            print(
+                "Long-term memory warning: skipping invalid record "
+                f"line at byte {offset} in {path} (missing required fields)."
+            )
+            return None
+        return parsed
+
+    def _scan_reverse(
+        self,
+        path: Path,
+        user_id: str,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Return up to `limit` live records newest-first, plus stale lines seen.
 
+        Scans an mmap of the file from the end. The newest line per id wins:
+        a newer version or a tombstone hides older lines, which are skipped
+        by id without being decoded.
+        """
         records: List[Dict[str, Any]] = []
+        # Ids as UTF-8 bytes, so peeked ids are compared without decoding.
+        shadowed: Set[bytes] = set()
+        stale = 0
         try:
-            with path.open("r", encoding="utf-8") as handle:
-                for line_no, raw_line in enumerate(handle, start=1):
-                    line = raw_line.strip()
-                    if not line:
+            with path.open("rb") as handle, _mapped(handle) as buffer:
+                for offset, raw_line in iter_buffer_lines_reverse(buffer):
+                    peeked = _peek_id(raw_line)
+                    if peeked in shadowed:
+                        stale += 1
                         continue
-                    try:
-                        parsed = json.loads(line)
-                    except json.JSONDecodeError as exc:
-                        print(
-                            "Long-term memory warning: skipping malformed JSONL "
-                            f"line {line_no} in {path}: {exc}"
-                        )
+                    parsed = self._parse_line(
+                        raw_line, offset, path, canonical=peeked is not None
+                    )
+                    if parsed is None:
                         continue
-                    if not isinstance(parsed, dict):
-                        print(
-                            "Long-term memory warning: skipping invalid record "
-                            f"line {line_no} in {path} (JSON value is not an object)."
-                        )
+                    record_id = (
+                        peeked if peeked is not None else str(parsed["id"]).encode("utf-8")
+                    )
+                    if record_id in shadowed:
+                        stale += 1
                         continue
-                    if not self.REQUIRED_FIELDS.issubset(parsed.keys()):
-                        print(
-                            "Long-term memory warning: skipping invalid record "
-                            f"line {line_no} in {path} (missing required fields)."
-                        )
+                    shadowed.add(record_id)
+                    if _is_tombstone(parsed):
+                        stale += 1
                         continue
                     records.append(parsed)
-        except OSError as exc:
+                    if limit is not None and len(records) >= limit:
+                        break
+        except (OSError, ValueError) as exc:
             raise LongTermMemoryStoreError(
                 f"failed reading long-term memory for user '{user_id}': {exc}"
             ) from exc
+        return records, stale
+
+    def _scan_recent(self, path: Path, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        return self._scan_reverse(path, user_id, limit)[0]
+
+    def _scan_all(self, path: Path, user_id: str) -> Tuple[List[Dict[str, Any]], int]:
+        """Return live records oldest-first and the number of stale lines folded."""
+        records, stale = self._scan_reverse(path, user_id)
+        records.reverse()
+        return records, stale
+
+    def _indexed_entry(self, user_id: str) -> Optional[_UserCacheEntry]:
+        # Called without the cache lock; read the returned entry under it, as
+        # writers update cached entries in place. Builds the full record list
+        # and BM25 index once per file version; appends keep them current.
+        user_key = self._user_key(user_id)
+        path = self._user_path(user_id)
+        if user_key not in self._tails_checked:
+            self._repair_tail(user_key, path)
+        stat_key = _stat_key(path)
+        with self._cache_lock:
+            if stat_key is None:
+                self._cache.pop(user_key, None)
+                return None
+            entry = self._cache.get(user_key)
+            if entry is not None and entry.stat_key == stat_key and entry.index is not None:
+                self._cache_hits += 1
+                self._cache.move_to_end(user_key)
+                return entry
+            self._cache_misses += 1
+
+        entry = _indexed_cache_entry(stat_key, *self._scan_all(path, user_id))
+        self._cache_scanned(user_key, path, entry)
+        return entry
+
+    def search(self, user_id: str, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Return up to `k` records ranked by BM25 relevance to `query`.
+
+        Equal scores go to the newer record. Only records sharing at least one
+        query term are returned, so callers may backfill with `load_recent`.
+        """
+        if k <= 0:
+            return []
+        entry = self._indexed_entry(user_id)
+        with self._cache_lock:
+            if entry is None or entry.index is None or entry.records is None:
+                return []
+            return [entry.records[doc_id] for doc_id, _score in entry.index.search(query, k)]
+
+    def _synced_vectors(
+        self,
+        user_id: str,
+        entry: _UserCacheEntry,
+        refresh: Tuple[str, ...] = (),
+    ) -> VectorIndex:
+        # Called without the cache lock. Opening the sidecar embeds only
+        # records it does not have yet (e.g. written before semantic mode was
+        # enabled) plus `refresh` ids whose content just changed. It is opened,
+        # so its ids are read, only once the user's file lock is held: another
+        # writer's rows are then on disk, and ours cannot interleave with them.
+        with self._file_lock(self._user_key(user_id)):
+            with self._cache_lock:
+                if entry.vectors is not None:
+                    return entry.vectors
+                assert self.embedder is not None and entry.records is not None
+                records = [record for record in entry.records if record is not None]
+            vectors = VectorIndex(self._user_path(user_id), self.embedder)
+            known = set(vectors.ids).difference(refresh)
+            missing = [record for record in records if str(record["id"]) not in known]
+            if missing:
+                vectors.append(
+                    [str(record["id"]) for record in missing],
+                    self.embedder.embed([str(record.get("content", "")) for record in missing]),
+                )
+            with self._cache_lock:
+                entry.vectors = vectors
+            return vectors
 
-        if not records:
+    def semantic_search(self, user_id: str, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Return up to `k` records ranked by embedding cosine similarity.
+
+        Only the query is embedded here; records are embedded when appended.
+        Records with no positive similarity are left out, as in `search`.
+        """
+        if self.embedder is None:
+            raise LongTermMemoryStoreError("semantic search requires an embedder")
+        if k <= 0:
             return []
-        return list(reversed(records[-k:]))
+        while True:
+            entry = self._indexed_entry(user_id)
+            if entry is None or entry.records is None or entry.positions is None:
+                return []
+            try:
+                vectors = self._synced_vectors(user_id, entry)
+                query_vector = self.embedder.embed([query])[0]
+                with self._cache_lock:
+                    # Compaction detaches the sidecar before rewriting it;
+                    # search only one still attached, else sync again.
+                    if entry.vectors is not vectors:
+                        continue
+                    hits = vectors.search(query_vector, k)
+                    return [
+                        entry.records[entry.positions[record_id]]
+                        for record_id, score in hits
+                        if score > 0 and record_id in entry.positions
+                    ]
+            except (OSError, VectorIndexError) as exc:
+                raise LongTermMemoryStoreError(
+                    f"failed semantic search for user '{user_id}': {exc}"
+                ) from exc
 
     def append(
         self,
@@ -86,6 +711,7 @@ class JsonlLongTermMemoryStore:
         kind: str = "semantic",
         confidence: Optional[float] = None,
         source_turn_id: Optional[str] = None,
+        subject: Optional[str] = None,
     ) -> Dict[str, Any]:
         now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
         record: Dict[str, Any] = {
@@ -100,28 +726,396 @@ class JsonlLongTermMemoryStore:
             record["confidence"] = confidence
         if source_turn_id:
             record["source_turn_id"] = source_turn_id
+        if subject:
+            record["subject"] = subject
+        self._write(user_id, [record], record)
+        return record
+
+    def upsert(
+        self,
+        user_id: str,
+        content: str,
+        kind: str = "semantic",
+        confidence: Optional[float] = None,
+        source_turn_id: Optional[str] = None,
+        subject: Optional[str] = None,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Append `content`, or update the record it matches; returns `(record, updated)`.
 
+        A record matches on the same `(kind, subject)` when `subject` is given,
+        else on the same normalized content within `kind`. Both lookups hit the
+        per-user hash index. An update keeps the record's id and `created_at`.
+        The lookup and the write happen under the user's file lock.
+        """
+        with self._file_lock(self._user_key(user_id)):
+            entry = self._indexed_entry(user_id)
+            existing = None
+            with self._cache_lock:
+                if entry is not None and entry.records is not None:
+                    position = None
+                    if subject and entry.subject_keys is not None:
+                        position = entry.subject_keys.get(content_key(kind, subject))
+                    if position is None and entry.content_keys is not None:
+                        position = entry.content_keys.get(content_key(kind, content))
+                    if position is not None:
+                        existing = entry.records[position]
+            if existing is None:
+                return (
+                    self.append(user_id, content, kind, confidence, source_turn_id, subject),
+                    False,
+                )
+
+            now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+            record = {**existing, "content": content, "updated_at": now}
+            if confidence is not None:
+                record["confidence"] = confidence
+            if source_turn_id:
+                record["source_turn_id"] = source_turn_id
+            if subject:
+                record["subject"] = subject
+            tombstone = {
+                "op": "tombstone",
+                "id": record["id"],
+                "user_id": user_id,
+                "updated_at": now,
+            }
+            self._write(
+                user_id,
+                [tombstone, record],
+                record,
+                superseded=True,
+                embed=record["content"] != existing["content"],
+            )
+            return record, True
+
+    def _write(
+        self,
+        user_id: str,
+        lines: List[Dict[str, Any]],
+        record: Dict[str, Any],
+        superseded: bool = False,
+        embed: bool = True,
+    ) -> None:
+        user_key = self._user_key(user_id)
         path = self._user_path(user_id)
         path.parent.mkdir(parents=True, exist_ok=True)
+        payload = "".join(f"{json.dumps(line, ensure_ascii=True)}\n" for line in lines)
+        with self._file_lock(user_key):
+            self._repair_tail(user_key, path)
+            before = _stat_key(path)
+            try:
+                self._append_bytes(path, payload.encode("utf-8"))
+            except OSError as exc:
+                with self._cache_lock:
+                    self._cache.pop(user_key, None)
+                raise LongTermMemoryStoreError(
+                    f"failed writing long-term memory for user '{user_id}': {exc}"
+                ) from exc
+            with self._cache_lock:
+                self._cache_after_append(user_key, path, before, record, superseded)
+            if self.embedder is not None and embed:
+                self._embed_appended(user_id, user_key, record)
+
+    def _embed_appended(self, user_id: str, user_key: str, record: Dict[str, Any]) -> None:
+        # Caller holds the user's file lock. The JSONL line is already
+        # durable; a failed embedding only delays the record until the next
+        # semantic search resyncs the sidecar. Embedding and sidecar I/O run
+        # under the file lock only: the append goes to a fork of the attached
+        # index, swapped in under the cache lock, so searches never see a
+        # half-appended one.
+        with self._cache_lock:
+            entry = self._cache.get(user_key)
+            attached = entry.vectors if entry is not None else None
         try:
-            with path.open("a", encoding="utf-8") as handle:
-                handle.write(json.dumps(record, ensure_ascii=True))
-                handle.write("\n")
-        except OSError as exc:
-            raise LongTermMemoryStoreError(
-                f"failed writing long-term memory for user '{user_id}': {exc}"
-            ) from exc
+            if entry is not None and entry.records is not None and attached is None:
+                self._synced_vectors(user_id, entry, refresh=(str(record["id"]),))
+                return
+            embedded = self.embedder.embed([str(record["content"])])
+            if attached is None:
+                vectors = VectorIndex(self._user_path(user_id), self.embedder)
+            else:
+                vectors = attached.fork()
+                vectors.reload()
+            vectors.append([str(record["id"])], embedded)
+            with self._cache_lock:
+                if attached is not None and entry.vectors is attached:
+                    entry.vectors = vectors
+        except Exception as exc:  # noqa: BLE001
+            if entry is not None:
+                with self._cache_lock:
+                    entry.vectors = None
+            print(f"Long-term memory warning: failed embedding record {record['id']}: {exc}")
 
-        return record
+    def _cache_after_append(
+        self,
+        user_key: str,
+        path: Path,
+        before: Optional[StatKey],
+        record: Dict[str, Any],
+        superseded: bool = False,
+    ) -> None:
+        # Caller holds the cache lock and the user's file lock. Fold our own
+        # write into the cache instead of invalidating it; if the file changed
+        # underneath us since it was cached, drop the entry. `superseded`
+        # means the write was a tombstone plus a new version.
+        entry = self._cache.get(user_key)
+        after = _stat_key(path)
+        if after is None:
+            self._cache.pop(user_key, None)
+            return
+        if before is None:
+            self._cache_put(user_key, _indexed_cache_entry(after, [record]))
+            return
+        if entry is None or entry.stat_key != before:
+            self._cache.pop(user_key, None)
+            return
+        if entry.records is not None and entry.index is not None:
+            if superseded and entry.positions is not None:
+                position = entry.positions.get(str(record["id"]))
+                if position is not None:
+                    _unindex_record(entry, position)
+                entry.stale += 1
+            _index_record(entry, record)
+        if superseded:
+            entry.recent = [item for item in entry.recent if item["id"] != record["id"]]
+        entry.recent.insert(0, record)
+        if len(entry.recent) > CACHE_RECENT_DEPTH:
+            del entry.recent[CACHE_RECENT_DEPTH:]
+            entry.complete = False
+        entry.stat_key = after
+        self._cache.move_to_end(user_key)
 
-    def clear(self, user_id: str) -> bool:
+    def iter_all_records(self) -> Iterator[Dict[str, Any]]:
+        """Yield every user's live records, oldest first within each file."""
+        for path in sorted(self.memory_dir.glob("*.jsonl")):
+            records, _stale = self._scan_all(path, path.stem)
+            yield from records
+
+    def iter_user_ids(self) -> Iterator[str]:
+        """Yield the user id of every user file, read off its newest record."""
+        for path in sorted(self.memory_dir.glob("*.jsonl")):
+            records, _stale = self._scan_reverse(path, path.stem, limit=1)
+            if not records:
+                continue
+            user_id = str(records[0]["user_id"])
+            if self._user_path(user_id) == path:
+                yield user_id
+
+    def import_records(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Append records as-is; a record whose id already exists supersedes it."""
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            by_user.setdefault(str(record["user_id"]), []).append(record)
+        for user_id, user_records in by_user.items():
+            path = self._user_path(user_id)
+            payload = "".join(
+                f"{json.dumps(record, ensure_ascii=True)}\n" for record in user_records
+            )
+            user_key = self._user_key(user_id)
+            with self._file_lock(user_key):
+                self._repair_tail(user_key, path)
+                try:
+                    self._append_bytes(path, payload.encode("utf-8"))
+                except OSError as exc:
+                    raise LongTermMemoryStoreError(
+                        f"failed writing long-term memory for user '{user_id}': {exc}"
+                    ) from exc
+                finally:
+                    with self._cache_lock:
+                        self._cache.pop(user_key, None)
+        return sum(len(user_records) for user_records in by_user.values())
+
+    def enforce_retention(
+        self,
+        user_id: str,
+        now: Optional[datetime] = None,
+    ) -> Optional[RetentionResult]:
+        """Delete the records `retention` expires by appending tombstones for them.
+
+        At most `RETENTION_SWEEP_BATCH` records go per call, aged-out ones
+        first; the rest are left for the next sweep. Deleted lines stay on
+        disk until compaction folds them. Returns None without a policy or file.
+        Only the user's file lock is held while scanning and writing; the cache
+        lock is taken just to read and then update the user's cache entry.
+        """
+        if self.retention is None or not self.retention.enabled:
+            return None
+        moment = now or datetime.now(timezone.utc)
+        user_key = self._user_key(user_id)
+        path = self._user_path(user_id)
+        with self._file_lock(user_key):
+            before = _stat_key(path)
+            if before is None:
+                return None
+            # Use the cached index when it is current; otherwise scan without
+            # caching, so sweeping idle users does not evict active ones.
+            with self._cache_lock:
+                entry = self._cache.get(user_key)
+                if entry is not None and entry.stat_key == before and entry.records is not None:
+                    live = [record for record in entry.records if record is not None]
+                else:
+                    entry = None
+            if entry is None:
+                live, _stale = self._scan_all(path, user_id)
+            result = select_expired(live, self.retention, moment)
+            if len(result.expired_ids) > RETENTION_SWEEP_BATCH:
+                ids = result.expired_ids[:RETENTION_SWEEP_BATCH]
+                aged_out = min(result.aged_out, len(ids))
+                result = RetentionResult(ids, aged_out, len(ids) - aged_out)
+            if not result.expired_ids:
+                return result
+
+            stamp = moment.isoformat().replace("+00:00", "Z")
+            payload = "".join(
+                json.dumps(
+                    {"op": "tombstone", "id": record_id, "user_id": user_id, "updated_at": stamp},
+                    ensure_ascii=True,
+                )
+                + "\n"
+                for record_id in result.expired_ids
+            )
+            try:
+                self._append_bytes(path, payload.encode("utf-8"))
+            except OSError as exc:
+                with self._cache_lock:
+                    self._cache.pop(user_key, None)
+                raise LongTermMemoryStoreError(
+                    f"failed writing long-term memory for user '{user_id}': {exc}"
+                ) from exc
+            after = _stat_key(path)
+            with self._cache_lock:
+                tombstones, _live = self._retention_tombstones.get(user_key, (0, 0))
+                self._retention_tombstones[user_key] = (
+                    tombstones + len(result.expired_ids),
+                    len(live) - len(result.expired_ids),
+                )
+                if entry is None or after is None or entry.positions is None:
+                    self._cache.pop(user_key, None)
+                    return result
+                expired = set(result.expired_ids)
+                for record_id in expired:
+                    position = entry.positions.get(record_id)
+                    if position is not None:
+                        _unindex_record(entry, position)
+                    # The tombstone line itself is stale too.
+                    entry.stale += 1
+                entry.recent = [record for record in entry.recent if record["id"] not in expired]
+                entry.stat_key = after
+            return result
+
+    def compact(self, user_id: str) -> Optional[CompactionReport]:
+        """Merge duplicates, fold tombstoned versions, and atomically rewrite the file.
+
+        Returns None when the user has no file. A rewrite also drops
+        malformed lines, which readers already skip. The scan and rewrite run
+        under the user's file lock only; readers keep using the cache until
+        the new file is in place and the entry is invalidated.
+        """
+        user_key = self._user_key(user_id)
+        path = self._user_path(user_id)
+        with self._file_lock(user_key):
+            stat_key = _stat_key(path)
+            if stat_key is None:
+                return None
+            records, stale = self._scan_all(path, user_id)
+            result = compact_records(records)
+            bytes_before = stat_key[1]
+            bytes_after = bytes_before
+            if result.merged or stale:
+                bytes_after = self._rewrite(path, user_id, result.records)
+                with self._cache_lock:
+                    replaced = self._cache.pop(user_key, None)
+                    if replaced is not None:
+                        replaced.vectors = None
+                self._retain_vectors(path, [str(record["id"]) for record in result.records])
+            with self._cache_lock:
+                self._compacted_sizes[user_key] = bytes_after
+                self._retention_tombstones.pop(user_key, None)
+            return CompactionReport(
+                len(records),
+                len(result.records),
+                bytes_before,
+                bytes_after,
+                folded_lines=stale,
+            )
+
+    def maybe_compact(self, user_id: str) -> Optional[CompactionReport]:
+        """Run `compact` if the user's file crossed a size, duplicate or tombstone threshold."""
+        user_key = self._user_key(user_id)
         path = self._user_path(user_id)
-        if not path.exists():
-            return False
+        with self._cache_lock:
+            stat_key = _stat_key(path)
+            if stat_key is None:
+                return None
+            size = stat_key[1]
+            last_size = self._compacted_sizes.get(user_key)
+            grown = size >= COMPACT_SIZE_BYTES and (
+                last_size is None or size >= last_size * COMPACT_GROWTH_RATIO
+            )
+            entry = self._cache.get(user_key)
+            duplicated = (
+                entry is not None
+                and entry.stat_key == stat_key
+                and entry.records is not None
+                and len(entry.records) >= COMPACT_MIN_RECORDS
+                and entry.stale >= len(entry.records) * COMPACT_DUPLICATE_RATIO
+            )
+            tombstones, live = self._retention_tombstones.get(user_key, (0, 0))
+            expired = tombstones > 0 and tombstones >= live * COMPACT_TOMBSTONE_RATIO
+            if not (grown or duplicated or expired):
+                return None
+        return self.compact(user_id)
+
+    def _rewrite(self, path: Path, user_id: str, records: List[Dict[str, Any]]) -> int:
+        # Write a sibling temp file, fsync it, then rename over the original so
+        # readers only ever see the old or the new file in full.
+        payload = "".join(f"{json.dumps(record, ensure_ascii=True)}\n" for record in records)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}.", suffix=".tmp")
         try:
-            path.unlink()
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                handle.write(payload)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp_name, path)
         except OSError as exc:
+            Path(tmp_name).unlink(missing_ok=True)
             raise LongTermMemoryStoreError(
-                f"failed clearing long-term memory for user '{user_id}': {exc}"
+                f"failed compacting long-term memory for user '{user_id}': {exc}"
             ) from exc
+        return path.stat().st_size
+
+    def _retain_vectors(self, path: Path, ids: List[str]) -> None:
+        # Kept records keep their ids, so their embeddings stay valid; without
+        # an embedder to open the sidecar, drop it and let it resync later.
+        if self.embedder is None:
+            for suffix in VECTOR_SUFFIXES:
+                path.with_suffix(suffix).unlink(missing_ok=True)
+            return
+        if not path.with_suffix(".vec.json").exists():
+            return
+        try:
+            VectorIndex(path, self.embedder).retain(ids)
+        except (OSError, VectorIndexError) as exc:
+            print(f"Long-term memory warning: rebuilding vector index after compaction: {exc}")
+            for suffix in VECTOR_SUFFIXES:
+                path.with_suffix(suffix).unlink(missing_ok=True)
+
+    def clear(self, user_id: str) -> bool:
+        user_key = self._user_key(user_id)
+        path = self._user_path(user_id)
+        with self._file_lock(user_key):
+            with self._cache_lock:
+                self._cache.pop(user_key, None)
+                self._compacted_sizes.pop(user_key, None)
+                self._retention_tombstones.pop(user_key, None)
+            if not path.exists():
+                return False
+            try:
+                path.unlink()
+                for suffix in VECTOR_SUFFIXES:
+                    path.with_suffix(suffix).unlink(missing_ok=True)
+            except OSError as exc:
+                raise LongTermMemoryStoreError(
+                    f"failed clearing long-term memory for user '{user_id}': {exc}"
+                ) from exc
         return True
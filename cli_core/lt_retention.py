@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+DEFAULT_SWEEP_INTERVAL_S = 60.0
+SWEEPER_CLOSE_TIMEOUT_S = 5.0
+# At most this many records are deleted per user per sweep; the rest wait for
+# the next pass, so one oversized user cannot hold its write lock for long.
+RETENTION_SWEEP_BATCH = 500
+
+_DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*$", re.IGNORECASE)
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(text: str) -> float:
+    """Parse `90`, `45s`, `30m`, `12h`, `7d` or `2w` into seconds."""
+    match = _DURATION_RE.match(text)
+    if match is None:
+        raise ValueError(f"invalid duration {text!r}; use e.g. 3600, 30m, 12h, 7d or 2w")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2).lower()]
+
+
+def parse_kind_ttls(text: str) -> Dict[str, float]:
+    """Parse `episodic=7d,semantic=365d` into `{kind: seconds}`."""
+    ttls: Dict[str, float] = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        kind, sep, duration = item.partition("=")
+        if not sep or not kind.strip():
+            raise ValueError(f"invalid kind TTL {item.strip()!r}; use kind=duration")
+        ttls[kind.strip()] = parse_duration(duration)
+    return ttls
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Per-user bounds on LT memory; `None` leaves a bound unset.
+
+    A record's age is measured from its `updated_at`, so refreshing a fact
+    through an upsert restarts its clock. `kind_ttls_s` overrides
+    `max_age_s` for the kinds it names.
+    """
+
+    max_records: Optional[int] = None
+    max_bytes: Optional[int] = None
+    max_age_s: Optional[float] = None
+    kind_ttls_s: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(
+            self.max_records is not None
+            or self.max_bytes is not None
+            or self.max_age_s is not None
+            or self.kind_ttls_s
+        )
+
+    def ttl_for(self, kind: str) -> Optional[float]:
+        return self.kind_ttls_s.get(kind, self.max_age_s)
+
+
+@dataclass
+class RetentionResult:
+    expired_ids: List[str]
+    aged_out: int
+    evicted: int
+
+
+def select_expired(
+    records: Sequence[Dict[str, Any]],
+    policy: RetentionPolicy,
+    now: datetime,
+) -> RetentionResult:
+    """Pick the ids `policy` removes from `records` (oldest-first, live only).
+
+    Records past their TTL go first. If the survivors still exceed
+    `max_records` or `max_bytes` (measured as their JSONL line sizes), the
+    least recently updated ones are evicted until both bounds hold.
+    Records with an unparseable `updated_at` never age out.
+    """
+    expired: List[str] = []
+    survivors = []
+    for position, record in enumerate(records):
+        ttl = policy.ttl_for(str(record.get("kind", "")))
+        updated = _parse_timestamp(record.get("updated_at"))
+        if ttl is not None and updated is not None and (now - updated).total_seconds() > ttl:
+            expired.append(str(record["id"]))
+        else:
+            survivors.append((str(record.get("updated_at", "")), position, record))
+    aged_out = len(expired)
+
+    if policy.max_records is not None or policy.max_bytes is not None:
+        survivors.sort(key=lambda item: (item[0], item[1]))
+        sizes = [
+            len(json.dumps(record, ensure_ascii=True)) + 1 for _updated, _pos, record in survivors
+        ]
+        count = len(survivors)
+        total = sum(sizes)
+        for (_updated, _position, record), size in zip(survivors, sizes):
+            over_count = policy.max_records is not None and count > policy.max_records
+            over_bytes = policy.max_bytes is not None and total > policy.max_bytes
+            if not (over_count or over_bytes):
+                break
+            expired.append(str(record["id"]))
+            count -= 1
+            total -= size
+    return RetentionResult(expired, aged_out, len(expired) - aged_out)
+
+
+class RetentionSweeper:
+    """Background thread enforcing a store's retention policy, one user per tick.
+
+    Every `interval_s` it picks the next user file in round-robin order and
+    calls `store.enforce_retention`, then `store.maybe_compact`, which
+    reclaims the deleted lines once enough tombstones have piled up, so
+    expired records are dropped and their lines reclaimed off the turn path.
+    Failures are kept and returned by `take_error()`.
+    """
+
+    def __init__(self, store: Any, interval_s: float = DEFAULT_SWEEP_INTERVAL_S) -> None:
+        self.store = store
+        self.interval_s = max(0.01, interval_s)
+        self._queue: List[str] = []
+        self._errors: List[Exception] = []
+        self._counts = {"sweeps": 0, "aged_out": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lt-retention", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.sweep_once()
+
+    def sweep_once(self) -> Optional[str]:
+        """Sweep the next user; returns the user id swept, if any."""
+        with self._lock:
+            if not self._queue:
+                try:
+                    self._queue = list(self.store.iter_user_ids())
+                except Exception as exc:  # noqa: BLE001
+                    self._errors.append(exc)
+                    return None
+                if not self._queue:
+                    return None
+            user_id = self._queue.pop(0)
+        try:
+            result = self.store.enforce_retention(user_id)
+            # Deletions only append tombstones; the store folds them once
+            # they pass its threshold rather than rewriting after every batch.
+            self.store.maybe_compact(user_id)
+        except Exception as exc:  # noqa: BLE001
+            self._record_error(exc)
+            return user_id
+        with self._lock:
+            self._counts["sweeps"] += 1
+            if result is not None:
+                self._counts["aged_out"] += result.aged_out
+                self._counts["evicted"] += result.evicted
+        return user_id
+
+    def _record_error(self, exc: Exception) -> None:
+        with self._lock:
+            self._errors.append(exc)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def take_error(self) -> Optional[Exception]:
+        with self._lock:
+            if not self._errors:
+                return None
+            errors, self._errors = self._errors, []
+        return errors[-1]
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=SWEEPER_CLOSE_TIMEOUT_S)
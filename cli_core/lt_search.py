@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import heapq
+import math
+import re
+from itertools import islice
+from typing import Dict, List, Tuple
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Once an index holds COMMON_TERM_MIN_DOCS documents, terms present in more
+# than COMMON_TERM_RATIO of them carry almost no signal and are ignored; a
+# query made only of such terms has no lexical match. Smaller indexes keep
+# every term, so a lone record still matches its own words.
+COMMON_TERM_RATIO = 0.5
+COMMON_TERM_MIN_DOCS = 50
+# Only the newest postings of each term are scored. Older records sharing a
+# very frequent term rarely win on BM25 anyway, and this bounds query cost.
+POSTINGS_SCAN_LIMIT = 512
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+STOPWORDS = frozenset(
+    """
+    a about after all also am an and any are as at be been before but by can could
+    did do does doing for from had has have having he her here hers him his how i
+    if in into is it its itself just me my myself no nor not now of off on once only
+    or other our ours out over own same she should so some such than that the their
+    them then there these they this those through to too under until up very was we
+    were what when where which while who whom why will with would you your yours
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token
+        for token in _TOKEN_RE.findall(text.casefold())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+class Bm25Index:
+    """Incrementally maintained inverted index with BM25 scoring.
+
+    Documents are identified by their insertion position, so a larger id
+    means a more recent record; ties in score are broken by recency. Posting
+    dicts keep insertion order, which lets queries scan newest postings first.
+    """
+
+    def __init__(self) -> None:
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: int, text: str) -> None:
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        self.doc_lengths[doc_id] = len(tokens)
+        self.doc_terms[doc_id] = tuple(dict.fromkeys(tokens))
+        self.total_length += len(tokens)
+        for token in tokens:
+            postings = self.postings.setdefault(token, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+
+    def remove(self, doc_id: int) -> None:
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for token in self.doc_terms.pop(doc_id, ()):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[token]
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Return up to `k` `(doc_id, score)` pairs, best (then newest) first."""
+        doc_count = len(self.doc_lengths)
+        if k <= 0 or doc_count == 0:
+            return []
+        terms = [
+            (term, self.postings[term])
+            for term in dict.fromkeys(tokenize(query))
+            if term in self.postings
+        ]
+        if doc_count >= COMMON_TERM_MIN_DOCS:
+            terms = [item for item in terms if len(item[1]) <= doc_count * COMMON_TERM_RATIO]
+        if not terms:
+            return []
+
+        avg_length = self.total_length / doc_count or 1.0
+        norm_base = BM25_K1 * (1 - BM25_B)
+        norm_scale = BM25_K1 * BM25_B / avg_length
+        lengths = self.doc_lengths
+        scores: Dict[int, float] = {}
+        for _term, postings in terms:
+            df = len(postings)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            weight = idf * (BM25_K1 + 1)
+            for doc_id, tf in islice(reversed(postings.items()), POSTINGS_SCAN_LIMIT):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * tf / (
+                    tf + norm_base + norm_scale * lengths[doc_id]
+                )
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], item[0]))
+        return best
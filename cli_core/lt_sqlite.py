@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .lt_compaction import content_key
+from .lt_memory import JsonlLongTermMemoryStore, LongTermMemoryStoreError
+from .lt_search import tokenize
+
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 64
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS lt_records (
+        rowid INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        user_key TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        content TEXT NOT NULL,
+        content_key TEXT NOT NULL,
+        subject_key TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        record_json TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS lt_records_user_updated
+    ON lt_records (user_key, updated_at)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS lt_records_user_content
+    ON lt_records (user_key, content_key)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS lt_records_user_subject
+    ON lt_records (user_key, subject_key)
+    WHERE subject_key IS NOT NULL
+    """,
+    # External-content FTS5 index; `user_key` is indexed too so a MATCH on it
+    # confines every search to one user's postings.
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS lt_fts USING fts5(
+        user_key,
+        content,
+        content='lt_records',
+        content_rowid='rowid',
+        tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lt_records_ai AFTER INSERT ON lt_records BEGIN
+        INSERT INTO lt_fts (rowid, user_key, content)
+        VALUES (new.rowid, new.user_key, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lt_records_ad AFTER DELETE ON lt_records BEGIN
+        INSERT INTO lt_fts (lt_fts, rowid, user_key, content)
+        VALUES ('delete', old.rowid, old.user_key, old.content);
+    END
+    """,
+    # Replaced by `lt_records_au2`, which also fires when a re-imported id
+    # moves to another user.
+    "DROP TRIGGER IF EXISTS lt_records_au",
+    """
+    CREATE TRIGGER IF NOT EXISTS lt_records_au2
+    AFTER UPDATE OF user_key, content ON lt_records BEGIN
+        INSERT INTO lt_fts (lt_fts, rowid, user_key, content)
+        VALUES ('delete', old.rowid, old.user_key, old.content);
+        INSERT INTO lt_fts (rowid, user_key, content)
+        VALUES (new.rowid, new.user_key, new.content);
+    END
+    """,
+)
+
+_UPSERT_SQL = """
+    INSERT INTO lt_records (
+        id, user_key, kind, content, content_key, subject_key,
+        created_at, updated_at, record_json
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        user_key = excluded.user_key,
+        kind = excluded.kind,
+        content = excluded.content,
+        content_key = excluded.content_key,
+        subject_key = excluded.subject_key,
+        updated_at = excluded.updated_at,
+        record_json = excluded.record_json
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class SqliteLongTermMemoryStore:
+    """Long-term memory in one SQLite database, partitioned by user.
+
+    Same interface as `JsonlLongTermMemoryStore` (`load_recent`, `append`,
+    `upsert`, `search`, `clear`). Records keep their JSONL shape in
+    `record_json`; `(user_key, updated_at)` serves recency reads and an FTS5
+    index serves `search`. WAL mode plus a busy timeout lets several CLI
+    processes share the file.
+    """
+
+    def __init__(self, db_path: Path) -> None:
+        self.path = db_path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            with self._connect() as conn:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+        except sqlite3.Error as exc:
+            raise LongTermMemoryStoreError(
+                f"failed initializing long-term memory database at {self.path}: {exc}"
+            ) from exc
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        return conn
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._open()
+            with self._conn:
+                yield self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+    def _user_key(self, user_id: str) -> str:
+        raw = str(user_id)
+        if not raw.strip():
+            raise LongTermMemoryStoreError("invalid user_id for long-term memory")
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _error(self, action: str, user_id: str, exc: Exception) -> LongTermMemoryStoreError:
+        return LongTermMemoryStoreError(
+            f"failed {action} long-term memory for user '{user_id}': {exc}"
+        )
+
+    def load_recent(self, user_id: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Return the `k` most recently updated records, newest first."""
+        if k <= 0:
+            return []
+        user_key = self._user_key(user_id)
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT record_json FROM lt_records
+                    WHERE user_key = ?
+                    ORDER BY updated_at DESC, rowid DESC
+                    LIMIT ?
+                    """,
+                    (user_key, k),
+                ).fetchall()
+        except sqlite3.Error as exc:
+            raise self._error("reading", user_id, exc) from exc
+        return [json.loads(row[0]) for row in rows]
+
+    def search(self, user_id: str, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Return up to `k` records ranked by FTS5 BM25, newer first on ties."""
+        terms = tokenize(query)
+        if k <= 0 or not terms:
+            return []
+        user_key = self._user_key(user_id)
+        # Tokens are plain word characters, so quoting each one is safe.
+        quoted = " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+        match = f'user_key:"{user_key}" AND content:({quoted})'
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT r.record_json FROM lt_fts
+                    JOIN lt_records AS r ON r.rowid = lt_fts.rowid
+                    WHERE lt_fts MATCH ?
+                    ORDER BY bm25(lt_fts, 0.0, 1.0), r.updated_at DESC, r.rowid DESC
+                    LIMIT ?
+                    """,
+                    (match, k),
+                ).fetchall()
+        except sqlite3.Error as exc:
+            raise self._error("searching", user_id, exc) from exc
+        return [json.loads(row[0]) for row in rows]
+
+    def _write(self, conn: sqlite3.Connection, user_key: str, record: Dict[str, Any]) -> None:
+        kind = str(record.get("kind", ""))
+        subject = record.get("subject")
+        conn.execute(
+            _UPSERT_SQL,
+            (
+                str(record["id"]),
+                user_key,
+                kind,
+                str(record.get("content", "")),
+                content_key(kind, str(record.get("content", ""))),
+                content_key(kind, str(subject)) if subject else None,
+                str(record.get("created_at", "")),
+                str(record.get("updated_at", "")),
+                json.dumps(record, ensure_ascii=True),
+            ),
+        )
+
+    def append(
+        self,
+        user_id: str,
+        content: str,
+        kind: str = "semantic",
+        confidence: Optional[float] = None,
+        source_turn_id: Optional[str] = None,
+        subject: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        now = _now()
+        record: Dict[str, Any] = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "content": content,
+            "kind": kind,
+            "created_at": now,
+            "updated_at": now,
+        }
+        if confidence is not None:
+            record["confidence"] = confidence
+        if source_turn_id:
+            record["source_turn_id"] = source_turn_id
+        if subject:
+            record["subject"] = subject
+        user_key = self._user_key(user_id)
+        try:
+            with self._connect() as conn:
+                self._write(conn, user_key, record)
+        except sqlite3.Error as exc:
+            raise self._error("writing", user_id, exc) from exc
+        return record
+
+    def upsert(
+        self,
+        user_id: str,
+        content: str,
+        kind: str = "semantic",
+        confidence: Optional[float] = None,
+        source_turn_id: Optional[str] = None,
+        subject: Optional[str] = None,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Same matching rules as `JsonlLongTermMemoryStore.upsert`, in one transaction."""
+        user_key = self._user_key(user_id)
+        try:
+            with self._connect() as conn:
+                # Take the write lock before the lookup so concurrent upserts
+                # from other processes cannot both miss and insert twice.
+                conn.execute("BEGIN IMMEDIATE")
+                row = None
+                if subject:
+                    row = conn.execute(
+                        """
+                        SELECT record_json FROM lt_records
+                        WHERE user_key = ? AND subject_key = ?
+                        ORDER BY updated_at DESC LIMIT 1
+                        """,
+                        (user_key, content_key(kind, subject)),
+                    ).fetchone()
+                if row is None:
+                    row = conn.execute(
+                        """
+                        SELECT record_json FROM lt_records
+                        WHERE user_key = ? AND content_key = ?
+                        ORDER BY updated_at DESC LIMIT 1
+                        """,
+                        (user_key, content_key(kind, content)),
+                    ).fetchone()
+                if row is None:
+                    record: Dict[str, Any] = {
+                        "id": str(uuid.uuid4()),
+                        "user_id": user_id,
+                        "content": content,
+                        "kind": kind,
+                        "created_at": _now(),
+                    }
+                    record["updated_at"] = record["created_at"]
+                else:
+                    record = {**json.loads(row[0]), "content": content, "updated_at": _now()}
+                if confidence is not None:
+                    record["confidence"] = confidence
+                if source_turn_id:
+                    record["source_turn_id"] = source_turn_id
+                if subject:
+                    record["subject"] = subject
+                self._write(conn, user_key, record)
+        except sqlite3.Error as exc:
+            raise self._error("writing", user_id, exc) from exc
+        return record, row is not None
+
+    def clear(self, user_id: str) -> bool:
+        user_key = self._user_key(user_id)
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute("DELETE FROM lt_records WHERE user_key = ?", (user_key,))
+        except sqlite3.Error as exc:
+            raise self._error("clearing", user_id, exc) from exc
+        return cursor.rowcount > 0
+
+    def iter_all_records(self) -> Iterator[Dict[str, Any]]:
+        """Yield every user's records, oldest update first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT record_json FROM lt_records ORDER BY user_key, updated_at, rowid"
+            ).fetchall()
+        for row in rows:
+            yield json.loads(row[0])
+
+    def import_records(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Insert records as-is, replacing any existing record with the same id.
+
+        The id is global: a record imported under another user moves to that
+        user. Nothing is written if any record lacks a required field.
+        """
+        records = list(records)
+        for record in records:
+            missing = (
+                JsonlLongTermMemoryStore.REQUIRED_FIELDS - record.keys()
+                if isinstance(record, dict)
+                else JsonlLongTermMemoryStore.REQUIRED_FIELDS
+            )
+            if missing:
+                raise LongTermMemoryStoreError(
+                    "cannot import long-term memory record "
+                    f"{record.get('id') if isinstance(record, dict) else record!r}: "
+                    f"missing {', '.join(sorted(missing))}"
+                )
+        count = 0
+        with self._connect() as conn:
+            for record in records:
+                self._write(conn, self._user_key(str(record["user_id"])), record)
+                count += 1
+        return count
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Protocol, Sequence, Tuple
+
+from .lt_search import tokenize
+
+try:
+    import numpy as np
+except ModuleNotFoundError:  # optional dependency
+    np = None
+
+DEFAULT_EMBEDDER = "hashing"
+HASHING_DIM = 384
+SENTENCE_TRANSFORMERS_PREFIX = "sentence-transformers:"
+
+
+class VectorIndexError(RuntimeError):
+    pass
+
+
+def _require_numpy() -> Any:
+    if np is None:
+        raise VectorIndexError(
+            "semantic LT retrieval requires numpy; install it with `pip install numpy`"
+        )
+    return np
+
+
+class Embedder(Protocol):
+    name: str
+    dim: int
+
+    def embed(self, texts: Sequence[str]) -> Any:
+        """Return a `(len(texts), dim)` float32 array of L2-normalized rows."""
+        ...
+
+
+class HashingEmbedder:
+    """Deterministic, offline embedder: signed feature hashing of words and bigrams."""
+
+    def __init__(self, dim: int = HASHING_DIM) -> None:
+        _require_numpy()
+        self.dim = dim
+        self.name = f"hashing-v1-{dim}"
+
+    def _features(self, text: str) -> Iterable[str]:
+        tokens = tokenize(text)
+        yield from tokens
+        for left, right in zip(tokens, tokens[1:]):
+            yield f"{left} {right}"
+
+    def embed(self, texts: Sequence[str]) -> Any:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                matrix[row, value % self.dim] += 1.0 if (value >> 63) else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU embedder backed by an installed sentence-transformers model."""
+
+    def __init__(self, model_name: str) -> None:
+        _require_numpy()
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ModuleNotFoundError as exc:
+            raise VectorIndexError(
+                "embedder "
+                f"'{SENTENCE_TRANSFORMERS_PREFIX}{model_name}' requires the "
+                "sentence-transformers package"
+            ) from exc
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = int(self.model.get_sentence_embedding_dimension())
+        self.name = f"{SENTENCE_TRANSFORMERS_PREFIX}{model_name}"
+
+    def embed(self, texts: Sequence[str]) -> Any:
+        vectors = self.model.encode(list(texts), normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+
+
+def create_embedder(spec: Optional[str] = None) -> Embedder:
+    value = (spec or DEFAULT_EMBEDDER).strip()
+    if value == DEFAULT_EMBEDDER:
+        return HashingEmbedder()
+    if value.startswith(SENTENCE_TRANSFORMERS_PREFIX):
+        return SentenceTransformerEmbedder(value[len(SENTENCE_TRANSFORMERS_PREFIX) :])
+    raise VectorIndexError(
+        f"unknown embedder '{value}'; use '{DEFAULT_EMBEDDER}' or "
+        f"'{SENTENCE_TRANSFORMERS_PREFIX}<model>'"
+    )
+
+
+class VectorIndex:
+    """Append-only float32 embedding matrix for one user's LT records.
+
+    Files next to the user's JSONL: `<key>.vec.f32` (raw row-major float32),
+    `<key>.vec.ids` (one record id per row), and `<key>.vec.json` (embedder
+    name and dimension). A later row for the same id supersedes earlier ones.
+    Searches memory-map the matrix, so it is never copied into Python memory.
+    """
+
+    def __init__(self, base_path: Path, embedder: Embedder) -> None:
+        _require_numpy()
+        self.embedder = embedder
+        self.matrix_path = base_path.with_suffix(".vec.f32")
+        self.ids_path = base_path.with_suffix(".vec.ids")
+        self.meta_path = base_path.with_suffix(".vec.json")
+        self.ids: List[str] = []
+        self._latest_mask: Any = None
+        self._open()
+
+    def _open(self) -> None:
+        meta = {"embedder": self.embedder.name, "dim": self.embedder.dim}
+        try:
+            stored = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            stored = None
+        if stored != meta:
+            self.reset()
+            self.meta_path.write_text(json.dumps(meta), encoding="utf-8")
+            return
+        try:
+            ids = self.ids_path.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            ids = []
+        row_bytes = 4 * self.embedder.dim
+        try:
+            size = self.matrix_path.stat().st_size
+        except OSError:
+            size = 0
+        rows = size // row_bytes
+        self.ids = ids[: min(len(ids), rows)]
+        if len(ids) != len(self.ids) or size != len(self.ids) * row_bytes:
+            # A crash between the two appends left them uneven; trim both to
+            # the rows they agree on so later appends stay aligned.
+            with self.matrix_path.open("ab") as handle:
+                handle.truncate(len(self.ids) * row_bytes)
+            self.ids_path.write_text(
+                "".join(f"{record_id}\n" for record_id in self.ids),
+                encoding="utf-8",
+            )
+
+    def fork(self) -> "VectorIndex":
+        """Return a copy over the same files, to append to while this one is searched."""
+        twin = copy.copy(self)
+        twin.ids = list(self.ids)
+        return twin
+
+    def reload(self) -> None:
+        """Re-read the sidecar if another process appended rows since it was opened."""
+        try:
+            size = self.matrix_path.stat().st_size
+        except OSError:
+            size = 0
+        if size != len(self.ids) * 4 * self.embedder.dim:
+            self._latest_mask = None
+            self._open()
+
+    def reset(self) -> None:
+        for path in (self.matrix_path, self.ids_path, self.meta_path):
+            path.unlink(missing_ok=True)
+        self.ids = []
+        self._latest_mask = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, ids: Sequence[str], vectors: Any) -> None:
+        if not ids:
+            return
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        if matrix.shape != (len(ids), self.embedder.dim):
+            raise VectorIndexError(
+                f"embedding shape {matrix.shape} does not match {len(ids)}x{self.embedder.dim}"
+            )
+        with self.matrix_path.open("ab") as handle:
+            handle.write(matrix.tobytes())
+        with self.ids_path.open("a", encoding="utf-8") as handle:
+            handle.write("".join(f"{record_id}\n" for record_id in ids))
+        self.ids.extend(ids)
+        self._latest_mask = None
+
+    def retain(self, keep_ids: Sequence[str]) -> None:
+        """Rewrite the sidecar to the newest row of each id in `keep_ids`, in that order."""
+        latest = {record_id: row for row, record_id in enumerate(self.ids)}
+        ids = [record_id for record_id in keep_ids if record_id in latest]
+        kept = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        if ids:
+            matrix = np.fromfile(
+                self.matrix_path,
+                dtype=np.float32,
+                count=len(self.ids) * self.embedder.dim,
+            ).reshape(len(self.ids), self.embedder.dim)
+            kept = matrix[[latest[record_id] for record_id in ids]]
+        # Drop the meta file first: if we stop between the two renames, the
+        # next open sees no meta and rebuilds instead of pairing stale rows.
+        self.meta_path.unlink(missing_ok=True)
+        for path, data in (
+            (self.matrix_path, kept.tobytes()),
+            (self.ids_path, "".join(f"{record_id}\n" for record_id in ids).encode("utf-8")),
+        ):
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        self.meta_path.write_text(
+            json.dumps({"embedder": self.embedder.name, "dim": self.embedder.dim}),
+            encoding="utf-8",
+        )
+        self.ids = ids
+        self._latest_mask = None
+
+    def _mask(self) -> Any:
+        # Only the newest row per id counts; superseded rows score -inf.
+        if self._latest_mask is None:
+            latest = {record_id: row for row, record_id in enumerate(self.ids)}
+            if len(latest) == len(self.ids):
+                self._latest_mask = False
+            else:
+                mask = np.full(len(self.ids), -np.inf, dtype=np.float32)
+                mask[list(latest.values())] = 0.0
+                self._latest_mask = mask
+        return self._latest_mask
+
+    def search(self, query_vector: Any, k: int) -> List[Tuple[str, float]]:
+        """Return up to `k` `(record_id, cosine)` pairs, best first."""
+        rows = len(self.ids)
+        if k <= 0 or rows == 0:
+            return []
+        matrix = np.memmap(
+            self.matrix_path,
+            dtype=np.float32,
+            mode="r",
+            shape=(rows, self.embedder.dim),
+        )
+        scores = matrix @ np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        mask = self._mask()
+        if mask is not False:
+            scores = scores + mask
+        take = min(k, int(np.isfinite(scores).sum()))
+        if take <= 0:
+            return []
+        top = np.argpartition(-scores, take - 1)[:take]
+        top = top[np.lexsort((-top, -scores[top]))]
+        return [(self.ids[row], float(scores[row])) for row in top]
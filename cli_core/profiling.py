@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+SERVICE_NAME = "mem-cli"
+
+# Top-level phases in the order a turn runs them, for the trace summary.
+TURN_PHASES = (
+    "input",
+    "idle_wait",
+    "before_turn",
+    "prompt_build",
+    "context_window",
+    "step_prompt",
+    "model.stream",
+    "tools",
+    "render",
+    "after_turn",
+)
+
+# Innermost open span; asyncio tasks and `asyncio.to_thread` inherit it, so
+# nested `span` blocks get their parent without passing it around.
+_current_span: ContextVar[Optional["Span"]] = ContextVar("memcli_current_span", default=None)
+
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+@dataclass
+class Span:
+    """One timed phase; times are `perf_counter_ns` values."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end_ns - self.start_ns) / 1_000_000
+
+
+class JsonlSpanExporter:
+    """Appends finished spans to a file, one JSON object per line.
+
+    Records use the OTLP span field names (`traceId`, `spanId`,
+    `parentSpanId`, `startTimeUnixNano`, ...) with attributes as a flat
+    object, so they load into an OTel collector or a dataframe alike.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        lines = "".join(
+            json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records
+        )
+        with self._lock:
+            with self.path.open("a", encoding="utf-8") as handle:
+                handle.write(lines)
+
+
+class TurnProfiler:
+    """Collects the spans of one turn at a time, kept on `RuntimeContext`.
+
+    `begin_turn` opens a root `turn` span; `span` times a phase under
+    `parent`, the enclosing `span` block, or the root, and is a no-op
+    outside a turn, so instrumented code also runs unprofiled. `end_turn`
+    closes the root, hands the turn's spans to the exporter, if any, and
+    returns them. Spans are recorded from worker threads too; one finished
+    after its turn ended is dropped.
+    """
+
+    def __init__(self, exporter: Optional[JsonlSpanExporter] = None) -> None:
+        self.exporter = exporter
+        self._lock = threading.Lock()
+        self._root: Optional[Span] = None
+        self._spans: List[Span] = []
+        # Maps `perf_counter_ns` readings onto wall-clock time for export.
+        self._wall_offset_ns = time.time_ns() - time.perf_counter_ns()
+
+    @property
+    def active(self) -> bool:
+        return self._root is not None
+
+    def begin_turn(self, start_ns: Optional[int] = None, **attributes: Any) -> Span:
+        root = Span(
+            name="turn",
+            trace_id=_new_id(16),
+            span_id=_new_id(8),
+            parent_id=None,
+            start_ns=time.perf_counter_ns() if start_ns is None else start_ns,
+            attributes=dict(attributes),
+        )
+        with self._lock:
+            self._root = root
+            self._spans = []
+        return root
+
+    def _parent_id(self, root: Span, parent: Optional[Span]) -> str:
+        if parent is None:
+            current = _current_span.get()
+            if current is not None and current.trace_id == root.trace_id:
+                parent = current
+        return (parent or root).span_id
+
+    def record(
+        self,
+        name: str,
+        start_ns: int,
+        end_ns: Optional[int] = None,
+        parent: Optional[Span] = None,
+        **attributes: Any,
+    ) -> Optional[Span]:
+        """Add an already-timed span; returns it, or `None` outside a turn."""
+        root = self._root
+        if root is None:
+            return None
+        span = Span(
+            name=name,
+            trace_id=root.trace_id,
+            span_id=_new_id(8),
+            parent_id=self._parent_id(root, parent),
+            start_ns=start_ns,
+            end_ns=time.perf_counter_ns() if end_ns is None else end_ns,
+            attributes=dict(attributes),
+        )
+        with self._lock:
+            if self._root is not root:
+                return None
+            self._spans.append(span)
+        return span
+
+    @contextmanager
+    def span(
+        self, name: str, parent: Optional[Span] = None, **attributes: Any
+    ) -> Iterator[Optional[Span]]:
+        """Time the enclosed block; yields the span so callers can add attributes."""
+        root = self._root
+        if root is None:
+            yield None
+            return
+        span = Span(
+            name=name,
+            trace_id=root.trace_id,
+            span_id=_new_id(8),
+            parent_id=self._parent_id(root, parent),
+            start_ns=time.perf_counter_ns(),
+            attributes=dict(attributes),
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.attributes.setdefault("error", type(exc).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.perf_counter_ns()
+            with self._lock:
+                if self._root is root:
+                    self._spans.append(span)
+
+    def end_turn(self, **attributes: Any) -> List[Span]:
+        with self._lock:
+            root, self._root = self._root, None
+            spans, self._spans = self._spans, []
+        if root is None:
+            return []
+        root.end_ns = time.perf_counter_ns()
+        root.attributes.update(attributes)
+        spans = [root, *spans]
+        if self.exporter is not None:
+            self.exporter.export([self.to_record(span) for span in spans])
+        return spans
+
+    def to_record(self, span: Span) -> Dict[str, Any]:
+        end_ns = span.end_ns if span.end_ns is not None else span.start_ns
+        return {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "startTimeUnixNano": span.start_ns + self._wall_offset_ns,
+            "endTimeUnixNano": end_ns + self._wall_offset_ns,
+            "durationMs": round((end_ns - span.start_ns) / 1_000_000, 3),
+            "attributes": span.attributes,
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+def phase_totals(spans: List[Span]) -> Dict[str, float]:
+    """Milliseconds per top-level phase of a turn, in `TURN_PHASES` order."""
+    if not spans:
+        return {}
+    root_id = spans[0].span_id
+    totals: Dict[str, float] = {}
+    for span in spans[1:]:
+        if span.parent_id == root_id:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+    order = {name: index for index, name in enumerate(TURN_PHASES)}
+    return dict(sorted(totals.items(), key=lambda item: order.get(item[0], len(order))))
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import importlib.util
+from typing import AsyncIterator, Iterator, Optional
+
+import httpx
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+# One CLI session issues one request at a time (plus the odd summary call),
+# so a small pool is plenty; idle connections are kept well past a typical
+# think-and-type pause so the next turn skips DNS/TCP/TLS setup.
+HTTP_MAX_CONNECTIONS = 8
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 4
+HTTP_KEEPALIVE_EXPIRY_S = 300.0
+HTTP_CONNECT_TIMEOUT_S = 10.0
+# Default bounds for any request that does not set its own timeout, so no
+# call on the shared clients can hang forever. Reads allow long gaps between
+# streamed chunks (slow reasoning steps); the turn's idle timeout is tighter.
+HTTP_READ_TIMEOUT_S = 300.0
+HTTP_WRITE_TIMEOUT_S = 60.0
+HTTP_POOL_TIMEOUT_S = 30.0
+# A closed response is read to its end, up to this many bytes, so its
+# connection can go back to the pool instead of being dropped.
+DRAIN_MAX_BYTES = 64 * 1024
+
+
+def h2_available() -> bool:
+    # HTTP/2 needs the optional `h2` package (`pip install httpx[http2]`).
+    return importlib.util.find_spec("h2") is not None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_S,
+    )
+
+
+# The OpenAI SDK sets its own per-request timeout; these apply to the rest.
+_TIMEOUT = httpx.Timeout(
+    connect=HTTP_CONNECT_TIMEOUT_S,
+    read=HTTP_READ_TIMEOUT_S,
+    write=HTTP_WRITE_TIMEOUT_S,
+    pool=HTTP_POOL_TIMEOUT_S,
+)
+
+
+class _DrainingByteStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream) -> None:
+        self._stream = stream
+        self._iterator: Optional[Iterator[bytes]] = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        self._iterator = iter(self._stream)
+        yield from self._iterator
+
+    def close(self) -> None:
+        try:
+            drained = 0
+            for chunk in self._iterator or ():
+                drained += len(chunk)
+                if drained > DRAIN_MAX_BYTES:
+                    break
+        except Exception:  # noqa: BLE001
+            pass
+        finally:
+            self._stream.close()
+
+
+class _AsyncDrainingByteStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream) -> None:
+        self._stream = stream
+        self._iterator: Optional[AsyncIterator[bytes]] = None
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        self._iterator = self._stream.__aiter__()
+        async for chunk in self._iterator:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            drained = 0
+            if self._iterator is not None:
+                async for chunk in self._iterator:
+                    drained += len(chunk)
+                    if drained > DRAIN_MAX_BYTES:
+                        break
+        except Exception:  # noqa: BLE001
+            pass
+        finally:
+            await self._stream.aclose()
+
+
+class DrainingTransport(httpx.HTTPTransport):
+    """Pooled transport that finishes reading a response before closing it.
+
+    The OpenAI SDK closes a streamed response as soon as it sees `[DONE]`,
+    before the body's terminating chunk, which makes httpx discard the
+    connection; draining that tail keeps it reusable.
+    """
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = super().handle_request(request)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_DrainingByteStream(response.stream),  # type: ignore[arg-type]
+            extensions=response.extensions,
+        )
+
+
+class AsyncDrainingTransport(httpx.AsyncHTTPTransport):
+    """Async `DrainingTransport`."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await super().handle_async_request(request)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_AsyncDrainingByteStream(response.stream),  # type: ignore[arg-type]
+            extensions=response.extensions,
+        )
+
+
+def build_http_client(http2: bool) -> httpx.Client:
+    return DefaultHttpxClient(
+        transport=DrainingTransport(http2=http2, limits=_limits()),
+        timeout=_TIMEOUT,
+    )
+
+
+def build_async_http_client(http2: bool) -> httpx.AsyncClient:
+    return DefaultAsyncHttpxClient(
+        transport=AsyncDrainingTransport(http2=http2, limits=_limits()),
+        timeout=_TIMEOUT,
+    )
@@ -1,36 +1,64 @@
 from __future__ import annotations
 
-from typing import Any, List
+import os
+from typing import Any, List, Optional
 
+import httpx
 from langchain_openai import ChatOpenAI
 
 from .base import ProviderAdapter, ProviderConfig, require_env
+from .http import build_async_http_client, build_http_client, h2_available
+
+WARMUP_TIMEOUT_S = 10.0
+
+_DISABLED = {"disabled", "off", "false", "0"}
+_ENABLED = {"enabled", "on", "true", "1"}
+
+
+def _http2_enabled() -> bool:
+    setting = os.environ.get("MOONSHOT_HTTP2", "auto").strip().lower()
+    if setting in _DISABLED:
+        return False
+    return h2_available()
 
 
 class MoonshotAdapter(ProviderAdapter):
     name = "moonshot"
 
     def __init__(self) -> None:
-        thinking_env = __import__("os").environ.get(
-            "MOONSHOT_THINKING", "disabled"
-        ).strip().lower()
+        thinking_env = os.environ.get("MOONSHOT_THINKING", "disabled").strip().lower()
         extra_body = None
-        if thinking_env in {"disabled", "off", "false", "0"}:
+        if thinking_env in _DISABLED:
             extra_body = {"thinking": {"type": "disabled"}}
-        elif thinking_env in {"enabled", "on", "true", "1"}:
+        elif thinking_env in _ENABLED:
             extra_body = {"thinking": {"type": "enabled"}}
 
         self.config = ProviderConfig(
             name="Kimi",
             api_key=require_env("MOONSHOT_API_KEY"),
-            model=(
-                __import__("os").environ.get("MOONSHOT_MODEL", "kimi-k2.5")
-            ),
-            base_url=__import__("os").environ.get(
-                "MOONSHOT_BASE_URL", "https://api.moonshot.ai/v1"
-            ),
+            model=os.environ.get("MOONSHOT_MODEL", "kimi-k2.5"),
+            base_url=os.environ.get("MOONSHOT_BASE_URL", "https://api.moonshot.ai/v1"),
             extra_body=extra_body,
         )
+        self.http2 = _http2_enabled()
+        self.warmup = os.environ.get("MOONSHOT_WARMUP", "").strip().lower() in _ENABLED
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def http_client(self) -> httpx.Client:
+        """Shared sync client; its pool outlives models rebuilt after `/reset`."""
+        if self._http_client is None:
+            self._http_client = build_http_client(self.http2)
+        return self._http_client
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        # Async connections belong to the event loop that opened them; `aclose`
+        # drops the client so the next loop starts a fresh one.
+        if self._http_async_client is None:
+            self._http_async_client = build_async_http_client(self.http2)
+        return self._http_async_client
 
     def build_model(self) -> Any:
         return ChatOpenAI(
@@ -38,7 +66,11 @@ class MoonshotAdapter(ProviderAdapter):
             api_key=self.config.api_key,
             base_url=self.config.base_url,
             streaming=True,
+            # Usage (including cached prompt tokens) arrives on the final chunk.
+            stream_usage=True,
             extra_body=self.config.extra_body,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
         )
 
     def bind_tools(self, model: Any, tools: List[Any]) -> Any:
@@ -46,3 +78,43 @@ class MoonshotAdapter(ProviderAdapter):
 
     def system_label(self) -> str:
         return self.config.name
+
+    def _warmup_request(self) -> tuple[str, dict[str, str]]:
+        url = f"{str(self.config.base_url).rstrip('/')}/models"
+        return url, {"Authorization": f"Bearer {self.config.api_key}"}
+
+    def warm_up(self) -> bool:
+        """Open a pooled sync connection ahead of the first request (`MOONSHOT_WARMUP=1`).
+
+        Best effort: returns whether the request completed, whatever its status.
+        """
+        if not self.warmup:
+            return False
+        url, headers = self._warmup_request()
+        try:
+            self.http_client.get(url, headers=headers, timeout=WARMUP_TIMEOUT_S)
+        except httpx.HTTPError:
+            return False
+        return True
+
+    async def awarm_up(self) -> bool:
+        """Async `warm_up` for the client used by streamed turns."""
+        if not self.warmup:
+            return False
+        url, headers = self._warmup_request()
+        try:
+            await self.http_async_client.get(url, headers=headers, timeout=WARMUP_TIMEOUT_S)
+        except httpx.HTTPError:
+            return False
+        return True
+
+    def close(self) -> None:
+        client, self._http_client = self._http_client, None
+        if client is not None:
+            client.close()
+
+    async def aclose(self) -> None:
+        self.close()
+        client, self._http_async_client = self._http_async_client, None
+        if client is not None:
+            await client.aclose()
@@ -1,12 +1,11 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import sys
 import textwrap
-import threading
-import time
 from dataclasses import dataclass
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, TextIO
 
 from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
 
@@ -20,10 +19,13 @@ class RendererConfig:
     indent: str = "  "
 
 
-def render_header(label: str) -> None:
+def _header_line(label: str) -> str:
     rule = chr(0x2500) * 4
-    line = f"{rule} {label} {rule}"
-    print(f"\n{line}")
+    return f"{rule} {label} {rule}"
+
+
+def render_header(label: str) -> None:
+    print(f"\n{_header_line(label)}")
 
 
 def wrap_paragraphs(text: str, width: int, indent: str) -> str:
@@ -77,12 +79,105 @@ def message_to_dict(message: BaseMessage) -> Dict[str, Any]:
     return data
 
 
-def pretty_print_assistant(messages: List[BaseMessage], config: RendererConfig) -> None:
+def chunk_text(content: Any) -> str:
+    """Text carried by a message or chunk `content` (a string or a list of parts)."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            str(part.get("text", ""))
+            for part in content
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+    return ""
+
+
+class StreamingRenderer:
+    """Prints assistant text as it streams in, word-wrapped like `wrap_paragraphs`.
+
+    Each word is written once it is complete, so a line never has to be
+    redrawn; newlines in the text end the line. The header is printed with the
+    first word, leading and trailing blank lines are dropped, and every model
+    message after the first starts a new paragraph.
+    """
+
+    def __init__(self, config: RendererConfig, out: Optional[TextIO] = None) -> None:
+        self.config = config
+        self.out = out
+        self.started = False
+        self._word: List[str] = []
+        self._column = 0
+        self._pending_newlines = 0
+
+    def _write(self, text: str) -> None:
+        if not text:
+            return
+        out = self.out or sys.stdout
+        out.write(text)
+        out.flush()
+
+    def begin_message(self) -> None:
+        if self.started:
+            self._write(self._flush_word())
+            self._pending_newlines = max(self._pending_newlines, 2)
+
+    def feed(self, text: str) -> None:
+        pieces: List[str] = []
+        for char in text:
+            if char == "\n":
+                pieces.append(self._flush_word())
+                if self.started:
+                    self._pending_newlines += 1
+            elif char.isspace():
+                pieces.append(self._flush_word())
+            else:
+                self._word.append(char)
+        self._write("".join(pieces))
+
+    def _flush_word(self) -> str:
+        if not self._word:
+            return ""
+        word = "".join(self._word)
+        self._word.clear()
+        indent = self.config.indent
+        if not self.started:
+            self.started = True
+            prefix = f"\n{_header_line(self.config.assistant_label)}\n{indent}"
+        elif self._pending_newlines or not self._column:
+            prefix = "\n" * self._pending_newlines + indent
+            self._pending_newlines = 0
+        elif self._column + 1 + len(word) > self.config.width:
+            prefix = f"\n{indent}"
+        else:
+            self._column += 1 + len(word)
+            return f" {word}"
+        self._column = len(indent) + len(word)
+        return prefix + word
+
+    def finish(self) -> None:
+        """Flush the last word and end the line; safe to call more than once."""
+        tail = self._flush_word()
+        if self.started and (tail or self._column):
+            tail += "\n"
+        self._column = 0
+        self._pending_newlines = 0
+        self._write(tail)
+
+
+def pretty_print_assistant(
+    messages: List[BaseMessage],
+    config: RendererConfig,
+    include_text: bool = True,
+) -> None:
+    """Print the turn's assistant text and tool output.
+
+    Pass `include_text=False` when a `StreamingRenderer` already printed the text.
+    """
     tool_payloads: List[str] = []
     text_chunks: List[str] = []
     for msg in messages:
         data = message_to_dict(msg)
-        if data.get("type") == "ai":
+        if data.get("type") == "ai" and include_text:
             content = data.get("content")
             if isinstance(content, str) and content.strip():
                 text_chunks.append(content.strip())
@@ -114,20 +209,18 @@ def print_user_block(text: str, config: RendererConfig) -> None:
         print(wrapped)
 
 
-def start_thinking_indicator(stop_event: threading.Event) -> threading.Thread:
-    def thinking_indicator() -> None:
-        dots = 0
-        sys.stdout.write("\rThinking...")
-        sys.stdout.flush()
-        while not stop_event.is_set():
+async def run_thinking_indicator(stop_event: asyncio.Event) -> None:
+    """Animated "Thinking..." line until `stop_event` is set; run it as a task."""
+    dots = 0
+    sys.stdout.write("\rThinking...")
+    sys.stdout.flush()
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=0.35)
+        except asyncio.TimeoutError:
             dots = (dots % 3) + 1
             sys.stdout.write("\rThinking" + "." * dots + "   ")
             sys.stdout.flush()
-            time.sleep(0.35)
-
-    indicator_thread = threading.Thread(target=thinking_indicator, daemon=True)
-    indicator_thread.start()
-    return indicator_thread
 
 
 def clear_line() -> None:
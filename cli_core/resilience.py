@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import random
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+import httpx
+import openai
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF_BASE_S = 0.5
+DEFAULT_BACKOFF_MAX_S = 8.0
+DEFAULT_TURN_DEADLINE_S = 300.0
+DEFAULT_IDLE_TIMEOUT_S = 60.0
+# Hedging needs this many observed TTFTs before its threshold is trusted.
+HEDGE_MIN_SAMPLES = 10
+TTFT_WINDOW = 100
+
+# Request timeout and rate limit; any 5xx is retried as well. Other 4xx,
+# including 409 Conflict, would fail the same way again.
+RETRYABLE_STATUS = frozenset({408, 429})
+
+
+class ModelDeadlineError(TimeoutError):
+    """The turn's total time budget ran out."""
+
+
+class ModelIdleTimeoutError(TimeoutError):
+    """The model stream went quiet for longer than the idle timeout."""
+
+
+@dataclass
+class ResilienceConfig:
+    """Retry, timeout and hedging policy for the model calls of one turn.
+
+    Failures before the first token are retried up to `max_attempts` times
+    in total, with full-jitter exponential backoff, if `is_retryable` says
+    so. `turn_deadline_s` bounds all model calls of a turn together, and
+    `idle_timeout_s` bounds the gap between chunks. With `hedge_percentile`
+    set, a second identical request is sent once the first token is slower
+    than that percentile of recent TTFTs, and the first to produce a token
+    wins.
+    """
+
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    backoff_base_s: float = DEFAULT_BACKOFF_BASE_S
+    backoff_max_s: float = DEFAULT_BACKOFF_MAX_S
+    turn_deadline_s: Optional[float] = DEFAULT_TURN_DEADLINE_S
+    idle_timeout_s: Optional[float] = DEFAULT_IDLE_TIMEOUT_S
+    hedge_percentile: Optional[float] = None
+    hedge_min_samples: int = HEDGE_MIN_SAMPLES
+
+    def backoff_s(self, retry: int, rng: random.Random | None = None) -> float:
+        """Delay before retry number `retry` (0-based)."""
+        cap = min(self.backoff_max_s, self.backoff_base_s * (2**retry))
+        return (rng or random).uniform(0, cap)
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether `exc` is transient: throttling, a 5xx, or a dropped connection."""
+    if isinstance(exc, ModelDeadlineError):
+        return False
+    status = status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS or 500 <= status <= 599
+    return isinstance(
+        exc,
+        (
+            openai.APIConnectionError,
+            httpx.TransportError,
+            ConnectionError,
+            TimeoutError,
+        ),
+    )
+
+
+class TtftWindow:
+    """Recent times to first token, for the hedging threshold."""
+
+    def __init__(self, size: int = TTFT_WINDOW) -> None:
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, ttft_ms: float) -> None:
+        self._samples.append(ttft_ms)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, fraction: float) -> float:
+        ordered = sorted(self._samples)
+        rank = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+        return ordered[rank]
+
+
+@dataclass
+class ResilienceState:
+    """Session-wide TTFT samples and counters, kept on `RuntimeContext`."""
+
+    ttft: TtftWindow = field(default_factory=TtftWindow)
+    counters: Dict[str, int] = field(
+        default_factory=lambda: {
+            "retries": 0,
+            "gave_up": 0,
+            "idle_timeouts": 0,
+            "deadline_exceeded": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+        }
+    )
+
+    def hedge_after_s(self, config: ResilienceConfig) -> Optional[float]:
+        if config.hedge_percentile is None or len(self.ttft) < config.hedge_min_samples:
+            return None
+        return self.ttft.percentile(config.hedge_percentile) / 1000
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
+
+BUSY_TIMEOUT_MS = 5000
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_S = 86400.0
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        message_json TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    )
+"""
+_LRU_INDEX = "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+
+
+class ResponseCacheError(RuntimeError):
+    pass
+
+
+def _normalize_message(message: BaseMessage, call_ids: Dict[str, str]) -> Dict[str, Any]:
+    # Tool-call ids are minted fresh by the provider on every response, so
+    # they are renumbered in order of appearance; message ids and response
+    # metadata are left out altogether.
+    def call_id(raw: Any) -> str:
+        return call_ids.setdefault(str(raw), f"call_{len(call_ids)}")
+
+    item: Dict[str, Any] = {"type": message.type, "content": message.content}
+    if getattr(message, "name", None):
+        item["name"] = message.name
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        item["tool_calls"] = [
+            {"name": call.get("name"), "args": call.get("args"), "id": call_id(call.get("id"))}
+            for call in tool_calls
+        ]
+    if getattr(message, "tool_call_id", None):
+        item["tool_call_id"] = call_id(message.tool_call_id)
+    return item
+
+
+def _with_fresh_ids(message: AIMessage) -> AIMessage:
+    # A replayed response may land in a history that already holds an earlier
+    # replay of it, so its tool-call ids are reissued (consistently in
+    # `tool_calls` and the raw provider payload) and its message id dropped.
+    renamed: Dict[str, str] = {}
+
+    def fresh(raw: Any) -> str:
+        return renamed.setdefault(str(raw), f"call_{uuid.uuid4().hex}")
+
+    tool_calls = [{**call, "id": fresh(call.get("id"))} for call in message.tool_calls]
+    additional_kwargs = dict(message.additional_kwargs)
+    if additional_kwargs.get("tool_calls"):
+        additional_kwargs["tool_calls"] = [
+            {**call, "id": fresh(call.get("id"))} for call in additional_kwargs["tool_calls"]
+        ]
+    return message.model_copy(
+        update={"id": None, "tool_calls": tool_calls, "additional_kwargs": additional_kwargs}
+    )
+
+
+def request_key(
+    model: str,
+    extra_body: Optional[Dict[str, Any]],
+    messages: List[BaseMessage],
+    tool_schemas: List[Dict[str, Any]],
+) -> str:
+    """Hash of a model request, stable across runs that send the same conversation."""
+    call_ids: Dict[str, str] = {}
+    request = {
+        "model": model,
+        "extra_body": extra_body or {},
+        "messages": [_normalize_message(message, call_ids) for message in messages],
+        "tools": tool_schemas,
+    }
+    raw = json.dumps(
+        request, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache of model responses keyed by `request_key`.
+
+    Each hit is a copy with newly issued tool-call ids. Entries older than
+    `ttl_s` are misses and are deleted when seen. After each write the least
+    recently used entries are evicted until at most `max_entries` remain and
+    their JSON totals at most `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_s: float = DEFAULT_TTL_S,
+    ) -> None:
+        self.path = db_path
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.ttl_s = ttl_s
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._counts = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        try:
+            with self._connect() as conn:
+                conn.execute(_SCHEMA)
+                conn.execute(_LRU_INDEX)
+        except sqlite3.Error as exc:
+            raise ResponseCacheError(
+                f"failed initializing response cache at {self.path}: {exc}"
+            ) from exc
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(
+                    self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+                )
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conn:
+                yield self._conn
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[AIMessage]:
+        now = time.time() if now is None else now
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT message_json, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] > self.ttl_s:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._counts["expired"] += 1
+                    row = None
+                if row is None:
+                    self._counts["misses"] += 1
+                    return None
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                self._counts["hits"] += 1
+        except sqlite3.Error as exc:
+            raise ResponseCacheError(f"failed reading response cache: {exc}") from exc
+        message = messages_from_dict([json.loads(row[0])])[0]
+        return _with_fresh_ids(message) if isinstance(message, AIMessage) else None
+
+    def put(self, key: str, message: AIMessage, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        payload = json.dumps(messages_to_dict([message])[0], ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    """
+                    INSERT INTO responses (key, message_json, size, created_at, last_used)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        message_json = excluded.message_json,
+                        size = excluded.size,
+                        created_at = excluded.created_at,
+                        last_used = excluded.last_used
+                    """,
+                    (key, payload, size, now, now),
+                )
+                self._evict(conn)
+        except sqlite3.Error as exc:
+            raise ResponseCacheError(f"failed writing response cache: {exc}") from exc
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used, key"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self._counts["evictions"] += len(doomed)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def close(self) -> None:
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+import asyncio
 import signal
+import threading
 import time
 from dataclasses import dataclass, field
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 
 from langchain_core.messages import (
     AIMessage,
@@ -14,21 +16,54 @@ from langchain_core.messages import (
     ToolMessage,
     message_chunk_to_message,
 )
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from pydantic import ValidationError
 
+from .context_window import (
+    ContextWindowConfig,
+    estimate_text_tokens,
+    estimate_tokens,
+    plan_window,
+    asummarize_with_model,
+    summary_message,
+)
+from .profiling import JsonlSpanExporter, Span, TurnProfiler, phase_totals
+from .resilience import (
+    ModelDeadlineError,
+    ModelIdleTimeoutError,
+    ResilienceConfig,
+    ResilienceState,
+    is_retryable,
+)
+from .response_cache import ResponseCache, request_key
 from .render import (
     RendererConfig,
+    StreamingRenderer,
+    chunk_text,
     clear_line,
     clear_previous_line,
     pretty_print_assistant,
     print_user_block,
-    start_thinking_indicator,
+    run_thinking_indicator,
 )
 from .tools import ToolRegistry
 from .tracing import build_langsmith_run_config, maybe_trace_request_payload
 from .providers.base import ProviderAdapter
 
 
+HistoryPager = Callable[[int, int], List[BaseMessage]]
+_T = TypeVar("_T")
+
+# Tool calls from one model step run concurrently, at most this many at a
+# time. A call that outlives its timeout is reported as a tool error; a sync
+# tool's worker thread cannot be interrupted and finishes in the background.
+TOOL_MAX_WORKERS = 8
+DEFAULT_TOOL_TIMEOUT_S = 30.0
+# Messages before the restored tail that no summary covers are paged in and
+# summarized this many at a time on the first turn that sees them.
+BACKLOG_SUMMARY_PAGE = 200
+
+
 @dataclass
 class RuntimeContext:
     adapter: ProviderAdapter
@@ -37,6 +72,35 @@ class RuntimeContext:
     trace_requests: bool = False
     session_model: Any = None
     session_bound_model: Any = None
+    # `history` may be only the tail of a longer thread: `history[0]` is
+    # message number `history_offset`, and `history_pager(start, end)` loads
+    # older messages on demand.
+    history_offset: int = 0
+    history_pager: Optional[HistoryPager] = None
+    # Rolling summary of messages before `summary_upto` (absolute position)
+    # that were evicted from the prompt window; `summary_dirty` marks it for
+    # persistence next to the checkpoint.
+    summary: str = ""
+    summary_upto: int = 0
+    summary_dirty: bool = False
+    turn_stats: Dict[str, Any] = field(default_factory=dict)
+    resilience: ResilienceState = field(default_factory=ResilienceState)
+    # Spans of the turn in progress; hooks can add their own via `profiler.span`.
+    profiler: TurnProfiler = field(default_factory=TurnProfiler)
+
+    @property
+    def total_messages(self) -> int:
+        return self.history_offset + len(self.history)
+
+    def page_in_older(self, count: int) -> int:
+        """Prepend up to `count` older messages; returns how many were loaded."""
+        if count <= 0 or self.history_offset <= 0 or self.history_pager is None:
+            return 0
+        start = max(0, self.history_offset - count)
+        older = self.history_pager(start, self.history_offset)
+        self.history = [*older, *self.history]
+        self.history_offset -= len(older)
+        return len(older)
 
 
 CommandHandler = Callable[[RuntimeContext, str], bool]
@@ -48,50 +112,524 @@ ToolPostprocessor = Callable[[str, Any, Dict[str, Any], RuntimeContext], Any]
 class RuntimeOptions:
     prompt_builder: PromptBuilder
     tool_registry: ToolRegistry
+    # Per-turn volatile context (e.g. retrieved memory). It is sent as a
+    # system message right before the turn's user message, so the system
+    # prompt and earlier history stay a byte-stable, cacheable prefix.
+    context_builder: Optional[PromptBuilder] = None
     command_handlers: Dict[str, CommandHandler] = field(default_factory=dict)
     on_start: Optional[Callable[[RuntimeContext], None]] = None
     on_reset: Optional[Callable[[RuntimeContext], Optional[str]]] = None
     on_before_turn: Optional[Callable[[RuntimeContext, str], None]] = None
     on_after_turn: Optional[Callable[[RuntimeContext, List[BaseMessage]], None]] = None
+    on_shutdown: Optional[Callable[[RuntimeContext], None]] = None
+    # Runs on a worker thread while the prompt waits for input, after startup
+    # and after each turn or command; the next turn awaits it before
+    # `on_before_turn`, so work done here comes off the turn's critical path.
+    on_idle: Optional[Callable[[RuntimeContext], None]] = None
     tool_postprocessor: Optional[ToolPostprocessor] = None
+    context_window: Optional[ContextWindowConfig] = None
+    tool_timeout_s: float = DEFAULT_TOOL_TIMEOUT_S
+    # Per-tool overrides of `tool_timeout_s`, keyed by tool name.
+    tool_timeouts: Dict[str, float] = field(default_factory=dict)
+    # Retries, deadlines and hedging for model calls; `None` sends each
+    # request once and waits on it indefinitely.
+    resilience: Optional[ResilienceConfig] = None
+    # Opt-in replay of earlier responses to identical requests.
+    response_cache: Optional[ResponseCache] = None
+    # Where each turn's spans are written; without one they only feed the
+    # `CLI_TRACE_REQUEST` phase summary.
+    span_exporter: Optional[JsonlSpanExporter] = None
     trace_requests: bool = False
     renderer: RendererConfig = field(default_factory=RendererConfig)
 
 
-def stream_model_turn(
+class _StreamAccumulator:
+    """Folds streamed chunks into one message and times the stream."""
+
+    def __init__(self) -> None:
+        self.chunk: Optional[AIMessageChunk] = None
+        self.start_ns = time.perf_counter_ns()
+        self.first_token_ns: Optional[int] = None
+        self.streamed_chars = 0
+        self.render_ns = 0
+
+    def add(self, chunk: AIMessageChunk) -> str:
+        """Accumulate `chunk` and return the text it carries."""
+        self.chunk = chunk if self.chunk is None else self.chunk + chunk
+        text = chunk_text(chunk.content)
+        if self.first_token_ns is None and (text or getattr(chunk, "tool_call_chunks", None)):
+            self.first_token_ns = time.perf_counter_ns()
+        self.streamed_chars += len(text)
+        return text
+
+    def render(self, renderer: StreamingRenderer, text: str) -> None:
+        start_ns = time.perf_counter_ns()
+        renderer.feed(text)
+        self.render_ns += time.perf_counter_ns() - start_ns
+
+    def result(self, stats: Optional[Dict[str, Any]] = None) -> AIMessage:
+        end_ns = time.perf_counter_ns()
+        if self.chunk is None:
+            ai_message = AIMessage(content="")
+        else:
+            ai_message = message_chunk_to_message(self.chunk)  # type: ignore[assignment]
+        if stats is not None:
+            usage = getattr(ai_message, "usage_metadata", None) or {}
+            output_tokens = usage.get("output_tokens")
+            if output_tokens is None:
+                output_tokens = (self.streamed_chars + 3) // 4
+            stats["stream_ms"] = (end_ns - self.start_ns) / 1_000_000
+            stats["render_ms"] = self.render_ns / 1_000_000
+            stats["output_tokens"] = output_tokens
+            stats["ttft_ms"] = None
+            stats["tokens_per_s"] = None
+            if self.first_token_ns is not None:
+                stats["ttft_ms"] = (self.first_token_ns - self.start_ns) / 1_000_000
+                generation_s = (end_ns - self.first_token_ns) / 1_000_000_000
+                if generation_s > 0:
+                    stats["tokens_per_s"] = output_tokens / generation_s
+        return ai_message  # type: ignore[return-value]
+
+
+async def _achunks(
+    bound_model: Any,
+    messages: List[BaseMessage],
+    run_config: Optional[Dict[str, Any]],
+) -> AsyncIterator[AIMessageChunk]:
+    kwargs = {"config": run_config} if run_config else {}
+    if hasattr(bound_model, "astream"):
+        async for chunk in bound_model.astream(messages, **kwargs):
+            yield chunk
+        return
+    # Sync-only models are pulled one chunk at a time off the loop thread, so
+    # cancellation still takes effect between chunks.
+    iterator = iter(bound_model.stream(messages, **kwargs))
+    done = object()
+    while True:
+        chunk = await asyncio.to_thread(next, iterator, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+def _resilience_config(resilience: Optional[ResilienceConfig]) -> ResilienceConfig:
+    # Without a policy, a call is sent once and waited on indefinitely.
+    return resilience or ResilienceConfig(max_attempts=1, turn_deadline_s=None, idle_timeout_s=None)
+
+
+async def _bounded(
+    awaitable: Awaitable[_T],
+    config: ResilienceConfig,
+    state: ResilienceState,
+    deadline: Optional[float],
+    idle_detail: str = "no response chunk",
+) -> _T:
+    """Await `awaitable` within the idle timeout and what is left of `deadline`."""
+    timeout = config.idle_timeout_s
+    deadline_bound = False
+    if deadline is not None:
+        remaining = max(0.0, deadline - time.monotonic())
+        if timeout is None or remaining < timeout:
+            timeout, deadline_bound = remaining, True
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        if deadline_bound:
+            state.counters["deadline_exceeded"] += 1
+            raise ModelDeadlineError("model call ran past the turn deadline") from None
+        state.counters["idle_timeouts"] += 1
+        raise ModelIdleTimeoutError(f"{idle_detail} for {timeout:.0f}s") from None
+
+
+async def _with_retries(
+    call: Callable[[], Awaitable[_T]],
+    config: ResilienceConfig,
+    state: ResilienceState,
+    deadline: Optional[float],
+) -> Tuple[_T, int]:
+    """Run `call` until it succeeds; returns its result and the retries it took.
+
+    Transient failures (`is_retryable`) are retried with backoff up to
+    `max_attempts` in total, unless the backoff would run past `deadline`.
+    """
+    retries = 0
+    while True:
+        try:
+            return await call(), retries
+        except Exception as exc:
+            delay = config.backoff_s(retries)
+            out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+            if retries + 1 >= config.max_attempts or out_of_time or not is_retryable(exc):
+                if retries:
+                    state.counters["gave_up"] += 1
+                raise
+            retries += 1
+            state.counters["retries"] += 1
+            await asyncio.sleep(delay)
+
+
+def _has_token(chunk: AIMessageChunk) -> bool:
+    return bool(chunk_text(chunk.content) or getattr(chunk, "tool_call_chunks", None))
+
+
+class _ModelAttempt:
+    """One streamed model request; `lead` holds chunks up to the first token."""
+
+    def __init__(
+        self,
+        bound_model: Any,
+        messages: List[BaseMessage],
+        run_config: Optional[Dict[str, Any]],
+        config: ResilienceConfig,
+        state: ResilienceState,
+        deadline: Optional[float],
+    ) -> None:
+        self.source = _achunks(bound_model, messages, run_config)
+        self.config = config
+        self.state = state
+        self.deadline = deadline
+        self.started_ns = time.perf_counter_ns()
+        self.lead: List[AIMessageChunk] = []
+
+    async def next(self) -> Optional[AIMessageChunk]:
+        """Next chunk, or `None` at the end; bounded by the idle timeout and deadline."""
+        try:
+            return await _bounded(self.source.__anext__(), self.config, self.state, self.deadline)
+        except StopAsyncIteration:
+            return None
+
+    async def read_lead(self) -> None:
+        while True:
+            chunk = await self.next()
+            if chunk is None:
+                return
+            self.lead.append(chunk)
+            if _has_token(chunk):
+                self.state.ttft.add((time.perf_counter_ns() - self.started_ns) / 1_000_000)
+                return
+
+    async def aclose(self) -> None:
+        try:
+            await self.source.aclose()
+        except Exception:  # noqa: BLE001
+            pass
+
+
+async def _race_lead(
+    new_attempt: Callable[[], _ModelAttempt],
+    hedge_after_s: Optional[float],
+) -> _ModelAttempt:
+    # Without hedging this is just the first request's lead. With it, a second
+    # request starts once the first is slower than `hedge_after_s`; the first
+    # to reach a token wins and the other is cancelled.
+    primary = new_attempt()
+    attempts: Dict["asyncio.Task[None]", _ModelAttempt] = {
+        asyncio.create_task(primary.read_lead()): primary
+    }
+    winner: Optional[_ModelAttempt] = None
+    try:
+        if hedge_after_s is not None:
+            done, _pending = await asyncio.wait(attempts, timeout=hedge_after_s)
+            if not done:
+                hedge = new_attempt()
+                hedge.state.counters["hedges"] += 1
+                attempts[asyncio.create_task(hedge.read_lead())] = hedge
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda item: attempts[item] is not primary):
+                if task.exception() is None:
+                    winner = attempts[task]
+                    if winner is not primary:
+                        winner.state.counters["hedge_wins"] += 1
+                    return winner
+                error = error or task.exception()
+        assert error is not None
+        raise error
+    finally:
+        for task, attempt in attempts.items():
+            if attempt is winner:
+                continue
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await attempt.aclose()
+
+
+async def astream_model_turn(
     bound_model: Any,
     messages: List[BaseMessage],
     run_config: Optional[Dict[str, Any]] = None,
+    renderer: Optional[StreamingRenderer] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    resilience: Optional[ResilienceConfig] = None,
+    resilience_state: Optional[ResilienceState] = None,
+    deadline: Optional[float] = None,
 ) -> AIMessage:
-    stop_event = __import__("threading").Event()
-    indicator_thread = start_thinking_indicator(stop_event)
-    chunk_accumulator: Optional[AIMessageChunk] = None
+    """Stream one model response and return it as a complete `AIMessage`.
+
+    With a `renderer`, text is printed as it arrives and the spinner stops at
+    the first text token. `stats`, if given, receives `ttft_ms` (time to the
+    first non-empty chunk), `stream_ms`, `render_ms` (time spent printing
+    within it), and `output_tokens` with `tokens_per_s` over the time after
+    the first token. Models without `astream` are pulled from a worker thread.
+
+    Cancelling the awaiting task closes the stream, which aborts the request.
+    With `resilience`, failures before the first token are retried (nothing
+    has been shown yet); an error or idle timeout after it fails the call.
+    `deadline` is a `time.monotonic()` value bounding the whole call.
+    """
+    config = _resilience_config(resilience)
+    state = resilience_state or ResilienceState()
+    stop_event = asyncio.Event()
+    indicator = asyncio.create_task(run_thinking_indicator(stop_event))
+
+    def stop_spinner() -> None:
+        if not stop_event.is_set():
+            stop_event.set()
+            indicator.cancel()
+            clear_line()
+
+    def feed(chunk: AIMessageChunk) -> None:
+        text = accumulator.add(chunk)
+        if text and renderer is not None:
+            stop_spinner()
+            accumulator.render(renderer, text)
+
+    def new_attempt() -> _ModelAttempt:
+        return _ModelAttempt(bound_model, messages, run_config, config, state, deadline)
+
+    accumulator = _StreamAccumulator()
+    if renderer is not None:
+        renderer.begin_message()
+    attempt: Optional[_ModelAttempt] = None
+    retries = 0
     try:
-        if run_config:
-            stream_iter = bound_model.stream(messages, config=run_config)
-        else:
-            stream_iter = bound_model.stream(messages)
-        for chunk in stream_iter:
-            if chunk_accumulator is None:
-                chunk_accumulator = chunk
-            else:
-                chunk_accumulator += chunk
+        attempt, retries = await _with_retries(
+            lambda: _race_lead(new_attempt, state.hedge_after_s(config)),
+            config,
+            state,
+            deadline,
+        )
+        for chunk in attempt.lead:
+            feed(chunk)
+        while (chunk := await attempt.next()) is not None:
+            feed(chunk)
     finally:
-        stop_event.set()
-        indicator_thread.join(timeout=1)
-        clear_line()
-    if chunk_accumulator is None:
-        return AIMessage(content="")
-    return message_chunk_to_message(chunk_accumulator)  # type: ignore[return-value]
+        stop_spinner()
+        if attempt is not None:
+            await attempt.aclose()
+    ai_message = accumulator.result(stats)
+    if stats is not None:
+        stats["retries"] = retries
+    return ai_message
 
 
-def run_agent_turn(
+async def _apply_context_window(
     context: RuntimeContext,
+    messages: List[BaseMessage],
     system_prompt: str,
-    tool_registry: ToolRegistry,
+    config: ContextWindowConfig,
+    run_config: Optional[Dict[str, Any]],
+    turn_context: str = "",
+    resilience: Optional[ResilienceConfig] = None,
+    deadline: Optional[float] = None,
+) -> int:
+    policy = _resilience_config(resilience)
+    if context.summary_upto < context.history_offset and context.history_pager is not None:
+        await _summarize_backlog(context, run_config, policy, deadline)
+    resident_start = max(0, context.summary_upto - context.history_offset)
+    fixed_tokens = estimate_text_tokens(system_prompt)
+    if turn_context:
+        fixed_tokens += estimate_text_tokens(turn_context)
+    if context.summary:
+        fixed_tokens += estimate_text_tokens(context.summary)
+    plan = plan_window(messages, resident_start, fixed_tokens, config)
+    if plan.needs_summary:
+        evicted = messages[plan.evict_from : plan.start]
+        try:
+            context.summary = await _summarize(context, evicted, run_config, policy, deadline)
+            context.summary_upto = context.history_offset + plan.start
+            context.summary_dirty = True
+        except Exception as exc:  # noqa: BLE001
+            print(
+                "Context summary warning: older turns were left out of this request "
+                f"without being summarized: {exc}"
+            )
+        if context.trace_requests:
+            print(
+                f"[trace] context window evicted {len(evicted)} messages "
+                f"(summary_upto={context.summary_upto})"
+            )
+    return plan.start
+
+
+async def _summarize(
+    context: RuntimeContext,
+    evicted: List[BaseMessage],
+    run_config: Optional[Dict[str, Any]],
+    policy: ResilienceConfig,
+    deadline: Optional[float],
+) -> str:
+    # Same retry policy and turn deadline as the model stream; the whole
+    # summary counts as one chunk for the idle timeout.
+    summary, _retries = await _with_retries(
+        lambda: _bounded(
+            asummarize_with_model(context.session_model, context.summary, evicted, run_config),
+            policy,
+            context.resilience,
+            deadline,
+            idle_detail="no summary response",
+        ),
+        policy,
+        context.resilience,
+        deadline,
+    )
+    return summary
+
+
+async def _summarize_backlog(
+    context: RuntimeContext,
+    run_config: Optional[Dict[str, Any]],
+    policy: ResilienceConfig,
+    deadline: Optional[float],
+) -> None:
+    # A thread restored from its tail (a legacy one, or one never summarized)
+    # has older messages no summary covers. Page them in and fold them into
+    # the summary, so the model still sees the whole thread; progress is kept
+    # page by page, and a failed page is retried on the next turn.
+    assert context.history_pager is not None
+    paged = 0
+    try:
+        while context.summary_upto < context.history_offset:
+            end = min(context.history_offset, context.summary_upto + BACKLOG_SUMMARY_PAGE)
+            older = context.history_pager(context.summary_upto, end)
+            if not older:
+                break
+            context.summary = await _summarize(context, older, run_config, policy, deadline)
+            context.summary_upto += len(older)
+            context.summary_dirty = True
+            paged += len(older)
+    except Exception as exc:  # noqa: BLE001
+        print(
+            "Context summary warning: messages before the restored history were left "
+            f"out of this request without being summarized: {exc}"
+        )
+    if context.trace_requests and paged:
+        print(
+            f"[trace] context window summarized {paged} older messages "
+            f"(summary_upto={context.summary_upto})"
+        )
+
+
+def _admit_tool_calls(
+    context: RuntimeContext,
+    tool_calls: List[Dict[str, Any]],
+    tools_by_name: Dict[str, Any],
+) -> Tuple[List[Any], List[int]]:
+    # Decided serially, in call order, before anything runs, so the
+    # one-`memory_upsert`-per-turn guard admits the same call it would in a
+    # serial loop. Returns preset outputs and the positions allowed to run.
+    state = context.state if isinstance(context.state, dict) else {}
+    outputs: List[Any] = [None] * len(tool_calls)
+    runnable: List[int] = []
+    for position, tool_call in enumerate(tool_calls):
+        tool_name = tool_call.get("name")
+        tool = tools_by_name.get(tool_name)
+        if (
+            tool_name == "memory_upsert"
+            and isinstance(state, dict)
+            and int(state.get("turn_memory_write_count", 0)) >= 1
+        ):
+            outputs[position] = (
+                "Memory write skipped: only one memory_upsert call is "
+                "allowed per turn."
+            )
+        elif tool is None:
+            outputs[position] = f"Unknown tool: {tool_name}"
+        else:
+            if tool_name == "memory_upsert" and isinstance(state, dict):
+                state["turn_memory_write_count"] = (
+                    int(state.get("turn_memory_write_count", 0)) + 1
+                )
+                context.state = state
+            runnable.append(position)
+    return outputs, runnable
+
+
+def _tool_messages(
+    context: RuntimeContext,
+    tool_calls: List[Dict[str, Any]],
+    outputs: List[Any],
     tool_postprocessor: Optional[ToolPostprocessor] = None,
-) -> List[BaseMessage]:
-    tools_by_name = tool_registry.by_name()
+) -> List[ToolMessage]:
+    messages: List[ToolMessage] = []
+    for tool_call, tool_output in zip(tool_calls, outputs):
+        tool_name = tool_call.get("name")
+        if tool_postprocessor:
+            tool_output = tool_postprocessor(
+                tool_name or "",
+                tool_output,
+                tool_call,
+                context,
+            )
+        messages.append(
+            ToolMessage(
+                content=str(tool_output),
+                tool_call_id=tool_call.get("id", ""),
+                name=tool_name or "tool",
+            )
+        )
+    return messages
+
+
+async def _arun_tool_calls(
+    context: RuntimeContext,
+    tool_calls: List[Dict[str, Any]],
+    tools_by_name: Dict[str, Any],
+    tool_postprocessor: Optional[ToolPostprocessor] = None,
+    tool_timeout_s: float = DEFAULT_TOOL_TIMEOUT_S,
+    tool_timeouts: Optional[Dict[str, float]] = None,
+    parent: Optional[Span] = None,
+) -> List[ToolMessage]:
+    """Run one step's tool calls concurrently; results keep the calls' order.
+
+    Admission (unknown tools, the `memory_upsert` guard) and postprocessing
+    run serially, in call order; only the `ainvoke` calls overlap. Each call
+    is profiled as a `tool` span under `parent`.
+    """
+    outputs, runnable = _admit_tool_calls(context, tool_calls, tools_by_name)
+    slots = asyncio.Semaphore(TOOL_MAX_WORKERS)
+
+    async def invoke(position: int) -> None:
+        tool_name = tool_calls[position].get("name")
+        timeout = (tool_timeouts or {}).get(tool_name, tool_timeout_s)
+        async with slots:
+            with context.profiler.span("tool", parent=parent, tool=tool_name) as span:
+                status = "error"
+                try:
+                    outputs[position] = await asyncio.wait_for(
+                        tools_by_name[tool_name].ainvoke(tool_calls[position].get("args", {})),
+                        timeout=timeout,
+                    )
+                    status = "ok"
+                except asyncio.TimeoutError:
+                    status = "timeout"
+                    outputs[position] = f"Tool error: {tool_name} timed out after {timeout:g}s"
+                except ValidationError as exc:
+                    outputs[position] = f"Tool error: {exc}"
+                except Exception as exc:  # noqa: BLE001
+                    outputs[position] = f"Tool error: {exc}"
+                if span is not None:
+                    span.attributes["status"] = status
+
+    await asyncio.gather(*(invoke(position) for position in runnable))
+    return _tool_messages(context, tool_calls, outputs, tool_postprocessor)
+
+
+def _session_bound_model(context: RuntimeContext, tool_registry: ToolRegistry) -> Any:
     if context.session_bound_model is None:
         model = context.adapter.build_model()
         maybe_trace_request_payload(model, context.trace_requests)
@@ -100,70 +638,341 @@ def run_agent_turn(
             model,
             tool_registry.all(),
         )
-    bound_model = context.session_bound_model
+    return context.session_bound_model
+
+
+def _turn_start(messages: List[BaseMessage]) -> int:
+    # Index of the user message that opened this turn.
+    if messages and isinstance(messages[-1], HumanMessage):
+        return len(messages) - 1
+    return len(messages)
+
+
+def _step_prompt(
+    context: RuntimeContext,
+    system_message: SystemMessage,
+    messages: List[BaseMessage],
+    window_start: int,
+    turn_context: Optional[SystemMessage] = None,
+    turn_start: int = 0,
+) -> Tuple[List[BaseMessage], int]:
+    # Stable parts first (system prompt, summary, earlier history) so
+    # consecutive requests share the longest possible prefix; the volatile
+    # turn context sits just before the turn's own messages.
+    prompt: List[BaseMessage] = [system_message]
+    if context.summary:
+        prompt.append(summary_message(context.summary))
+    if turn_context is None:
+        prompt.extend(messages[window_start:])
+    else:
+        split = max(window_start, turn_start)
+        prompt.extend(messages[window_start:split])
+        prompt.append(turn_context)
+        prompt.extend(messages[split:])
+    prompt_tokens = sum(estimate_tokens(message) for message in prompt)
+    context.turn_stats["prompt_tokens_est"] += prompt_tokens
+    return prompt, prompt_tokens
+
+
+def cached_input_tokens(ai_message: AIMessage) -> Optional[int]:
+    """Prompt tokens the provider served from its prefix cache, if reported."""
+    usage = getattr(ai_message, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    if details.get("cache_read") is not None:
+        return int(details["cache_read"])
+    # Moonshot reports `cached_tokens` at the top level of `usage`, which
+    # only survives in the raw `token_usage` of non-streamed responses.
+    raw = (getattr(ai_message, "response_metadata", None) or {}).get("token_usage") or {}
+    cached = raw.get("cached_tokens")
+    if cached is None:
+        cached = (raw.get("prompt_tokens_details") or {}).get("cached_tokens")
+    return int(cached) if cached is not None else None
+
+
+def _record_stream(
+    context: RuntimeContext,
+    ai_message: AIMessage,
+    stream_stats: Dict[str, Any],
+    prompt: List[BaseMessage],
+    prompt_tokens: int,
+    renderer: Optional[StreamingRenderer],
+) -> None:
+    context.turn_stats.setdefault("ttft_ms", stream_stats["ttft_ms"])
+    usage = getattr(ai_message, "usage_metadata", None) or {}
+    cached = cached_input_tokens(ai_message)
+    if usage.get("input_tokens") is not None:
+        context.turn_stats["input_tokens"] += int(usage["input_tokens"])
+    if cached is not None:
+        context.turn_stats["cached_tokens"] += cached
+    if not context.trace_requests:
+        return
+    if renderer is not None:
+        renderer.finish()
+    ttft = stream_stats["ttft_ms"]
+    rate = stream_stats["tokens_per_s"]
+    print(
+        f"[trace] model stream {stream_stats['stream_ms']:.0f} ms "
+        f"context_tokens~{prompt_tokens} messages={len(prompt)}"
+        + (
+            f" input_tokens={usage['input_tokens']}"
+            if usage.get("input_tokens") is not None
+            else ""
+        )
+        + (f" cached_tokens={cached}" if cached is not None else "")
+        + (f" retries={stream_stats['retries']}" if stream_stats.get("retries") else "")
+        + (f" ttft={ttft:.0f} ms" if ttft is not None else "")
+        + (
+            f" output_tokens={stream_stats['output_tokens']} tokens/s={rate:.1f}"
+            if rate is not None
+            else ""
+        )
+    )
+
+
+def _profile_stream(
+    context: RuntimeContext,
+    span: Optional[Span],
+    ai_message: AIMessage,
+    stream_stats: Dict[str, Any],
+) -> None:
+    if span is None:
+        return
+    usage = getattr(ai_message, "usage_metadata", None) or {}
+    span.attributes.update(
+        {
+            "output_tokens": stream_stats["output_tokens"],
+            "render_ms": round(stream_stats["render_ms"], 3),
+            "retries": stream_stats.get("retries", 0),
+            "tool_calls": len(ai_message.tool_calls or []),
+        }
+    )
+    if usage.get("input_tokens") is not None:
+        span.attributes["input_tokens"] = int(usage["input_tokens"])
+    cached = cached_input_tokens(ai_message)
+    if cached is not None:
+        span.attributes["cached_tokens"] = cached
+    ttft = stream_stats["ttft_ms"]
+    if ttft is not None:
+        span.attributes["ttft_ms"] = round(ttft, 3)
+        context.profiler.record(
+            "model.ttft", span.start_ns, span.start_ns + int(ttft * 1_000_000), parent=span
+        )
+
+
+def _tool_schemas(tool_registry: ToolRegistry) -> List[Dict[str, Any]]:
+    return [convert_to_openai_tool(tool) for tool in tool_registry.all()]
+
+
+def _cache_lookup(
+    context: RuntimeContext,
+    cache: ResponseCache,
+    prompt: List[BaseMessage],
+    tool_schemas: List[Dict[str, Any]],
+) -> Tuple[str, Optional[AIMessage]]:
+    config = context.adapter.config
+    key = request_key(
+        str(getattr(config, "model", "")),
+        getattr(config, "extra_body", None),
+        prompt,
+        tool_schemas,
+    )
+    try:
+        cached = cache.get(key)
+    except Exception as exc:  # noqa: BLE001
+        print(f"Response cache warning: {exc}")
+        cached = None
+    if context.trace_requests:
+        outcome = "hit" if cached is not None else "miss"
+        print(f"[trace] response cache {outcome} key={key[:12]}")
+    return key, cached
+
+
+def _replay_cached(ai_message: AIMessage, renderer: Optional[StreamingRenderer]) -> AIMessage:
+    if renderer is not None:
+        renderer.begin_message()
+        renderer.feed(chunk_text(ai_message.content))
+    return ai_message
+
+
+def _cache_store(cache: ResponseCache, key: str, ai_message: AIMessage) -> None:
+    # Empty responses are usually a provider hiccup; never replay one.
+    if not (chunk_text(ai_message.content) or ai_message.tool_calls):
+        return
+    try:
+        cache.put(key, ai_message)
+    except Exception as exc:  # noqa: BLE001
+        print(f"Response cache warning: {exc}")
+
+
+def _trace_prompt_cache(context: RuntimeContext) -> None:
+    input_tokens = context.turn_stats.get("input_tokens") or 0
+    if not context.trace_requests or not input_tokens:
+        return
+    cached = context.turn_stats.get("cached_tokens", 0)
+    print(
+        f"[trace] prompt cache cached_tokens={cached}/{input_tokens} "
+        f"hit_rate={cached / input_tokens:.0%}"
+    )
+
+
+def _trace_resilience(context: RuntimeContext) -> None:
+    counters = context.resilience.counters
+    if context.trace_requests and any(counters.values()):
+        print("[trace] model " + " ".join(f"{name}={value}" for name, value in counters.items()))
+
+
+def _trace_turn_phases(context: RuntimeContext, spans: List[Span]) -> None:
+    totals = phase_totals(spans)
+    if context.trace_requests and totals:
+        print(
+            f"[trace] turn {spans[0].duration_ms:.0f} ms: "
+            + " ".join(f"{name}={ms:.0f}ms" for name, ms in totals.items())
+        )
+
+
+def _trace_tool_step(context: RuntimeContext, count: int, start_ns: int) -> None:
+    if context.trace_requests:
+        tools_ms = (time.perf_counter_ns() - start_ns) / 1_000_000
+        print(f"[trace] tool calls={count} {tools_ms:.0f} ms")
+
+
+async def arun_agent_turn(
+    context: RuntimeContext,
+    system_prompt: str,
+    tool_registry: ToolRegistry,
+    tool_postprocessor: Optional[ToolPostprocessor] = None,
+    context_window: Optional[ContextWindowConfig] = None,
+    renderer: Optional[StreamingRenderer] = None,
+    tool_timeout_s: float = DEFAULT_TOOL_TIMEOUT_S,
+    tool_timeouts: Optional[Dict[str, float]] = None,
+    turn_context: str = "",
+    resilience: Optional[ResilienceConfig] = None,
+    response_cache: Optional[ResponseCache] = None,
+) -> List[BaseMessage]:
+    """Run one agent turn: model steps via `astream`, tools via `ainvoke`.
+
+    Blocking setup (model build, summarization) runs on a worker thread, so
+    the event loop stays responsive and the turn can be cancelled. With
+    `resilience`, model calls are retried and hedged per its policy, and all
+    of them together must finish within its `turn_deadline_s`.
+    """
+    deadline = None
+    if resilience is not None and resilience.turn_deadline_s is not None:
+        deadline = time.monotonic() + resilience.turn_deadline_s
+    tools_by_name = tool_registry.by_name()
+    tool_schemas = _tool_schemas(tool_registry) if response_cache is not None else []
+    bound_model = await asyncio.to_thread(_session_bound_model, context, tool_registry)
     messages: List[BaseMessage] = list(context.history)
     system_message = SystemMessage(content=system_prompt)
+    context_message = SystemMessage(content=turn_context) if turn_context else None
+    turn_start = _turn_start(messages)
     run_config = build_langsmith_run_config(context.adapter)
+    window_start = 0
+    if context_window is not None:
+        with context.profiler.span("context_window"):
+            window_start = await _apply_context_window(
+                context,
+                messages,
+                system_prompt,
+                context_window,
+                run_config,
+                turn_context,
+                resilience,
+                deadline,
+            )
+    context.turn_stats["prompt_tokens_est"] = 0
+    context.turn_stats["input_tokens"] = 0
+    context.turn_stats["cached_tokens"] = 0
+    context.turn_stats.pop("ttft_ms", None)
 
-    for _attempt in range(5):
-        start_ms = time.perf_counter_ns()
-        ai_message = stream_model_turn(
-            bound_model,
-            [system_message, *messages],
-            run_config,
-        )
-        if context.trace_requests:
-            elapsed_ms = (time.perf_counter_ns() - start_ms) / 1_000_000
-            print(f"[trace] model stream {elapsed_ms:.0f} ms")
+    profiler = context.profiler
+    for step in range(5):
+        with profiler.span("step_prompt", step=step) as prompt_span:
+            prompt, prompt_tokens = _step_prompt(
+                context, system_message, messages, window_start, context_message, turn_start
+            )
+            if prompt_span is not None:
+                prompt_span.attributes.update(messages=len(prompt), tokens_est=prompt_tokens)
+        cache_key, cached = "", None
+        if response_cache is not None:
+            with profiler.span("response_cache.lookup", step=step) as lookup_span:
+                cache_key, cached = await asyncio.to_thread(
+                    _cache_lookup, context, response_cache, prompt, tool_schemas
+                )
+                if lookup_span is not None:
+                    lookup_span.attributes["hit"] = cached is not None
+        if cached is not None:
+            ai_message = _replay_cached(cached, renderer)
+        else:
+            stream_stats: Dict[str, Any] = {}
+            with profiler.span("model.stream", step=step) as model_span:
+                ai_message = await astream_model_turn(
+                    bound_model,
+                    prompt,
+                    run_config,
+                    renderer=renderer,
+                    stats=stream_stats,
+                    resilience=resilience,
+                    resilience_state=context.resilience,
+                    deadline=deadline,
+                )
+            _profile_stream(context, model_span, ai_message, stream_stats)
+            _record_stream(context, ai_message, stream_stats, prompt, prompt_tokens, renderer)
+            if response_cache is not None:
+                await asyncio.to_thread(_cache_store, response_cache, cache_key, ai_message)
         messages.append(ai_message)
         tool_calls = ai_message.tool_calls or []
         if tool_calls:
-            for tool_call in tool_calls:
-                tool_name = tool_call.get("name")
-                tool = tools_by_name.get(tool_name)
-                state = context.state if isinstance(context.state, dict) else {}
-                if (
-                    tool_name == "memory_upsert"
-                    and isinstance(state, dict)
-                    and int(state.get("turn_memory_write_count", 0)) >= 1
-                ):
-                    tool_output = (
-                        "Memory write skipped: only one memory_upsert call is "
-                        "allowed per turn."
-                    )
-                elif tool is None:
-                    tool_output: Any = f"Unknown tool: {tool_name}"
-                else:
-                    if tool_name == "memory_upsert" and isinstance(state, dict):
-                        state["turn_memory_write_count"] = (
-                            int(state.get("turn_memory_write_count", 0)) + 1
-                        )
-                        context.state = state
-                    try:
-                        tool_output = tool.invoke(tool_call.get("args", {}))
-                    except ValidationError as exc:
-                        tool_output = f"Tool error: {exc}"
-                    except Exception as exc:  # noqa: BLE001
-                        tool_output = f"Tool error: {exc}"
-                if tool_postprocessor:
-                    tool_output = tool_postprocessor(
-                        tool_name or "",
-                        tool_output,
-                        tool_call,
+            tools_start_ns = time.perf_counter_ns()
+            with profiler.span("tools", step=step, calls=len(tool_calls)) as tools_span:
+                messages.extend(
+                    await _arun_tool_calls(
                         context,
-                    )
-                messages.append(
-                    ToolMessage(
-                        content=str(tool_output),
-                        tool_call_id=tool_call.get("id", ""),
-                        name=tool_name or "tool",
+                        tool_calls,
+                        tools_by_name,
+                        tool_postprocessor,
+                        tool_timeout_s,
+                        tool_timeouts,
+                        parent=tools_span,
                     )
                 )
+            _trace_tool_step(context, len(tool_calls), tools_start_ns)
             continue
         break
     return messages
 
 
+def run_agent_turn(
+    context: RuntimeContext,
+    system_prompt: str,
+    tool_registry: ToolRegistry,
+    tool_postprocessor: Optional[ToolPostprocessor] = None,
+    context_window: Optional[ContextWindowConfig] = None,
+    renderer: Optional[StreamingRenderer] = None,
+    tool_timeout_s: float = DEFAULT_TOOL_TIMEOUT_S,
+    tool_timeouts: Optional[Dict[str, float]] = None,
+    turn_context: str = "",
+    resilience: Optional[ResilienceConfig] = None,
+    response_cache: Optional[ResponseCache] = None,
+) -> List[BaseMessage]:
+    """Blocking `arun_agent_turn` on a fresh event loop (not from inside one)."""
+    return asyncio.run(
+        arun_agent_turn(
+            context=context,
+            system_prompt=system_prompt,
+            tool_registry=tool_registry,
+            tool_postprocessor=tool_postprocessor,
+            context_window=context_window,
+            renderer=renderer,
+            tool_timeout_s=tool_timeout_s,
+            tool_timeouts=tool_timeouts,
+            turn_context=turn_context,
+            resilience=resilience,
+            response_cache=response_cache,
+        )
+    )
+
+
 def _read_paste_input() -> Optional[str]:
     print("Paste mode: enter lines, then a single '.' on its own line to send.")
     lines: List[str] = []
@@ -179,51 +988,179 @@ def _read_paste_input() -> Optional[str]:
     return content
 
 
+def _in_daemon_thread(func: Callable[..., Any], *args: Any) -> "asyncio.Future[Any]":
+    # Blocking console reads run on a daemon thread rather than the default
+    # executor: a read abandoned by Ctrl-C must not keep the process alive.
+    loop = asyncio.get_running_loop()
+    future: "asyncio.Future[Any]" = loop.create_future()
+
+    def settle(result: Any = None, error: Optional[BaseException] = None) -> None:
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def target() -> None:
+        try:
+            result = func(*args)
+        except BaseException as exc:  # noqa: BLE001
+            loop.call_soon_threadsafe(settle, None, exc)
+        else:
+            loop.call_soon_threadsafe(settle, result)
+
+    threading.Thread(target=target, name="cli-input", daemon=True).start()
+    return future
+
+
 def run_cli(
     adapter: ProviderAdapter,
     options: RuntimeOptions,
     state: Any = None,
     initial_history: Optional[List[BaseMessage]] = None,
+    history_offset: int = 0,
+    history_pager: Optional[HistoryPager] = None,
+) -> None:
+    """Blocking entry point; runs `arun_cli` on a fresh event loop."""
+    asyncio.run(
+        arun_cli(
+            adapter,
+            options,
+            state=state,
+            initial_history=initial_history,
+            history_offset=history_offset,
+            history_pager=history_pager,
+        )
+    )
+
+
+async def arun_cli(
+    adapter: ProviderAdapter,
+    options: RuntimeOptions,
+    state: Any = None,
+    initial_history: Optional[List[BaseMessage]] = None,
+    history_offset: int = 0,
+    history_pager: Optional[HistoryPager] = None,
 ) -> None:
+    """Interactive loop on asyncio.
+
+    Ctrl-C during a turn cancels the in-flight model request and tool calls
+    and keeps the session, with history rolled back to before the turn.
+    Ctrl-C at the prompt, SIGQUIT, EOF, and `/exit` end the session.
+    """
     context = RuntimeContext(
         adapter=adapter,
         history=list(initial_history or []),
         state=state,
         trace_requests=options.trace_requests,
+        history_offset=history_offset,
+        history_pager=history_pager,
+        profiler=TurnProfiler(exporter=options.span_exporter),
     )
+    loop = asyncio.get_running_loop()
     signal_targets = [signal.SIGINT]
     if hasattr(signal, "SIGQUIT"):
         signal_targets.append(signal.SIGQUIT)
     previous_handlers: Dict[signal.Signals, Any] = {}
+    installed: List[signal.Signals] = []
+    pending_input: Optional["asyncio.Future[Any]"] = None
+    turn_task: Optional["asyncio.Task[List[BaseMessage]]"] = None
+    idle_task: Optional["asyncio.Task[None]"] = None
+    idle_stale = True
+    exit_requested = False
+
+    def _on_signal(signum: signal.Signals) -> None:
+        nonlocal exit_requested
+        if signum == signal.SIGINT and turn_task is not None and not turn_task.done():
+            turn_task.cancel()
+            return
+        exit_requested = True
+        if turn_task is not None and not turn_task.done():
+            turn_task.cancel()
+        if pending_input is not None and not pending_input.done():
+            pending_input.set_exception(KeyboardInterrupt())
 
     def _graceful_signal_exit(_signum, _frame) -> None:
         raise KeyboardInterrupt
 
     for sig in signal_targets:
         previous_handlers[sig] = signal.getsignal(sig)
-        signal.signal(sig, _graceful_signal_exit)
+        try:
+            loop.add_signal_handler(sig, _on_signal, sig)
+            installed.append(sig)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # No loop signal support (Windows, non-main thread): fall back to
+            # the sync behavior, where a signal ends the session.
+            signal.signal(sig, _graceful_signal_exit)
+
+    async def _read(func: Callable[..., Any], *args: Any) -> Any:
+        nonlocal pending_input
+        pending_input = _in_daemon_thread(func, *args)
+        try:
+            return await pending_input
+        finally:
+            pending_input = None
+
+    async def _finish_idle() -> None:
+        nonlocal idle_task
+        task, idle_task = idle_task, None
+        if task is None:
+            return
+        try:
+            await task
+        except Exception as exc:  # noqa: BLE001
+            print(f"Idle prefetch warning: {exc}")
+
+    def _end_turn(status: str) -> None:
+        try:
+            spans = context.profiler.end_turn(
+                status=status,
+                prompt_tokens_est=context.turn_stats.get("prompt_tokens_est"),
+                input_tokens=context.turn_stats.get("input_tokens"),
+                cached_tokens=context.turn_stats.get("cached_tokens"),
+            )
+        except Exception as exc:  # noqa: BLE001
+            print(f"Profile export warning: {exc}")
+            return
+        _trace_turn_phases(context, spans)
 
     if options.on_start:
         options.on_start(context)
+    # Adapters that pool connections can open one while the user types.
+    warm_up = getattr(adapter, "awarm_up", None)
+    warm_up_task = asyncio.create_task(warm_up()) if warm_up is not None else None
 
     try:
-        while True:
+        while not exit_requested:
+            if options.on_idle is not None and idle_stale:
+                if idle_task is not None and idle_task.done():
+                    await _finish_idle()
+                if idle_task is None:
+                    idle_task = asyncio.create_task(asyncio.to_thread(options.on_idle, context))
+                    idle_stale = False
             try:
-                user_text = input("\n> ").strip()
+                user_text = (await _read(input, "\n> ")).strip()
             except (EOFError, KeyboardInterrupt):
                 print("\nBye.")
                 break
             if not user_text:
                 continue
+            input_ns = time.perf_counter_ns()
             clear_previous_line()
             normalized = user_text.strip().lower()
             cmd = normalized.split()[0].rstrip("].,;:") if normalized.startswith("/") else ""
 
             if cmd == "/paste":
-                pasted = _read_paste_input()
+                try:
+                    pasted = await _read(_read_paste_input)
+                except (EOFError, KeyboardInterrupt):
+                    print("\nBye.")
+                    break
                 if pasted is None:
                     continue
                 user_text = pasted
+                input_ns = time.perf_counter_ns()
                 normalized = user_text.strip().lower()
                 cmd = normalized.split()[0].rstrip("].,;:") if normalized.startswith("/") else ""
 
@@ -236,48 +1173,121 @@ def run_cli(
                     message = options.on_reset(context)
                 else:
                     context.history = []
+                    context.history_offset = 0
+                    context.summary = ""
+                    context.summary_upto = 0
                     message = "History cleared."
                 print(message)
+                idle_stale = True
                 continue
 
             handler = options.command_handlers.get(cmd) if cmd else None
             if handler and handler(context, user_text):
+                idle_stale = True
                 continue
 
-            print_user_block(user_text, options.renderer)
-            print()
+            profiler = context.profiler
+            profiler.begin_turn(start_ns=input_ns, input_chars=len(user_text))
+            profiler.record("input", input_ns)
+            with profiler.span("idle_wait"):
+                await _finish_idle()
+            if exit_requested:
+                _end_turn("exited")
+                print("\nBye.")
+                break
+            idle_stale = True
+            with profiler.span("render", part="user"):
+                print_user_block(user_text, options.renderer)
+                print()
             history_before_turn = list(context.history)
             context.history.append(HumanMessage(content=user_text))
             prior_count = len(context.history)
             start_ms = time.perf_counter_ns()
 
             if options.on_before_turn:
-                options.on_before_turn(context, user_text)
+                with profiler.span("before_turn"):
+                    options.on_before_turn(context, user_text)
 
-            system_prompt = options.prompt_builder(context)
-            try:
-                updated_history = run_agent_turn(
+            with profiler.span("prompt_build"):
+                system_prompt = options.prompt_builder(context)
+                turn_context = options.context_builder(context) if options.context_builder else ""
+            renderer = StreamingRenderer(options.renderer)
+            turn_task = asyncio.create_task(
+                arun_agent_turn(
                     context=context,
                     system_prompt=system_prompt,
                     tool_registry=options.tool_registry,
                     tool_postprocessor=options.tool_postprocessor,
+                    context_window=options.context_window,
+                    renderer=renderer,
+                    tool_timeout_s=options.tool_timeout_s,
+                    tool_timeouts=options.tool_timeouts,
+                    turn_context=turn_context,
+                    resilience=options.resilience,
+                    response_cache=options.response_cache,
                 )
+            )
+            try:
+                updated_history = await turn_task
+            except asyncio.CancelledError:
+                if not turn_task.cancelled():
+                    raise
+                renderer.finish()
+                context.history = history_before_turn
+                if exit_requested:
+                    _end_turn("exited")
+                    print("\nBye.")
+                    break
+                _end_turn("cancelled")
+                print("\nTurn cancelled.")
+                continue
             except Exception as exc:  # noqa: BLE001
+                renderer.finish()
                 context.history = history_before_turn
+                _end_turn("error")
                 print(
                     "Turn error: model invocation failed. "
                     f"Please retry or adjust input. Detail: {exc}"
                 )
                 continue
+            finally:
+                turn_task = None
             new_messages = updated_history[prior_count:]
             context.history = updated_history
-            pretty_print_assistant(new_messages, options.renderer)
+            with profiler.span("render", part="assistant"):
+                renderer.finish()
+                pretty_print_assistant(new_messages, options.renderer, include_text=False)
 
             if options.on_after_turn:
-                options.on_after_turn(context, new_messages)
+                with profiler.span("after_turn"):
+                    options.on_after_turn(context, new_messages)
 
             elapsed_ms = (time.perf_counter_ns() - start_ms) / 1_000_000
             print(f"\nTime: {elapsed_ms:.0f} ms")
+            _trace_prompt_cache(context)
+            _trace_resilience(context)
+            _end_turn("ok")
     finally:
-        for sig, handler in previous_handlers.items():
-            signal.signal(sig, handler)
+        try:
+            if context.profiler.active:
+                _end_turn("exited")
+            await _finish_idle()
+            if options.on_shutdown:
+                options.on_shutdown(context)
+        finally:
+            if warm_up_task is not None:
+                warm_up_task.cancel()
+                try:
+                    await warm_up_task
+                except (asyncio.CancelledError, Exception):  # noqa: BLE001
+                    pass
+            aclose = getattr(adapter, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception as exc:  # noqa: BLE001
+                    print(f"Provider close warning: {exc}")
+            for sig in installed:
+                loop.remove_signal_handler(sig)
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 import sys
+import threading
 from pathlib import Path
 from typing import Any
 
@@ -19,24 +20,102 @@ from cli_core import (
     log_env_loaded,
     run_cli,
 )
+from cli_core.context_window import ContextWindowConfig
+from cli_core.runtime import DEFAULT_TOOL_TIMEOUT_S
 from cli_core.lt_memory import JsonlLongTermMemoryStore
+from cli_core.lt_retention import (
+    DEFAULT_SWEEP_INTERVAL_S,
+    SWEEPER_CLOSE_TIMEOUT_S,
+    RetentionPolicy,
+    RetentionSweeper,
+    parse_duration,
+    parse_kind_ttls,
+)
+from cli_core.lt_sqlite import SqliteLongTermMemoryStore
+from cli_core.lt_vectors import DEFAULT_EMBEDDER, create_embedder
 from cli_core.providers.base import MissingEnvError
+from cli_core.profiling import JsonlSpanExporter
 from cli_core.render import print_bordered_block
+from cli_core.resilience import ResilienceConfig
+from cli_core.response_cache import (
+    DEFAULT_MAX_BYTES as DEFAULT_RESPONSE_CACHE_MAX_BYTES,
+    DEFAULT_MAX_ENTRIES as DEFAULT_RESPONSE_CACHE_MAX_ENTRIES,
+    DEFAULT_TTL_S as DEFAULT_RESPONSE_CACHE_TTL_S,
+    ResponseCache,
+)
 
 DEFAULT_USER_ID = "default-user"
 DEFAULT_THREAD_ID = "default-thread"
 ENV_OVERRIDE_VAR = "MEMCLI_ENV_PATH"
 CHECKPOINT_DB = Path("data/checkpoints.sqlite")
+CHECKPOINT_SYNCHRONOUS_VAR = "MEMCLI_CHECKPOINT_SYNCHRONOUS"
+DEFAULT_CHECKPOINT_SYNCHRONOUS = "NORMAL"
+CHECKPOINT_SYNC_WRITES_VAR = "MEMCLI_CHECKPOINT_SYNC_WRITES"
+CHECKPOINT_CODEC_VAR = "MEMCLI_CHECKPOINT_CODEC"
 LT_MEMORY_DIR = Path("data/memory")
+LT_SQLITE_DB = Path("data/memory.sqlite")
+LT_BACKEND_VAR = "MEMCLI_LT_BACKEND"
+LT_FSYNC_VAR = "MEMCLI_LT_FSYNC"
+LT_BACKENDS = ("jsonl", "sqlite")
+DEFAULT_LT_BACKEND = "jsonl"
 LT_RETRIEVAL_K = 3
+LT_RETRIEVAL_VAR = "MEMCLI_LT_RETRIEVAL"
+LT_RETRIEVAL_MODES = ("lexical", "semantic", "recency")
+DEFAULT_LT_RETRIEVAL = "lexical"
+LT_EMBEDDER_VAR = "MEMCLI_LT_EMBEDDER"
+LT_MAX_RECORDS_VAR = "MEMCLI_LT_MAX_RECORDS"
+LT_MAX_BYTES_VAR = "MEMCLI_LT_MAX_BYTES"
+LT_MAX_AGE_VAR = "MEMCLI_LT_MAX_AGE"
+LT_KIND_TTLS_VAR = "MEMCLI_LT_KIND_TTLS"
+LT_SWEEP_INTERVAL_VAR = "MEMCLI_LT_SWEEP_INTERVAL"
 SESSION_SHOW_LIMIT = 12
+SESSION_SHOW_MAX = 200
+RESTORE_WINDOW_VAR = "MEMCLI_RESTORE_WINDOW"
+DEFAULT_RESTORE_WINDOW = 200
+CONTEXT_TOKEN_BUDGET_VAR = "MEMCLI_CONTEXT_TOKEN_BUDGET"
+CONTEXT_KEEP_LAST_VAR = "MEMCLI_CONTEXT_KEEP_LAST"
+TOOL_TIMEOUT_VAR = "MEMCLI_TOOL_TIMEOUT"
+MODEL_ATTEMPTS_VAR = "MEMCLI_MODEL_ATTEMPTS"
+TURN_DEADLINE_VAR = "MEMCLI_TURN_DEADLINE"
+STREAM_IDLE_TIMEOUT_VAR = "MEMCLI_STREAM_IDLE_TIMEOUT"
+HEDGE_PERCENTILE_VAR = "MEMCLI_HEDGE_PERCENTILE"
+RESPONSE_CACHE_DB = Path("data/response_cache.sqlite")
+RESPONSE_CACHE_VAR = "MEMCLI_RESPONSE_CACHE"
+RESPONSE_CACHE_TTL_VAR = "MEMCLI_RESPONSE_CACHE_TTL"
+RESPONSE_CACHE_MAX_ENTRIES_VAR = "MEMCLI_RESPONSE_CACHE_MAX_ENTRIES"
+RESPONSE_CACHE_MAX_BYTES_VAR = "MEMCLI_RESPONSE_CACHE_MAX_BYTES"
+PROFILE_PATH_VAR = "MEMCLI_PROFILE_PATH"
 MEMORY_SHOW_LIMIT = 12
 SHOW_CONTENT_PREVIEW_CHARS = 160
 
 
-def build_prompt(context: RuntimeContext) -> str:
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. Keep answers concise unless asked to expand.\n"
+    "Use the conversation history to resolve follow-ups and pronouns.\n\n"
+    "You may call tool `memory_upsert` to store durable user facts/preferences/"
+    "constraints for future sessions. Only store stable information likely useful "
+    "later. Do not store one-off chatter, transient requests, or uncertain facts.\n\n"
+    "Known memory about the user is given in a system message just before their "
+    "latest message; it is optional context and may be stale."
+)
+
+
+def build_prompt(_context: RuntimeContext) -> str:
+    # Kept constant so the provider can cache it; per-turn memory goes
+    # through `build_memory_context`.
+    return SYSTEM_PROMPT
+
+
+def build_memory_context(context: RuntimeContext) -> str:
     state = context.state if isinstance(context.state, dict) else {}
     records = state.get("lt_recent_records", [])
+    prefetch = state.get("lt_prefetch_used")
+    if prefetch is not None and prefetch["records"] is records:
+        return prefetch["context"]
+    return _render_memory_context(records)
+
+
+def _render_memory_context(records: list[dict[str, Any]]) -> str:
     memory_lines = []
     for record in records:
         content = str(record.get("content", "")).strip()
@@ -45,15 +124,7 @@ def build_prompt(context: RuntimeContext) -> str:
         kind = str(record.get("kind", "semantic")).strip() or "semantic"
         memory_lines.append(f"- [{kind}] {content}")
     known_memory_block = "\n".join(memory_lines) if memory_lines else "(none)"
-    return (
-        "You are a helpful assistant. Keep answers concise unless asked to expand.\n"
-        "Use the conversation history to resolve follow-ups and pronouns.\n\n"
-        "You may call tool `memory_upsert` to store durable user facts/preferences/"
-        "constraints for future sessions. Only store stable information likely useful "
-        "later. Do not store one-off chatter, transient requests, or uncertain facts.\n\n"
-        "Known memory (optional context, may be stale):\n"
-        f"{known_memory_block}"
-    )
+    return f"Known memory (optional context, may be stale):\n{known_memory_block}"
 
 
 def _load_identity() -> dict[str, str]:
@@ -70,6 +141,10 @@ def _clear_session_state(context: RuntimeContext) -> str:
     store = state.get("checkpoint_store")
 
     context.history = []
+    context.history_offset = 0
+    context.summary = ""
+    context.summary_upto = 0
+    context.summary_dirty = False
     if store is not None and hasattr(store, "clear"):
         try:
             cleared = bool(store.clear(thread_id))
@@ -91,9 +166,11 @@ def _clear_memory_state(context: RuntimeContext) -> str:
     try:
         cleared = bool(store.clear(user_id))
     except Exception as exc:  # noqa: BLE001
+        _invalidate_lt_prefetch(state)
         return f"Memory clear warning for active user: {exc}"
 
     state["lt_recent_records"] = []
+    _invalidate_lt_prefetch(state)
     context.state = state
     if not cleared:
         return "Memory already clear for active user (no persisted memory to remove)."
@@ -128,21 +205,36 @@ def _message_role(message: BaseMessage) -> str:
     return str(role)
 
 
-def _session_show_text(context: RuntimeContext) -> str:
+def _session_show_limit(raw: str) -> int:
+    parts = raw.split()
+    if len(parts) < 2:
+        return SESSION_SHOW_LIMIT
+    try:
+        requested = int(parts[1])
+    except ValueError:
+        return SESSION_SHOW_LIMIT
+    return max(1, min(requested, SESSION_SHOW_MAX))
+
+
+def _session_show_text(context: RuntimeContext, limit: int = SESSION_SHOW_LIMIT) -> str:
     state = context.state if isinstance(context.state, dict) else {}
     identity = state.get("identity", {})
     thread_id = identity.get("thread_id", DEFAULT_THREAD_ID)
     history = context.history if isinstance(context.history, list) else []
-    if not history:
+    if not history and context.history_offset <= 0:
         return f"Session empty for active thread (thread_id={thread_id})."
 
-    tail = history[-SESSION_SHOW_LIMIT:]
-    start_index = len(history) - len(tail) + 1
+    if len(history) < limit:
+        # Only the restore window is resident; page older messages in on demand.
+        context.page_in_older(limit - len(history))
+        history = context.history
+    tail = history[-limit:]
+    start_index = context.total_messages - len(tail) + 1
     lines = [
         (
             f"Session view for active thread (thread_id={thread_id}) "
-            f"showing_last={len(tail)} total_messages={len(history)} "
-            f"limit={SESSION_SHOW_LIMIT}:"
+            f"showing_last={len(tail)} total_messages={context.total_messages} "
+            f"limit={limit}:"
         )
     ]
     for idx, message in enumerate(tail, start=start_index):
@@ -186,9 +278,9 @@ def _memory_show_text(context: RuntimeContext) -> str:
     return "\n".join(lines)
 
 
-def _handle_session_show(context: RuntimeContext, _raw: str) -> bool:
+def _handle_session_show(context: RuntimeContext, raw: str) -> bool:
     try:
-        print(_session_show_text(context))
+        print(_session_show_text(context, limit=_session_show_limit(raw)))
     except Exception as exc:  # noqa: BLE001
         print(f"Session show warning for active thread: {_clip_text(exc, limit=180)}")
     return True
@@ -213,24 +305,82 @@ def _on_start(context: RuntimeContext) -> None:
     identity = state.get("identity", {})
     user_id = identity.get("user_id", DEFAULT_USER_ID)
     thread_id = identity.get("thread_id", DEFAULT_THREAD_ID)
-    restored = len(context.history)
+    summary, summary_upto = state.get("restored_summary", ("", 0))
+    context.summary = summary
+    context.summary_upto = summary_upto
+    restored = context.total_messages
     print(f"identity user_id={user_id} thread_id={thread_id}")
-    print(f"session restored_messages={restored}")
+    print(f"session restored_messages={restored} loaded={len(context.history)}")
     print_bordered_block(
         "commands: /session-clear /memory-clear /reset /paste /exit\n"
         "inspect: /session-show /memory-show"
     )
 
 
+def _start_lt_compaction(state: dict[str, Any]) -> None:
+    """Check the active user's LT file for compaction on a worker thread.
+
+    Compaction rewrites and fsyncs the whole file, so it stays off the turn
+    path; at most one runs at a time, and its outcome is printed before the
+    next turn instead of over the prompt.
+    """
+    store = state.get("lt_store")
+    if store is None or not hasattr(store, "maybe_compact"):
+        return
+    running = state.get("lt_compactor")
+    if running is not None and running.is_alive():
+        return
+    user_id = state.get("identity", {}).get("user_id", DEFAULT_USER_ID)
+    worker = threading.Thread(
+        target=_compact_lt,
+        args=(state, store, user_id),
+        name="lt-compaction",
+        daemon=True,
+    )
+    state["lt_compactor"] = worker
+    worker.start()
+
+
+def _compact_lt(state: dict[str, Any], store: Any, user_id: str) -> None:
+    try:
+        report = store.maybe_compact(user_id)
+    except Exception as exc:  # noqa: BLE001
+        state["lt_compaction_notice"] = (
+            f"Long-term memory compaction warning for active user: {exc}"
+        )
+        return
+    if report is not None and (report.merged or report.folded_lines):
+        state["lt_compaction_notice"] = (
+            "Long-term memory compacted for active user: "
+            f"merged={report.merged} folded_lines={report.folded_lines} "
+            f"records={report.records_after} reclaimed_bytes={report.reclaimed_bytes}"
+        )
+
+
+def _report_lt_compaction(state: dict[str, Any]) -> None:
+    notice = state.pop("lt_compaction_notice", None)
+    if notice is not None:
+        print(notice)
+
+
 def _on_after_turn(context: RuntimeContext, _new_messages) -> None:
     state = context.state if isinstance(context.state, dict) else {}
+    _start_lt_compaction(state)
     identity = state.get("identity", {})
     thread_id = identity.get("thread_id", DEFAULT_THREAD_ID)
     store = state.get("checkpoint_store")
     if store is None or not hasattr(store, "save"):
         return
+    summary = (context.summary, context.summary_upto) if context.summary_dirty else None
     try:
-        store.save(thread_id, context.history)
+        with context.profiler.span("checkpoint.save", messages=len(context.history)):
+            store.save(
+                thread_id,
+                context.history,
+                start_seq=context.history_offset,
+                summary=summary,
+            )
+        context.summary_dirty = False
     except Exception as exc:  # noqa: BLE001
         print(
             "Checkpoint write error for this turn. "
@@ -238,32 +388,343 @@ def _on_after_turn(context: RuntimeContext, _new_messages) -> None:
         )
 
 
-def _on_before_turn(context: RuntimeContext, _user_text: str) -> None:
+def _env_int(name: str, default: int) -> int:
+    raw = os.environ.get(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        print(f"Configuration warning: {name}={raw!r} is not an integer; using {default}.")
+        return default
+
+
+def _lt_retrieval_mode() -> str:
+    raw = os.environ.get(LT_RETRIEVAL_VAR, "").strip().lower()
+    if not raw:
+        return DEFAULT_LT_RETRIEVAL
+    if raw not in LT_RETRIEVAL_MODES:
+        print(
+            f"Configuration warning: {LT_RETRIEVAL_VAR}={raw!r} is not one of "
+            f"{', '.join(LT_RETRIEVAL_MODES)}; using {DEFAULT_LT_RETRIEVAL}."
+        )
+        return DEFAULT_LT_RETRIEVAL
+    return raw
+
+
+def _lt_backend() -> str:
+    raw = os.environ.get(LT_BACKEND_VAR, "").strip().lower()
+    if not raw:
+        return DEFAULT_LT_BACKEND
+    if raw not in LT_BACKENDS:
+        print(
+            f"Configuration warning: {LT_BACKEND_VAR}={raw!r} is not one of "
+            f"{', '.join(LT_BACKENDS)}; using {DEFAULT_LT_BACKEND}."
+        )
+        return DEFAULT_LT_BACKEND
+    return raw
+
+
+def _lt_retention_policy() -> RetentionPolicy | None:
+    bounds: dict[str, Any] = {}
+    for name, key, parse in (
+        (LT_MAX_RECORDS_VAR, "max_records", int),
+        (LT_MAX_BYTES_VAR, "max_bytes", int),
+        (LT_MAX_AGE_VAR, "max_age_s", parse_duration),
+        (LT_KIND_TTLS_VAR, "kind_ttls_s", parse_kind_ttls),
+    ):
+        raw = os.environ.get(name, "").strip()
+        if not raw:
+            continue
+        try:
+            bounds[key] = parse(raw)
+        except ValueError as exc:
+            print(f"Configuration warning: {name}={raw!r} ignored: {exc}")
+    policy = RetentionPolicy(**bounds)
+    return policy if policy.enabled else None
+
+
+def _optional_duration(text: str) -> float | None:
+    seconds = parse_duration(text)
+    return seconds if seconds > 0 else None
+
+
+def _hedge_percentile(text: str) -> float:
+    value = float(text)
+    fraction = value / 100 if value > 1 else value
+    if not 0 < fraction <= 1:
+        raise ValueError("use a percentile such as 95 or 0.95")
+    return fraction
+
+
+def _model_resilience() -> ResilienceConfig:
+    settings: dict[str, Any] = {}
+    for name, key, parse in (
+        (MODEL_ATTEMPTS_VAR, "max_attempts", lambda text: max(1, int(text))),
+        (TURN_DEADLINE_VAR, "turn_deadline_s", _optional_duration),
+        (STREAM_IDLE_TIMEOUT_VAR, "idle_timeout_s", _optional_duration),
+        (HEDGE_PERCENTILE_VAR, "hedge_percentile", _hedge_percentile),
+    ):
+        raw = os.environ.get(name, "").strip()
+        if not raw:
+            continue
+        try:
+            settings[key] = parse(raw)
+        except ValueError as exc:
+            print(f"Configuration warning: {name}={raw!r} ignored: {exc}")
+    return ResilienceConfig(**settings)
+
+
+def _response_cache(repo_root: Path) -> ResponseCache | None:
+    if not is_env_enabled([RESPONSE_CACHE_VAR]):
+        return None
+    ttl_s = DEFAULT_RESPONSE_CACHE_TTL_S
+    raw_ttl = os.environ.get(RESPONSE_CACHE_TTL_VAR, "").strip()
+    if raw_ttl:
+        try:
+            ttl_s = parse_duration(raw_ttl)
+        except ValueError as exc:
+            print(f"Configuration warning: {RESPONSE_CACHE_TTL_VAR}={raw_ttl!r} ignored: {exc}")
+    try:
+        return ResponseCache(
+            repo_root / RESPONSE_CACHE_DB,
+            max_entries=_env_int(
+                RESPONSE_CACHE_MAX_ENTRIES_VAR, DEFAULT_RESPONSE_CACHE_MAX_ENTRIES
+            ),
+            max_bytes=_env_int(RESPONSE_CACHE_MAX_BYTES_VAR, DEFAULT_RESPONSE_CACHE_MAX_BYTES),
+            ttl_s=ttl_s,
+        )
+    except Exception as exc:  # noqa: BLE001
+        print(f"Configuration warning: {exc}; response cache disabled.")
+        return None
+
+
+def _span_exporter(repo_root: Path) -> JsonlSpanExporter | None:
+    raw = os.environ.get(PROFILE_PATH_VAR, "").strip()
+    if not raw:
+        return None
+    path = Path(raw).expanduser()
+    try:
+        return JsonlSpanExporter(path if path.is_absolute() else repo_root / path)
+    except OSError as exc:
+        print(f"Configuration warning: {PROFILE_PATH_VAR}={raw!r} ignored: {exc}")
+        return None
+
+
+def _lt_sweep_interval() -> float:
+    raw = os.environ.get(LT_SWEEP_INTERVAL_VAR, "").strip()
+    if not raw:
+        return DEFAULT_SWEEP_INTERVAL_S
+    try:
+        return parse_duration(raw)
+    except ValueError as exc:
+        print(
+            f"Configuration warning: {LT_SWEEP_INTERVAL_VAR}={raw!r} ignored: {exc}; "
+            f"using {DEFAULT_SWEEP_INTERVAL_S:.0f}s."
+        )
+        return DEFAULT_SWEEP_INTERVAL_S
+
+
+def _report_lt_sweep_error(state: dict[str, Any]) -> None:
+    sweeper = state.get("lt_sweeper")
+    if sweeper is None:
+        return
+    error = sweeper.take_error()
+    if error is not None:
+        print(f"Long-term memory retention warning: {error}")
+
+
+def _on_shutdown(context: RuntimeContext) -> None:
+    state = context.state if isinstance(context.state, dict) else {}
+    sweeper = state.get("lt_sweeper")
+    if sweeper is not None:
+        sweeper.close()
+    compactor = state.get("lt_compactor")
+    if compactor is not None:
+        compactor.join(timeout=SWEEPER_CLOSE_TIMEOUT_S)
+    response_cache = state.get("response_cache")
+    if response_cache is not None:
+        response_cache.close()
+    lt_store = state.get("lt_store")
+    if lt_store is not None and hasattr(lt_store, "close"):
+        try:
+            lt_store.close()
+        except Exception as exc:  # noqa: BLE001
+            print(f"Long-term memory close warning: {exc}")
+    store = state.get("checkpoint_store")
+    if store is None or not hasattr(store, "close"):
+        return
+    try:
+        store.close()
+    except Exception as exc:  # noqa: BLE001
+        print(f"Checkpoint close warning for active thread: {exc}")
+
+
+def _report_checkpoint_write_error(state: dict[str, Any]) -> None:
+    store = state.get("checkpoint_store")
+    if store is None or not hasattr(store, "take_error"):
+        return
+    error = store.take_error()
+    if error is not None:
+        print(
+            "Checkpoint write error for a previous turn. "
+            f"Session state may not be fully persisted: {error}"
+        )
+
+
+def _rank_lt_records(
+    store: Any,
+    user_id: str,
+    user_text: str,
+    mode: str,
+) -> list[dict[str, Any]]:
+    if mode == "semantic" and getattr(store, "embedder", None) is not None:
+        return store.semantic_search(user_id, user_text, k=LT_RETRIEVAL_K)
+    return store.search(user_id, user_text, k=LT_RETRIEVAL_K)
+
+
+def _retrieve_lt_records(
+    store: Any,
+    user_id: str,
+    user_text: str,
+    mode: str,
+    recent: list[dict[str, Any]] | None = None,
+) -> list[dict[str, Any]]:
+    """Return the turn's LT records; `recent` is a prefetched backfill list."""
+    if mode == "recency" or not hasattr(store, "search"):
+        return store.load_recent(user_id, k=LT_RETRIEVAL_K)
+    records = _rank_lt_records(store, user_id, user_text, mode)
+    if len(records) < LT_RETRIEVAL_K:
+        # Backfill with the newest records so sparse matches keep recency context.
+        if recent is None:
+            recent = store.load_recent(user_id, k=LT_RETRIEVAL_K * 2)
+        seen = {record.get("id") for record in records}
+        for record in recent:
+            if len(records) >= LT_RETRIEVAL_K:
+                break
+            if record.get("id") not in seen:
+                records.append(record)
+                seen.add(record.get("id"))
+    return records
+
+
+def _on_before_turn(context: RuntimeContext, user_text: str) -> None:
     state = context.state if isinstance(context.state, dict) else {}
     identity = state.get("identity", {})
     user_id = identity.get("user_id", DEFAULT_USER_ID)
     thread_id = identity.get("thread_id", DEFAULT_THREAD_ID)
+    _report_checkpoint_write_error(state)
+    _report_lt_sweep_error(state)
+    _report_lt_compaction(state)
     state["turn_counter"] = int(state.get("turn_counter", 0)) + 1
     state["active_turn_id"] = f"{thread_id}:{state['turn_counter']}"
     state["turn_memory_write_count"] = 0
 
     store = state.get("lt_store")
+    state["lt_prefetch_used"] = None
     if store is None or not hasattr(store, "load_recent"):
         state["lt_recent_records"] = []
         context.state = state
         return
 
-    try:
-        state["lt_recent_records"] = store.load_recent(user_id, k=LT_RETRIEVAL_K)
-    except Exception as exc:  # noqa: BLE001
-        print(f"Long-term memory retrieval warning for active user: {exc}")
-        state["lt_recent_records"] = []
+    mode = state.get("lt_retrieval", DEFAULT_LT_RETRIEVAL)
+    prefetch = state.pop("lt_prefetch", None)
+    if prefetch is not None and (
+        prefetch["generation"] != state.get("lt_generation", 0)
+        or prefetch["user_id"] != user_id
+        or prefetch["mode"] != mode
+    ):
+        prefetch = None
+    prefetch_hit = False
+    with context.profiler.span("lt.load", mode=mode) as span:
+        if prefetch is not None and mode == "recency":
+            records = prefetch["records"]
+        else:
+            try:
+                records = _retrieve_lt_records(
+                    store,
+                    user_id,
+                    user_text,
+                    mode,
+                    recent=prefetch["recent"] if prefetch is not None else None,
+                )
+            except Exception as exc:  # noqa: BLE001
+                print(f"Long-term memory retrieval warning for active user: {exc}")
+                records = []
+        if prefetch is not None and [record["id"] for record in records] == [
+            record["id"] for record in prefetch["records"]
+        ]:
+            # Recency mode, or a query with no matches: the prefetched block
+            # is exactly this turn's.
+            records = prefetch["records"]
+            state["lt_prefetch_used"] = prefetch
+            prefetch_hit = True
+        state["lt_recent_records"] = records
+        if span is not None:
+            span.attributes["records"] = len(records)
+            span.attributes["prefetch_hit"] = prefetch_hit
+    if context.trace_requests and prefetch is not None:
+        print(f"[trace] lt prefetch {'hit' if prefetch_hit else 'warm'}")
+    if context.trace_requests and hasattr(store, "cache_stats"):
+        stats = store.cache_stats()
+        print(f"[trace] lt cache hits={stats['hits']} misses={stats['misses']}")
+    if context.trace_requests and state.get("lt_sweeper") is not None:
+        sweeps = state["lt_sweeper"].stats()
+        print(
+            f"[trace] lt retention sweeps={sweeps['sweeps']} "
+            f"aged_out={sweeps['aged_out']} evicted={sweeps['evicted']}"
+        )
     context.state = state
 
 
+def _on_idle(context: RuntimeContext) -> None:
+    """Prefetch the query-independent part of the next turn's LT retrieval.
+
+    Recency retrieval does not depend on the user's text, so its records and
+    the context block built from them are used as-is by the next turn unless a
+    memory write, `/memory-clear` or `/reset` bumped `lt_generation` since.
+    For lexical and semantic retrieval this builds the store's cached index
+    and vectors and keeps the backfill records, so the turn only runs its
+    query and the merge; the block prefetched from the newest records is
+    reused when the query matches nothing.
+    """
+    state = context.state if isinstance(context.state, dict) else {}
+    store = state.get("lt_store")
+    if store is None or not hasattr(store, "load_recent"):
+        return
+    user_id = state.get("identity", {}).get("user_id", DEFAULT_USER_ID)
+    mode = state.get("lt_retrieval", DEFAULT_LT_RETRIEVAL)
+    generation = state.get("lt_generation", 0)
+    try:
+        if mode == "recency" or not hasattr(store, "search"):
+            recent = store.load_recent(user_id, k=LT_RETRIEVAL_K)
+        else:
+            recent = store.load_recent(user_id, k=LT_RETRIEVAL_K * 2)
+            _rank_lt_records(store, user_id, "", mode)
+    except Exception:  # noqa: BLE001
+        # The turn retries the read and reports the failure.
+        return
+    if state.get("lt_generation", 0) != generation:
+        return
+    records = recent[:LT_RETRIEVAL_K]
+    state["lt_prefetch"] = {
+        "generation": generation,
+        "user_id": user_id,
+        "mode": mode,
+        "records": records,
+        "recent": recent,
+        "context": _render_memory_context(records),
+    }
+
+
+def _invalidate_lt_prefetch(state: dict[str, Any]) -> None:
+    state["lt_generation"] = int(state.get("lt_generation", 0)) + 1
+    state.pop("lt_prefetch", None)
+
+
 def _build_memory_upsert_tool(
     state: dict[str, Any],
-    store: JsonlLongTermMemoryStore,
+    store: JsonlLongTermMemoryStore | SqliteLongTermMemoryStore,
 ):
     @tool
     def memory_upsert(
@@ -271,11 +732,14 @@ def _build_memory_upsert_tool(
         kind: str = "semantic",
         confidence: float | None = None,
         source_turn_id: str | None = None,
+        subject: str | None = None,
     ) -> str:
         """Store durable user memory for use across sessions.
 
         Save only stable user facts/preferences/constraints likely useful in future turns.
         Skip one-off chatter, transient requests, and uncertain information.
+        Set `subject` to a short stable key (e.g. "favorite language") so a later
+        fact about the same subject updates this one instead of adding another.
         """
 
         cleaned = content.strip()
@@ -287,20 +751,23 @@ def _build_memory_upsert_tool(
         turn_id = source_turn_id or str(state.get("active_turn_id", "")).strip() or None
         memory_kind = kind.strip() or "semantic"
         try:
-            record = store.append(
+            record, updated = store.upsert(
                 user_id=user_id,
                 content=cleaned,
                 kind=memory_kind,
                 confidence=confidence,
                 source_turn_id=turn_id,
+                subject=(subject or "").strip() or None,
             )
         except Exception as exc:  # noqa: BLE001
             return (
                 "Memory write failed for active user. "
                 f"The session will continue without durable memory for this turn: {exc}"
             )
+        _invalidate_lt_prefetch(state)
+        action = "updated" if updated else "saved"
         return (
-            f"Memory saved for active user. id={record['id']} "
+            f"Memory {action} for active user. id={record['id']} "
             f"kind={record['kind']}."
         )
 
@@ -330,7 +797,11 @@ def main() -> None:
 
     tools = ToolRegistry()
     try:
-        from cli_core.checkpoints import SqliteCheckpointStore
+        from cli_core.checkpoints import (
+            DEFAULT_CODEC,
+            SqliteCheckpointStore,
+            WriteBehindCheckpointStore,
+        )
     except ModuleNotFoundError as exc:
         print(
             "Configuration error: missing dependency for checkpoint persistence. "
@@ -339,24 +810,87 @@ def main() -> None:
         print(f"Detail: {exc}")
         sys.exit(1)
 
-    checkpoint_store = SqliteCheckpointStore(repo_root / CHECKPOINT_DB)
-    lt_store = JsonlLongTermMemoryStore(repo_root / LT_MEMORY_DIR)
+    try:
+        checkpoint_store = SqliteCheckpointStore(
+            repo_root / CHECKPOINT_DB,
+            synchronous=os.environ.get(
+                CHECKPOINT_SYNCHRONOUS_VAR, DEFAULT_CHECKPOINT_SYNCHRONOUS
+            ),
+            codec=os.environ.get(CHECKPOINT_CODEC_VAR, DEFAULT_CODEC),
+        )
+    except Exception as exc:  # noqa: BLE001
+        print(f"Configuration error: {exc}")
+        sys.exit(1)
+    if not is_env_enabled([CHECKPOINT_SYNC_WRITES_VAR]):
+        checkpoint_store = WriteBehindCheckpointStore(checkpoint_store)
+    lt_backend = _lt_backend()
+    lt_retrieval = _lt_retrieval_mode()
+    lt_embedder = None
+    if lt_retrieval == "semantic" and lt_backend != "jsonl":
+        print(
+            f"Configuration warning: semantic LT retrieval needs the jsonl backend; "
+            f"using lexical LT retrieval with {lt_backend}."
+        )
+        lt_retrieval = "lexical"
+    if lt_retrieval == "semantic":
+        try:
+            lt_embedder = create_embedder(os.environ.get(LT_EMBEDDER_VAR, DEFAULT_EMBEDDER))
+        except Exception as exc:  # noqa: BLE001
+            print(f"Configuration warning: {exc}; using lexical LT retrieval.")
+            lt_retrieval = "lexical"
+    lt_retention = _lt_retention_policy()
+    if lt_retention is not None and lt_backend != "jsonl":
+        print(
+            "Configuration warning: LT retention limits need the jsonl backend; "
+            f"ignoring them with {lt_backend}."
+        )
+        lt_retention = None
+    lt_store: Any
+    if lt_backend == "sqlite":
+        try:
+            lt_store = SqliteLongTermMemoryStore(repo_root / LT_SQLITE_DB)
+        except Exception as exc:  # noqa: BLE001
+            print(f"Configuration error: {exc}")
+            sys.exit(1)
+    else:
+        lt_store = JsonlLongTermMemoryStore(
+            repo_root / LT_MEMORY_DIR,
+            embedder=lt_embedder,
+            fsync=is_env_enabled([LT_FSYNC_VAR]),
+            retention=lt_retention,
+        )
     state: dict[str, Any] = {
         "identity": _load_identity(),
         "checkpoint_store": checkpoint_store,
         "lt_store": lt_store,
+        "lt_sweeper": (
+            RetentionSweeper(lt_store, _lt_sweep_interval()) if lt_retention is not None else None
+        ),
         "lt_recent_records": [],
+        "lt_retrieval": lt_retrieval,
+        "lt_generation": 0,
+        "response_cache": _response_cache(repo_root),
     }
     tools.register(_build_memory_upsert_tool(state, lt_store))
     thread_id = state["identity"]["thread_id"]
+    restored_offset = 0
     try:
-        state["restored_from_checkpoint"] = checkpoint_store.load(thread_id)
+        restored_offset, state["restored_from_checkpoint"] = checkpoint_store.load_tail(
+            thread_id,
+            _env_int(RESTORE_WINDOW_VAR, DEFAULT_RESTORE_WINDOW),
+        )
+        state["restored_summary"] = checkpoint_store.load_summary(thread_id)
     except Exception as exc:  # noqa: BLE001
         print(f"Checkpoint load warning for active thread: {exc}")
+        restored_offset = 0
         state["restored_from_checkpoint"] = []
 
+    def _page_history(start: int, end: int) -> list[BaseMessage]:
+        return checkpoint_store.load_range(thread_id, start, end)
+
     options = RuntimeOptions(
         prompt_builder=build_prompt,
+        context_builder=build_memory_context,
         tool_registry=tools,
         command_handlers={
             "/session-clear": _handle_session_clear,
@@ -368,6 +902,18 @@ def main() -> None:
         on_reset=_handle_reset,
         on_before_turn=_on_before_turn,
         on_after_turn=_on_after_turn,
+        on_idle=_on_idle,
+        on_shutdown=_on_shutdown,
+        context_window=ContextWindowConfig(
+            token_budget=_env_int(
+                CONTEXT_TOKEN_BUDGET_VAR, ContextWindowConfig.token_budget
+            ),
+            keep_last=_env_int(CONTEXT_KEEP_LAST_VAR, ContextWindowConfig.keep_last),
+        ),
+        tool_timeout_s=float(_env_int(TOOL_TIMEOUT_VAR, int(DEFAULT_TOOL_TIMEOUT_S))),
+        resilience=_model_resilience(),
+        response_cache=state["response_cache"],
+        span_exporter=_span_exporter(repo_root),
         renderer=RendererConfig(assistant_label="Agent", user_label="You"),
         trace_requests=trace_enabled,
     )
@@ -377,6 +923,8 @@ def main() -> None:
         options,
         state=state,
         initial_history=state.get("restored_from_checkpoint", []),
+        history_offset=restored_offset,
+        history_pager=_page_history,
     )
 
 
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, List
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from cli_core.checkpoints import SqliteCheckpointStore, available_codecs
+
+DEFAULT_SIZES = (100, 1_000, 10_000)
+TURN_MESSAGES = 4
+
+
+def synthetic_turn(idx: int) -> List[BaseMessage]:
+    call_id = f"call_{idx:06d}"
+    metadata = {
+        "finish_reason": "tool_calls",
+        "model_name": "kimi-k2.5",
+        "model_provider": "openai",
+        "system_fingerprint": None,
+    }
+    return [
+        HumanMessage(content=f"Turn {idx}: remember that I prefer Python for scripting tasks."),
+        AIMessage(
+            content="",
+            tool_calls=[
+                {
+                    "name": "memory_upsert",
+                    "args": {"content": "User prefers Python for scripting.", "kind": "semantic"},
+                    "id": call_id,
+                    "type": "tool_call",
+                }
+            ],
+            response_metadata=metadata,
+            usage_metadata={"input_tokens": 900 + idx, "output_tokens": 40, "total_tokens": 940 + idx},
+        ),
+        ToolMessage(
+            content=f"Memory saved for active user. id=00000000-0000-0000-0000-{idx:012d} kind=semantic.",
+            tool_call_id=call_id,
+            name="memory_upsert",
+        ),
+        AIMessage(
+            content=f"Noted for turn {idx}. I'll default to Python examples from now on.",
+            response_metadata={**metadata, "finish_reason": "stop"},
+            usage_metadata={"input_tokens": 980 + idx, "output_tokens": 25, "total_tokens": 1005 + idx},
+        ),
+    ]
+
+
+def db_size(path: Path) -> int:
+    return sum(
+        candidate.stat().st_size
+        for candidate in (path, path.with_name(path.name + "-wal"))
+        if candidate.exists()
+    )
+
+
+def bench(codec: str, size: int) -> str:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "checkpoints.sqlite"
+        store = SqliteCheckpointStore(db_path, codec=codec)
+        history: List[BaseMessage] = []
+        save_ns = 0
+        turn = 0
+        while len(history) < size:
+            history.extend(synthetic_turn(turn)[: size - len(history)])
+            turn += 1
+            start = time.perf_counter_ns()
+            store.save("bench-thread", history)
+            save_ns += time.perf_counter_ns() - start
+        with store._connect() as conn:  # noqa: SLF001
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size_bytes = db_size(db_path)
+
+        start = time.perf_counter_ns()
+        restored = store.load("bench-thread")
+        load_ms = (time.perf_counter_ns() - start) / 1_000_000
+        store.close()
+        if len(restored) != size:
+            raise RuntimeError(f"codec {codec} restored {len(restored)} of {size} messages")
+
+    save_ms = save_ns / 1_000_000
+    return (
+        f"{codec:<8} {size:>7} {size_bytes / 1024:>10.1f} "
+        f"{save_ms:>10.1f} {save_ms / turn:>10.3f} {load_ms:>9.1f}"
+    )
+
+
+def run(codecs: Iterable[str], sizes: Iterable[int]) -> None:
+    print(f"{'codec':<8} {'messages':>7} {'db_kib':>10} {'save_ms':>10} {'ms/turn':>10} {'load_ms':>9}")
+    for size in sizes:
+        for codec in codecs:
+            print(bench(codec, size))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark checkpoint DB size and save/load time per codec."
+    )
+    parser.add_argument("--codec", action="append", choices=available_codecs())
+    parser.add_argument("--size", action="append", type=int)
+    args = parser.parse_args()
+    run(args.codec or available_codecs(), args.size or DEFAULT_SIZES)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from cli_core.lt_memory import JsonlLongTermMemoryStore, iter_lines_reverse
+
+DEFAULT_SIZES_MB = (1, 100, 1024)
+USER_ID = "bench-user"
+RECENT_K = 12
+DEFAULT_REPEAT = 3
+
+
+def write_file(path: Path, size_mb: int) -> int:
+    """Fill `path` with ~`size_mb` MiB of records, one version in ten superseded."""
+    target = size_mb * 1024 * 1024
+    written = 0
+    count = 0
+    with path.open("w", encoding="utf-8") as handle:
+        while written < target:
+            lines = []
+            for _ in range(1000):
+                record = {
+                    "id": f"00000000-0000-0000-0000-{count:012d}",
+                    "user_id": USER_ID,
+                    "content": f"Fact {count}: the user prefers tool {count % 97} for task {count % 13}.",
+                    "kind": "semantic",
+                    "created_at": "2026-10-17T00:00:00.000000Z",
+                    "updated_at": "2026-10-17T00:00:00.000000Z",
+                    "source_turn_id": f"turn-{count}",
+                }
+                lines.append(json.dumps(record, ensure_ascii=True))
+                if count % 10 == 9:
+                    tombstone = {"op": "tombstone", "id": record["id"], "user_id": USER_ID}
+                    lines.append(json.dumps(tombstone, ensure_ascii=True))
+                    lines.append(json.dumps({**record, "content": f"{record['content']} (updated)"}))
+                count += 1
+            chunk = "\n".join(lines) + "\n"
+            handle.write(chunk)
+            written += len(chunk)
+    return count
+
+
+def text_io_load_recent(path: Path, k: int) -> List[Dict[str, Any]]:
+    # The original reader: decode every line through text I/O, keep the tail.
+    required = JsonlLongTermMemoryStore.REQUIRED_FIELDS
+    records = []
+    with path.open("r", encoding="utf-8") as handle:
+        for raw_line in handle:
+            line = raw_line.strip()
+            if not line:
+                continue
+            parsed = json.loads(line)
+            if isinstance(parsed, dict) and required.issubset(parsed.keys()):
+                records.append(parsed)
+    return list(reversed(records[-k:]))
+
+
+def block_reader_load_recent(path: Path, k: int) -> List[Dict[str, Any]]:
+    # Seek-and-read blocks from the tail, decoding each line fully.
+    records: List[Dict[str, Any]] = []
+    with path.open("rb") as handle:
+        for _offset, raw_line in iter_lines_reverse(handle):
+            if not raw_line.strip():
+                continue
+            parsed = json.loads(raw_line)
+            if parsed.get("op") == "tombstone":
+                continue
+            records.append(parsed)
+            if len(records) >= k:
+                break
+    return records
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> float:
+    # Best of `repeat` runs: the minimum is the least noisy estimate.
+    best = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter_ns()
+        fn()
+        elapsed = (time.perf_counter_ns() - start) / 1_000_000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench(size_mb: int, repeat: int) -> Iterable[str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JsonlLongTermMemoryStore(Path(tmp) / "memory")
+        path = store._user_path(USER_ID)  # noqa: SLF001
+        path.parent.mkdir(parents=True, exist_ok=True)
+        count = write_file(path, size_mb)
+        actual_mb = path.stat().st_size / (1024 * 1024)
+
+        cases = [
+            ("text-io recent", lambda: text_io_load_recent(path, RECENT_K)),
+            ("block recent", lambda: block_reader_load_recent(path, RECENT_K)),
+            ("mmap recent", lambda: store._scan_recent(path, USER_ID, RECENT_K)),  # noqa: SLF001
+            ("mmap full scan", lambda: store._scan_all(path, USER_ID)),  # noqa: SLF001
+        ]
+        for name, fn in cases:
+            yield f"{actual_mb:>8.1f} {count:>10} {name:<16} {timed(fn, repeat):>10.1f}"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark LT JSONL readers (text I/O, block tail read, mmap)."
+    )
+    parser.add_argument("--size-mb", action="append", type=int)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+    print(f"{'file_mb':>8} {'records':>10} {'reader':<16} {'ms':>10}")
+    for size_mb in args.size_mb or DEFAULT_SIZES_MB:
+        for line in bench(size_mb, args.repeat):
+            print(line, flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
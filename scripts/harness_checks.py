@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 import io
+import json
 import os
+import sqlite3
 import subprocess
 import sys
 import tempfile
+import time
 from contextlib import redirect_stdout
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Iterable, List
 from unittest.mock import patch
@@ -14,11 +18,32 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    HumanMessage,
+    ToolMessage,
+    messages_to_dict,
+)
 
-from cli_core.checkpoints import SqliteCheckpointStore
-from cli_core.lt_memory import JsonlLongTermMemoryStore
-from cli_core.runtime import RuntimeOptions, run_cli, stream_model_turn
+from cli_core.checkpoints import (
+    CheckpointStoreError,
+    SqliteCheckpointStore,
+    WriteBehindCheckpointStore,
+)
+from cli_core.lt_memory import JsonlLongTermMemoryStore, LongTermMemoryStoreError
+from cli_core.lt_retention import RetentionPolicy, RetentionSweeper
+from cli_core.lt_sqlite import SqliteLongTermMemoryStore
+from cli_core.lt_vectors import HashingEmbedder, VectorIndexError
+from cli_core.context_window import ContextWindowConfig
+from cli_core.render import RendererConfig, StreamingRenderer, wrap_paragraphs
+from cli_core.runtime import (
+    RuntimeContext,
+    RuntimeOptions,
+    astream_model_turn,
+    run_agent_turn,
+    run_cli,
+)
 from cli_core.tools import ToolRegistry
 
 
@@ -65,15 +90,6 @@ class FakeAdapter:
         return "Kimi"
 
 
-class FakeIndicatorThread:
-    def __init__(self) -> None:
-        self.join_calls = 0
-
-    def join(self, timeout: float | None = None) -> None:
-        _ = timeout
-        self.join_calls += 1
-
-
 def check_startup_command_surface() -> tuple[bool, str]:
     env = os.environ.copy()
     env["MOONSHOT_API_KEY"] = env.get("MOONSHOT_API_KEY", "dummy-stage4-key")
@@ -94,29 +110,85 @@ def check_startup_command_surface() -> tuple[bool, str]:
     return ok, output
 
 
+def _fake_spinner(events: List[Any]):
+    # Stands in for `run_thinking_indicator`: records its stop event and
+    # idles until it is set or the task is cancelled.
+    async def spinner(stop_event: Any) -> None:
+        events.append(stop_event)
+        await stop_event.wait()
+
+    return spinner
+
+
 def check_spinner_cleanup_on_stream_failure() -> tuple[bool, str]:
-    events = []
-    threads: List[FakeIndicatorThread] = []
+    import asyncio
 
-    def fake_start_thinking_indicator(stop_event):
-        events.append(stop_event)
-        thread = FakeIndicatorThread()
-        threads.append(thread)
-        return thread
+    events: List[Any] = []
 
-    bound_model = FakeBoundModel(fail_first_stream=True)
-    with patch("cli_core.runtime.start_thinking_indicator", fake_start_thinking_indicator):
+    async def run() -> tuple[str, List[Any]]:
         try:
-            _ = stream_model_turn(bound_model, [HumanMessage(content="hello")])
-            return False, "expected stream_model_turn to raise on forced failure"
+            await astream_model_turn(
+                FakeBoundModel(fail_first_stream=True), [HumanMessage(content="hello")]
+            )
         except RuntimeError as exc:
-            error = str(exc)
+            await asyncio.sleep(0)
+            leftover = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            return str(exc), leftover
+        raise CheckFailed("expected astream_model_turn to raise on forced failure")
 
-    require(events, "spinner event was not created")
-    require(threads, "spinner indicator thread was not created")
+    with patch("cli_core.runtime.run_thinking_indicator", _fake_spinner(events)):
+        error, leftover = asyncio.run(run())
+
+    require(events, "spinner task was not started")
     require(events[0].is_set(), "spinner stop_event was not set on failure path")
-    require(threads[0].join_calls == 1, "spinner thread join was not called exactly once")
-    return True, f"caught={error}; stop_event_set={events[0].is_set()}; join_calls={threads[0].join_calls}"
+    require(not leftover, f"spinner task left running: {leftover}")
+    return True, f"caught={error}; stop_event_set={events[0].is_set()}; spinner task ended"
+
+
+def check_streaming_render_and_first_token() -> tuple[bool, str]:
+    import asyncio
+
+    text = (
+        "\nStreaming output should wrap exactly like the buffered renderer did, "
+        "one word at a time, even when chunk boundaries split words in half.\n\n"
+        "A second paragraph follows a blank line.\nAnd a short third line.\n"
+    )
+    pieces = [text[idx : idx + 7] for idx in range(0, len(text), 7)]
+    events: List[Any] = []
+    spinner_state: dict[str, Any] = {}
+
+    class ChunkedModel:
+        async def astream(self, _messages: List[Any], config: dict[str, Any] | None = None):
+            _ = config
+            yield AIMessageChunk(content="")
+            for idx, piece in enumerate(pieces):
+                if idx == 1:
+                    spinner_state["stopped_after_first"] = events[0].is_set()
+                yield AIMessageChunk(content=piece)
+
+    config = RendererConfig(width=40)
+    stdout = io.StringIO()
+    stats: dict[str, Any] = {}
+    with (
+        patch("cli_core.runtime.run_thinking_indicator", _fake_spinner(events)),
+        redirect_stdout(stdout),
+    ):
+        renderer = StreamingRenderer(config)
+        message = asyncio.run(
+            astream_model_turn(
+                ChunkedModel(), [HumanMessage(content="hi")], renderer=renderer, stats=stats
+            )
+        )
+        renderer.finish()
+
+    expected = wrap_paragraphs(text.strip(), width=config.width, indent=config.indent)
+    rendered = stdout.getvalue().replace("\r" + " " * 40 + "\r", "")
+    body = rendered.split("\n", 2)[2].rstrip("\n")
+    require(message.content == text, "accumulated message lost content")
+    require(body == expected, f"streamed wrap differs:\n{body!r}\n!=\n{expected!r}")
+    require(spinner_state.get("stopped_after_first") is True, "spinner kept running past first token")
+    require(stats["ttft_ms"] is not None and stats["output_tokens"] > 0, f"missing stats: {stats}")
+    return True, f"{len(pieces)} chunks wrapped to {len(expected.splitlines())} lines; ttft recorded"
 
 
 def check_turn_failure_recovery_and_model_reuse() -> tuple[bool, str]:
@@ -157,6 +229,872 @@ def check_turn_failure_recovery_and_model_reuse() -> tuple[bool, str]:
     )
 
 
+def check_parallel_tool_calls() -> tuple[bool, str]:
+    import asyncio
+
+    from langchain_core.tools import StructuredTool
+
+    from cli_core.runtime import arun_agent_turn
+
+    writes: List[str] = []
+    finished: List[str] = []
+
+    def slow_lookup(key: str) -> str:
+        time.sleep(0.3)
+        return f"value for {key}"
+
+    def hang(key: str) -> str:
+        time.sleep(1.0)
+        finished.append(f"hang {key}")
+        return f"late {key}"
+
+    def memory_upsert(content: str) -> str:
+        time.sleep(0.1)
+        writes.append(content)
+        return f"saved {content}"
+
+    async def async_lookup(key: str) -> str:
+        await asyncio.sleep(0.3)
+        return f"async value for {key}"
+
+    async def async_hang(key: str) -> str:
+        try:
+            await asyncio.sleep(5)
+        finally:
+            finished.append(f"async_hang {key} closed")
+        return f"late {key}"
+
+    registry = ToolRegistry()
+    for func in (slow_lookup, hang, memory_upsert):
+        registry.register(StructuredTool.from_function(func, description=func.__name__))
+    registry.register(
+        StructuredTool.from_function(coroutine=async_lookup, description="async lookup")
+    )
+    registry.register(StructuredTool.from_function(coroutine=async_hang, description="async hang"))
+    calls = [
+        {"name": "slow_lookup", "args": {"key": "a"}, "id": "call-1"},
+        {"name": "memory_upsert", "args": {"content": "first"}, "id": "call-2"},
+        {"name": "async_lookup", "args": {"key": "b"}, "id": "call-3"},
+        {"name": "memory_upsert", "args": {"content": "second"}, "id": "call-4"},
+        {"name": "hang", "args": {"key": "c"}, "id": "call-5"},
+        {"name": "slow_lookup", "args": {"key": "d"}, "id": "call-6"},
+        {"name": "missing_tool", "args": {}, "id": "call-7"},
+        {"name": "async_hang", "args": {"key": "e"}, "id": "call-8"},
+    ]
+
+    class ToolCallingModel:
+        def __init__(self) -> None:
+            self.stream_calls = 0
+
+        async def astream(self, _messages: List[Any], config: dict[str, Any] | None = None):
+            _ = config
+            self.stream_calls += 1
+            if self.stream_calls == 1:
+                yield AIMessageChunk(content="", tool_calls=calls)
+            else:
+                yield AIMessageChunk(content="done")
+
+    adapter = FakeAdapter(ToolCallingModel())  # type: ignore[arg-type]
+    context = RuntimeContext(
+        adapter=adapter,
+        state={"turn_memory_write_count": 0},
+        trace_requests=True,
+    )
+
+    async def run_turn() -> tuple[List[Any], float, List[str]]:
+        started = time.monotonic()
+        messages = await arun_agent_turn(
+            context,
+            "system",
+            registry,
+            tool_timeouts={"hang": 0.5, "async_hang": 0.5},
+        )
+        # Snapshot before `asyncio.run` waits out the abandoned sync thread.
+        return messages, time.monotonic() - started, list(finished)
+
+    stdout = io.StringIO()
+    with redirect_stdout(stdout):
+        messages, turn_s, finished_at_return = asyncio.run(run_turn())
+    trace = [line for line in stdout.getvalue().splitlines() if "[trace] tool calls=" in line]
+    require(len(trace) == 1, f"tool step not traced: {stdout.getvalue()!r}")
+    elapsed = float(trace[0].split()[-2]) / 1000
+    tool_messages = [message for message in messages if isinstance(message, ToolMessage)]
+    contents = [str(message.content) for message in tool_messages]
+    require(
+        [message.tool_call_id for message in tool_messages] == [call["id"] for call in calls],
+        f"tool messages out of order: {[message.tool_call_id for message in tool_messages]}",
+    )
+    require(contents[0] == "value for a" and contents[5] == "value for d", f"bad results: {contents}")
+    require(contents[2] == "async value for b", f"async tool not awaited: {contents[2]}")
+    require(writes == ["first"] and "only one memory_upsert" in contents[3], f"guard broke: {writes}")
+    require("timed out after 0.5s" in contents[4], f"sync timeout not enforced: {contents[4]}")
+    require("timed out after 0.5s" in contents[7], f"async timeout not enforced: {contents[7]}")
+    require(contents[6] == "Unknown tool: missing_tool", f"unknown tool: {contents[6]}")
+    require(elapsed < 0.9, f"tool calls ran serially: {elapsed:.2f}s")
+    require(
+        turn_s < 0.9 and finished_at_return == ["async_hang e closed"],
+        f"turn waited on a timed-out tool: {turn_s:.2f}s {finished_at_return}",
+    )
+    return True, (
+        f"{len(calls)} calls in {elapsed:.2f}s via ainvoke; one write admitted; "
+        "sync and async timeouts reported without blocking the turn"
+    )
+
+
+def check_async_runtime_cancel_keeps_session() -> tuple[bool, str]:
+    import asyncio
+    import signal
+    import threading
+
+    events: List[str] = []
+
+    class AsyncModel:
+        def __init__(self) -> None:
+            self.calls = 0
+
+        async def astream(self, _messages: List[Any], config: dict[str, Any] | None = None):
+            _ = config
+            self.calls += 1
+            if self.calls == 1:
+                try:
+                    yield AIMessageChunk(content="partial ")
+                    # Ctrl-C arrives while the request is still streaming.
+                    threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGINT)).start()
+                    await asyncio.sleep(5)
+                    yield AIMessageChunk(content="never shown")
+                finally:
+                    events.append("stream closed")
+            else:
+                yield AIMessageChunk(content="Second turn answer")
+
+    model = AsyncModel()
+    adapter = FakeAdapter(model)  # type: ignore[arg-type]
+    options = RuntimeOptions(
+        prompt_builder=lambda _context: "You are a helpful assistant.",
+        tool_registry=ToolRegistry(),
+    )
+    histories: List[int] = []
+    options.on_after_turn = lambda context, _new: histories.append(len(context.history))
+    scripted_inputs = iter(["slow question", "next question", "/exit"])
+    stdout = io.StringIO()
+    started = time.monotonic()
+    with (
+        patch("builtins.input", side_effect=lambda _prompt="": next(scripted_inputs)),
+        redirect_stdout(stdout),
+    ):
+        run_cli(adapter=adapter, options=options, state={}, initial_history=[])
+    elapsed = time.monotonic() - started
+    output = stdout.getvalue()
+    require("Turn cancelled." in output, f"cancel not reported: {output!r}")
+    require(events == ["stream closed"], "in-flight stream was not closed on cancel")
+    require("never shown" not in output and "Second turn answer" in output, "session not kept")
+    require(histories == [2], f"cancelled turn left history behind: {histories}")
+    require(elapsed < 3, f"cancel waited for the stream: {elapsed:.1f}s")
+    return True, f"cancelled in {elapsed:.2f}s; next turn answered; history rolled back"
+
+
+def check_stable_prompt_prefix_and_cached_tokens() -> tuple[bool, str]:
+    class RecordingModel:
+        def __init__(self) -> None:
+            self.prompts: List[List[Any]] = []
+
+        def stream(self, messages: List[Any], config: dict[str, Any] | None = None):
+            _ = config
+            self.prompts.append(list(messages))
+            cached = 0 if len(self.prompts) == 1 else 40
+            yield AIMessageChunk(content=f"answer {len(self.prompts)}")
+            yield AIMessageChunk(
+                content="",
+                usage_metadata={
+                    "input_tokens": 50,
+                    "output_tokens": 2,
+                    "total_tokens": 52,
+                    "input_token_details": {"cache_read": cached},
+                },
+            )
+
+    model = RecordingModel()
+    context = RuntimeContext(adapter=FakeAdapter(model))  # type: ignore[arg-type]
+    turns = [("first?", "Known memory: tea"), ("second?", "Known memory: coffee")]
+    for question, memory_block in turns:
+        context.history.append(HumanMessage(content=question))
+        with redirect_stdout(io.StringIO()):
+            context.history = run_agent_turn(
+                context=context,
+                system_prompt="static instructions",
+                tool_registry=ToolRegistry(),
+                turn_context=memory_block,
+            )
+    first, second = model.prompts
+    require(
+        [message.content for message in first[-2:]] == ["Known memory: tea", "first?"],
+        f"turn context not placed before the user message: {first}",
+    )
+    require(
+        [message.content for message in second[:-2]]
+        == ["static instructions", "first?", "answer 1"],
+        f"previous request is not a stable prefix of the next: {second}",
+    )
+    require(
+        second[-2].content == "Known memory: coffee" and len(context.history) == 4,
+        "turn context leaked into history",
+    )
+    stats = context.turn_stats
+    require(
+        stats["input_tokens"] == 50 and stats["cached_tokens"] == 40,
+        f"cached tokens not tracked: {stats}",
+    )
+    return True, f"prefix stable across turns; cached_tokens={stats['cached_tokens']}/50"
+
+
+def check_model_retry_timeouts_and_hedging() -> tuple[bool, str]:
+    import asyncio
+
+    from cli_core.resilience import (
+        ModelDeadlineError,
+        ModelIdleTimeoutError,
+        ResilienceConfig,
+        ResilienceState,
+    )
+    from cli_core.runtime import _apply_context_window
+
+    class StatusError(Exception):
+        def __init__(self, status_code: int) -> None:
+            super().__init__(f"HTTP {status_code}")
+            self.status_code = status_code
+
+    class ScriptedModel:
+        # Each call plays the next script: an exception to raise before any
+        # chunk, or a (delay before first token, delay after it) pair.
+        def __init__(self, *scripts: Any) -> None:
+            self.scripts = list(scripts)
+            self.calls = 0
+            self.closed = 0
+
+        async def astream(self, _messages: List[Any], config: dict[str, Any] | None = None):
+            _ = config
+            script = self.scripts[min(self.calls, len(self.scripts) - 1)]
+            self.calls += 1
+            try:
+                if isinstance(script, Exception):
+                    raise script
+                before, after = script
+                yield AIMessageChunk(content="")
+                await asyncio.sleep(before)
+                yield AIMessageChunk(content=f"reply {self.calls}")
+                await asyncio.sleep(after)
+            finally:
+                self.closed += 1
+
+    fast = ResilienceConfig(backoff_base_s=0.01, idle_timeout_s=0.2)
+
+    async def call(
+        model: ScriptedModel, config: ResilienceConfig, state: ResilienceState, **kwargs: Any
+    ) -> tuple[Any, dict[str, Any]]:
+        stats: dict[str, Any] = {}
+        message = await astream_model_turn(
+            model, [], stats=stats, resilience=config, resilience_state=state, **kwargs
+        )
+        return message.content, stats
+
+    class SummaryModel:
+        # The first `hang_calls` summary requests never answer.
+        def __init__(self, hang_calls: int) -> None:
+            self.hang_calls = hang_calls
+            self.calls = 0
+
+        async def ainvoke(self, _messages: List[Any], config: dict[str, Any] | None = None):
+            _ = config
+            self.calls += 1
+            if self.calls <= self.hang_calls:
+                await asyncio.sleep(5)
+            return AIMessage(content=f"summary {self.calls}")
+
+    long_history: List[Any] = []
+    for idx in range(8):
+        long_history.extend(
+            [HumanMessage(content=f"q{idx} " + "x" * 400), AIMessage(content=f"a{idx}")]
+        )
+    long_history.append(HumanMessage(content="latest"))
+
+    async def summarize(
+        model: SummaryModel, config: ResilienceConfig, deadline: float | None = None
+    ) -> RuntimeContext:
+        context = RuntimeContext(
+            adapter=None,  # type: ignore[arg-type]
+            history=list(long_history),
+            session_model=model,
+        )
+        await _apply_context_window(
+            context,
+            context.history,
+            "system",
+            ContextWindowConfig(token_budget=300, keep_last=2),
+            None,
+            resilience=config,
+            deadline=deadline,
+        )
+        return context
+
+    async def scenarios() -> dict[str, Any]:
+        results: dict[str, Any] = {}
+        state = ResilienceState()
+        model = ScriptedModel(StatusError(429), StatusError(503), (0, 0))
+        results["transient"] = (await call(model, fast, state), model.calls, dict(state.counters))
+
+        for status in (401, 409):
+            model = ScriptedModel(StatusError(status), (0, 0))
+            try:
+                await call(model, fast, ResilienceState())
+                results[f"permanent_{status}"] = "no error"
+            except StatusError:
+                results[f"permanent_{status}"] = model.calls
+
+        state = ResilienceState()
+        model = ScriptedModel((5, 0), (0, 0))
+        results["hung_first_token"] = (await call(model, fast, state), dict(state.counters))
+
+        state = ResilienceState()
+        model = ScriptedModel((0, 5))
+        started = time.monotonic()
+        try:
+            await call(model, fast, state)
+            results["idle_mid_stream"] = "no error"
+        except ModelIdleTimeoutError:
+            results["idle_mid_stream"] = (model.calls, round(time.monotonic() - started, 1))
+
+        state = ResilienceState()
+        model = ScriptedModel((5, 0))
+        started = time.monotonic()
+        try:
+            await call(
+                model,
+                ResilienceConfig(idle_timeout_s=10),
+                state,
+                deadline=time.monotonic() + 0.3,
+            )
+            results["deadline"] = "no error"
+        except ModelDeadlineError:
+            results["deadline"] = (model.calls, round(time.monotonic() - started, 1))
+
+        state = ResilienceState()
+        for _ in range(10):
+            state.ttft.add(20.0)
+        model = ScriptedModel((2, 0), (0, 0))
+        started = time.monotonic()
+        hedged = await call(model, ResilienceConfig(hedge_percentile=0.9), state)
+        results["hedge"] = (
+            hedged[0],
+            round(time.monotonic() - started, 1),
+            model.closed,
+            dict(state.counters),
+        )
+
+        model_s = SummaryModel(hang_calls=1)
+        context = await summarize(
+            model_s, ResilienceConfig(idle_timeout_s=0.2, backoff_base_s=0.01)
+        )
+        results["summary_retry"] = (context.summary, model_s.calls, dict(context.resilience.counters))
+        model_s = SummaryModel(hang_calls=99)
+        started = time.monotonic()
+        context = await summarize(
+            model_s, ResilienceConfig(idle_timeout_s=10), deadline=time.monotonic() + 0.3
+        )
+        results["summary_deadline"] = (
+            context.summary,
+            round(time.monotonic() - started, 1),
+            context.resilience.counters["deadline_exceeded"],
+        )
+        return results
+
+    with redirect_stdout(io.StringIO()):
+        results = asyncio.run(scenarios())
+
+    (content, stats), calls, counters = results["transient"]
+    require(
+        content == "reply 3" and calls == 3 and stats["retries"] == 2 and counters["retries"] == 2,
+        f"429/503 not retried: {results['transient']}",
+    )
+    for status in (401, 409):
+        calls = results[f"permanent_{status}"]
+        require(calls == 1, f"{status} was retried: {calls}")
+    (content, _stats), counters = results["hung_first_token"]
+    require(
+        content == "reply 2" and counters["idle_timeouts"] == 1 and counters["retries"] == 1,
+        f"hung request not retried after idle timeout: {results['hung_first_token']}",
+    )
+    require(
+        results["idle_mid_stream"] == (1, 0.2),
+        f"mid-stream stall not failed by idle timeout: {results['idle_mid_stream']}",
+    )
+    require(results["deadline"] == (1, 0.3), f"turn deadline not enforced: {results['deadline']}")
+    content, elapsed, closed, counters = results["hedge"]
+    require(
+        content == "reply 2" and elapsed < 0.5 and closed == 2
+        and counters["hedges"] == 1 and counters["hedge_wins"] == 1,
+        f"slow request not hedged: {results['hedge']}",
+    )
+    summary, calls, counters = results["summary_retry"]
+    require(
+        summary == "summary 2" and calls == 2
+        and counters["idle_timeouts"] == 1 and counters["retries"] == 1,
+        f"hung summary not retried: {results['summary_retry']}",
+    )
+    require(
+        results["summary_deadline"] == ("", 0.3, 1),
+        f"summary not bounded by the turn deadline: {results['summary_deadline']}",
+    )
+    return True, (
+        "429/503 retried, 401 not; idle timeout + deadline enforced; hedge won; "
+        "summary call retried and deadline-bound"
+    )
+
+
+def check_response_cache_replay() -> tuple[bool, str]:
+    import uuid
+
+    from langchain_core.tools import StructuredTool
+
+    from cli_core.response_cache import ResponseCache
+
+    lookups: List[str] = []
+
+    def lookup(key: str) -> str:
+        lookups.append(key)
+        return f"value for {key}"
+
+    registry = ToolRegistry()
+    registry.register(StructuredTool.from_function(lookup, description="lookup"))
+
+    class ToolThenAnswerModel:
+        def __init__(self) -> None:
+            self.calls = 0
+
+        def stream(self, messages: List[Any], config: dict[str, Any] | None = None):
+            _ = config
+            self.calls += 1
+            if not isinstance(messages[-1], ToolMessage):
+                # Fresh tool-call ids every time, as a provider would mint them.
+                yield AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {
+                            "name": "lookup",
+                            "args": json.dumps({"key": "a"}),
+                            "id": f"call_{uuid.uuid4().hex}",
+                            "index": 0,
+                        }
+                    ],
+                )
+            else:
+                yield AIMessageChunk(content=f"The answer is {messages[-1].content}.")
+
+    def run_turn(model: ToolThenAnswerModel, cache: ResponseCache) -> tuple[List[Any], str]:
+        context = RuntimeContext(
+            adapter=FakeAdapter(model),  # type: ignore[arg-type]
+            history=[HumanMessage(content="what is a?")],
+            trace_requests=True,
+        )
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            history = run_agent_turn(
+                context=context,
+                system_prompt="static instructions",
+                tool_registry=registry,
+                response_cache=cache,
+            )
+        return history, stdout.getvalue()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(Path(tmp) / "responses.sqlite")
+        live_model = ToolThenAnswerModel()
+        live, live_trace = run_turn(live_model, cache)
+        replay_model = ToolThenAnswerModel()
+        replayed, replay_trace = run_turn(replay_model, cache)
+        require(live_model.calls == 2 and replay_model.calls == 0, "replay reached the model")
+        require(
+            live_trace.count("[trace] response cache miss") == 2
+            and replay_trace.count("[trace] response cache hit") == 2,
+            f"cache hits/misses not traced: {replay_trace!r}",
+        )
+        replayed_calls = replayed[1].tool_calls
+        require(
+            replayed[-1].content == live[-1].content == "The answer is value for a."
+            and [(call["name"], call["args"]) for call in replayed_calls]
+            == [(call["name"], call["args"]) for call in live[1].tool_calls]
+            and lookups == ["a", "a"],
+            "replayed turn differs from the live one",
+        )
+        require(
+            replayed_calls[0]["id"] != live[1].tool_calls[0]["id"]
+            and replayed[2].tool_call_id == replayed_calls[0]["id"],
+            "replayed tool call kept its original id or lost its ToolMessage link",
+        )
+        with sqlite3.connect(cache.path) as conn:
+            keys = [row[0] for row in conn.execute("SELECT key FROM responses")]
+        tool_key = next(key for key in keys if cache.get(key).tool_calls)
+        again = [cache.get(tool_key).tool_calls[0]["id"] for _ in range(2)]
+        require(
+            len(set(again)) == 2 and replayed_calls[0]["id"] not in again,
+            f"repeated replays reuse tool-call ids: {again}",
+        )
+        with sqlite3.connect(cache.path) as conn:
+            first_key = conn.execute("SELECT key FROM responses LIMIT 1").fetchone()[0]
+        expired = cache.get(first_key, now=time.time() + cache.ttl_s + 1)
+        require(expired is None and cache.stats()["expired"] == 1, "TTL not enforced")
+        cache.close()
+
+        lru = ResponseCache(Path(tmp) / "lru.sqlite", max_entries=2)
+        for index, key in enumerate(("k1", "k2")):
+            lru.put(key, AIMessage(content=key), now=100 + index)
+        lru.get("k1", now=110)
+        lru.put("k3", AIMessage(content="k3"), now=120)
+        require(
+            lru.get("k2", now=130) is None and lru.get("k1", now=130) is not None,
+            "least recently used entry not evicted",
+        )
+        require(lru.stats()["evictions"] == 1, f"eviction not counted: {lru.stats()}")
+        lru.close()
+    return True, "tool-call turn replayed from cache with 0 model calls; TTL + LRU enforced"
+
+
+def check_turn_profiler_spans() -> tuple[bool, str]:
+    from langchain_core.tools import StructuredTool
+
+    from cli_core.profiling import JsonlSpanExporter
+
+    def slow_lookup(key: str) -> str:
+        time.sleep(0.2)
+        return f"value for {key}"
+
+    registry = ToolRegistry()
+    registry.register(StructuredTool.from_function(slow_lookup, description="slow lookup"))
+
+    class ToolThenAnswerModel:
+        def stream(self, messages: List[Any], config: dict[str, Any] | None = None):
+            _ = config
+            if isinstance(messages[-1], ToolMessage):
+                yield AIMessageChunk(content="The answer is ready.")
+                return
+            time.sleep(0.05)
+            yield AIMessageChunk(
+                content="",
+                tool_calls=[{"name": "slow_lookup", "args": {"key": "a"}, "id": "call-1"}],
+            )
+
+    def on_before_turn(context: RuntimeContext, _text: str) -> None:
+        with context.profiler.span("lt.load"):
+            time.sleep(0.02)
+
+    def on_after_turn(context: RuntimeContext, _new: List[Any]) -> None:
+        with context.profiler.span("checkpoint.save"):
+            pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "spans.jsonl"
+        options = RuntimeOptions(
+            prompt_builder=lambda _context: "You are a helpful assistant.",
+            tool_registry=registry,
+            on_before_turn=on_before_turn,
+            on_after_turn=on_after_turn,
+            span_exporter=JsonlSpanExporter(path),
+            trace_requests=True,
+        )
+        scripted_inputs = iter(["question", "/exit"])
+        stdout = io.StringIO()
+        with (
+            patch("builtins.input", side_effect=lambda _prompt="": next(scripted_inputs)),
+            redirect_stdout(stdout),
+        ):
+            run_cli(adapter=FakeAdapter(ToolThenAnswerModel()), options=options, state={})
+        records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+    by_id = {record["spanId"]: record for record in records}
+    roots = [record for record in records if not record["parentSpanId"]]
+    require(len(roots) == 1 and roots[0]["name"] == "turn", f"expected one turn root: {roots}")
+    root = roots[0]
+    require(root["attributes"].get("status") == "ok", f"turn status: {root['attributes']}")
+    require(
+        all(record["traceId"] == root["traceId"] for record in records)
+        and all(record["parentSpanId"] in by_id for record in records if record is not root),
+        "spans do not form one trace",
+    )
+
+    def parent_name(record: dict[str, Any]) -> str:
+        return by_id[record["parentSpanId"]]["name"]
+
+    names = {record["name"] for record in records}
+    expected = {
+        "input",
+        "idle_wait",
+        "before_turn",
+        "lt.load",
+        "prompt_build",
+        "step_prompt",
+        "model.stream",
+        "model.ttft",
+        "tools",
+        "tool",
+        "render",
+        "after_turn",
+        "checkpoint.save",
+    }
+    require(expected <= names, f"missing spans: {sorted(expected - names)}")
+    for record in records:
+        if record is root:
+            continue
+        parent = by_id[record["parentSpanId"]]
+        require(
+            parent["startTimeUnixNano"] <= record["startTimeUnixNano"]
+            and record["endTimeUnixNano"] <= parent["endTimeUnixNano"],
+            f"{record['name']} escapes its parent {parent['name']}",
+        )
+    nested = {record["name"]: parent_name(record) for record in records if record is not root}
+    require(
+        nested["lt.load"] == "before_turn"
+        and nested["checkpoint.save"] == "after_turn"
+        and nested["model.ttft"] == "model.stream"
+        and nested["tool"] == "tools",
+        f"hook spans not nested: {nested}",
+    )
+    builds = [record for record in records if record["name"] == "prompt_build"]
+    step_prompts = [record for record in records if record["name"] == "step_prompt"]
+    require(
+        len(builds) == 1 and [record["attributes"]["step"] for record in step_prompts] == [0, 1],
+        f"prompt build and per-step prompts not told apart: {len(builds)} {step_prompts}",
+    )
+    streams = [record for record in records if record["name"] == "model.stream"]
+    tool = next(record for record in records if record["name"] == "tool")
+    require(
+        len(streams) == 2 and streams[0]["attributes"]["ttft_ms"] >= 50,
+        f"model steps not profiled: {[stream['attributes'] for stream in streams]}",
+    )
+    require(
+        tool["attributes"] == {"tool": "slow_lookup", "status": "ok"}
+        and tool["durationMs"] >= 200,
+        f"tool span: {tool}",
+    )
+    summary = [line for line in stdout.getvalue().splitlines() if line.startswith("[trace] turn ")]
+    require(
+        len(summary) == 1 and "tools=" in summary[0] and "model.stream=" in summary[0],
+        f"phase summary not traced: {summary}",
+    )
+    return True, f"{len(records)} spans in one trace; hook, tool and TTFT spans nested"
+
+
+def check_idle_lt_prefetch() -> tuple[bool, str]:
+    import threading
+
+    import main as cli_main
+
+    events: List[str] = []
+
+    def on_idle(_context: RuntimeContext) -> None:
+        events.append(f"idle:{threading.current_thread() is threading.main_thread()}")
+
+    options = RuntimeOptions(
+        prompt_builder=lambda _context: "You are a helpful assistant.",
+        tool_registry=ToolRegistry(),
+        on_idle=on_idle,
+        on_before_turn=lambda _context, _text: events.append("before"),
+    )
+    scripted_inputs = iter(["question", "/exit"])
+    with (
+        patch("builtins.input", side_effect=lambda _prompt="": next(scripted_inputs)),
+        redirect_stdout(io.StringIO()),
+    ):
+        run_cli(adapter=FakeAdapter(FakeBoundModel()), options=options, state={})
+    require(events[:2] == ["idle:False", "before"], f"idle hook not run ahead of turn: {events}")
+    require(events[2:] == ["idle:False"], f"idle hook not rerun after turn: {events}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JsonlLongTermMemoryStore(Path(tmp) / "memory")
+        store.append("user-a", "User prefers tea.")
+        state: dict[str, Any] = {
+            "identity": {"user_id": "user-a", "thread_id": "thread-a"},
+            "lt_store": store,
+            "lt_recent_records": [],
+            "lt_retrieval": "recency",
+            "lt_generation": 0,
+        }
+        context = RuntimeContext(adapter=None, state=state)  # type: ignore[arg-type]
+        upsert = cli_main._build_memory_upsert_tool(state, store)  # noqa: SLF001
+
+        cli_main._on_idle(context)  # noqa: SLF001
+        with patch.object(store, "load_recent", side_effect=AssertionError("store read")):
+            cli_main._on_before_turn(context, "what do I drink?")  # noqa: SLF001
+            memory_block = cli_main.build_memory_context(context)
+        require(
+            memory_block is state["lt_prefetch_used"]["context"]
+            and "User prefers tea." in memory_block,
+            "recency turn did not reuse the prefetched memory context",
+        )
+
+        cli_main._on_idle(context)  # noqa: SLF001
+        upsert.invoke({"content": "User prefers coffee now.", "subject": "drink"})
+        cli_main._on_before_turn(context, "what do I drink?")  # noqa: SLF001
+        contents = [record["content"] for record in state["lt_recent_records"]]
+        require(
+            state["lt_prefetch_used"] is None and "User prefers coffee now." in contents,
+            f"memory write did not invalidate the prefetch: {contents}",
+        )
+
+        cli_main._on_idle(context)  # noqa: SLF001
+        cli_main._clear_memory_state(context)  # noqa: SLF001
+        require("lt_prefetch" not in state, "/memory-clear kept a stale prefetch")
+
+        state["lt_retrieval"] = "lexical"
+        store.append("user-a", "User keeps bees on the roof.")
+        for fact in ("User drinks water.", "User lives in Oslo.", "User runs on Sundays."):
+            store.append("user-a", fact)
+        cli_main._on_idle(context)  # noqa: SLF001
+        misses = store.cache_stats()["misses"]
+        with patch.object(store, "load_recent", side_effect=AssertionError("backfill read")):
+            cli_main._on_before_turn(context, "tell me about bees")  # noqa: SLF001
+        require(
+            store.cache_stats()["misses"] == misses
+            and state["lt_recent_records"][0]["content"] == "User keeps bees on the roof.",
+            "lexical turn did not read the index warmed while idle",
+        )
+        contents = [record["content"] for record in state["lt_recent_records"]]
+        require(
+            contents[1:] == ["User runs on Sundays.", "User lives in Oslo."]
+            and state["lt_prefetch_used"] is None,
+            f"lexical turn did not merge the prefetched backfill: {contents}",
+        )
+
+        cli_main._on_idle(context)  # noqa: SLF001
+        with patch.object(store, "load_recent", side_effect=AssertionError("backfill read")):
+            cli_main._on_before_turn(context, "zzz unrelated")  # noqa: SLF001
+            memory_block = cli_main.build_memory_context(context)
+        require(
+            state["lt_prefetch_used"] is not None
+            and memory_block is state["lt_prefetch_used"]["context"],
+            "lexical turn without matches did not reuse the prefetched block",
+        )
+    return True, (
+        "idle hook off-thread before turn; recency prefetch reused; lexical backfill "
+        "prefetched; writes invalidate"
+    )
+
+
+def check_provider_connection_reuse() -> tuple[bool, str]:
+    import asyncio
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from cli_core.providers.http import build_async_http_client, build_http_client
+    from cli_core.providers.moonshot import MoonshotAdapter
+
+    requests: List[tuple[str, str, int, dict[str, Any]]] = []
+
+    def sse(payload: dict[str, Any]) -> str:
+        return f"data: {json.dumps(payload)}\n\n"
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        # Keep-alive needs HTTP/1.1 and a Content-Length on every response.
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *_args: Any) -> None:
+            pass
+
+        def _reply(self, body: bytes, content_type: str) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:  # noqa: N802
+            requests.append(("GET", self.path, self.client_address[1], {}))
+            self._reply(json.dumps({"object": "list", "data": []}).encode(), "application/json")
+
+        def do_POST(self) -> None:  # noqa: N802
+            length = int(self.headers.get("Content-Length", "0"))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            requests.append(("POST", self.path, self.client_address[1], body))
+            base = {"id": "c1", "object": "chat.completion.chunk", "created": 0, "model": "stand-in"}
+            events = (
+                sse({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": "hi"}}]})
+                + sse({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                + sse(
+                    {
+                        **base,
+                        "choices": [],
+                        "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+                    }
+                )
+                + "data: [DONE]\n\n"
+            )
+            self._reply(events.encode(), "text/event-stream")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = {
+        "MOONSHOT_API_KEY": "stand-in-key",
+        "MOONSHOT_BASE_URL": f"http://127.0.0.1:{server.server_address[1]}/v1",
+        "MOONSHOT_WARMUP": "1",
+    }
+    try:
+        with patch.dict(os.environ, env):
+            adapter = MoonshotAdapter()
+
+        async def async_session() -> List[str]:
+            replies = []
+            require(await adapter.awarm_up(), "async warm-up request failed")
+            for _ in range(2):
+                # A fresh model per turn, as after `/reset`, still shares the pool.
+                model = adapter.build_model()
+                text = ""
+                async for chunk in model.astream([HumanMessage(content="hello")]):
+                    text += str(chunk.content)
+                replies.append(text)
+            await adapter.aclose()
+            return replies
+
+        async_replies = asyncio.run(async_session())
+        async_requests = list(requests)
+        requests.clear()
+        require(adapter.warm_up(), "sync warm-up request failed")
+        sync_replies = [
+            "".join(str(chunk.content) for chunk in adapter.build_model().stream("hello"))
+            for _ in range(2)
+        ]
+        adapter.close()
+        sync_requests = list(requests)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    sync_client = build_http_client(http2=False)
+    async_client = build_async_http_client(http2=False)
+    sync_client.close()
+    asyncio.run(async_client.aclose())
+    for label, timeout in (("sync", sync_client.timeout), ("async", async_client.timeout)):
+        # Callers outside the turn's idle timeout (warm-up) must not hang forever.
+        require(
+            None not in (timeout.connect, timeout.read, timeout.write, timeout.pool),
+            f"{label} shared client has an unbounded timeout: {timeout}",
+        )
+    for label, replies, seen in (
+        ("async", async_replies, async_requests),
+        ("sync", sync_replies, sync_requests),
+    ):
+        require(replies == ["hi", "hi"], f"{label} replies wrong: {replies}")
+        require(
+            [(method, path) for method, path, _port, _body in seen]
+            == [("GET", "/v1/models"), ("POST", "/v1/chat/completions"), ("POST", "/v1/chat/completions")],
+            f"{label} request sequence wrong: {seen}",
+        )
+        ports = {port for _method, _path, port, _body in seen}
+        require(len(ports) == 1, f"{label} client opened {len(ports)} connections: {seen}")
+        require(
+            seen[1][3].get("stream_options") == {"include_usage": True},
+            f"{label} request did not ask for streamed usage",
+        )
+    return True, f"warm-up + 2 turns on one connection (sync and async); http2={adapter.http2}"
+
+
 def check_stage2_st_restore_isolation() -> tuple[bool, str]:
     with tempfile.TemporaryDirectory() as tmp:
         db_path = Path(tmp) / "checkpoints.sqlite"
@@ -177,10 +1115,310 @@ def check_stage2_st_restore_isolation() -> tuple[bool, str]:
         require(first_clear is True and second_clear is False, "thread clear idempotency failed")
         require(store.load("thread-a") == [], "cleared thread still has state")
         require(store.load("thread-b")[-1].content == "t2-state", "clear leaked to other thread")
+        store.close()
 
     return True, "restore/isolation/clear-idempotent verified"
 
 
+def check_st_delta_append_and_legacy_migration() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "checkpoints.sqlite"
+        legacy = [HumanMessage(content="legacy question"), AIMessage(content="legacy answer")]
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(
+                "CREATE TABLE thread_checkpoints (thread_id TEXT PRIMARY KEY, "
+                "history_json TEXT NOT NULL, updated_at TEXT NOT NULL DEFAULT (datetime('now')))"
+            )
+            conn.execute(
+                "INSERT INTO thread_checkpoints (thread_id, history_json) VALUES (?, ?)",
+                ("thread-legacy", json.dumps(messages_to_dict(legacy))),
+            )
+
+        store = SqliteCheckpointStore(db_path)
+        restored = store.load("thread-legacy")
+        require(
+            [m.content for m in restored] == ["legacy question", "legacy answer"],
+            "legacy blob checkpoint was not migrated on load",
+        )
+        history = [*restored, HumanMessage(content="follow-up"), AIMessage(content="delta")]
+        store.save("thread-legacy", history)
+        store.save("thread-legacy", history)
+
+        with sqlite3.connect(db_path) as conn:
+            seqs = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT seq FROM thread_messages WHERE thread_id = ? ORDER BY seq",
+                    ("thread-legacy",),
+                )
+            ]
+            legacy_rows = conn.execute("SELECT COUNT(*) FROM thread_checkpoints").fetchone()[0]
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        require(seqs == [0, 1, 2, 3], f"unexpected per-message rows after delta saves: {seqs}")
+        require(legacy_rows == 0, "legacy blob row was not dropped after migration")
+        require(journal_mode == "wal", f"checkpoint db not in WAL mode: {journal_mode}")
+        require(
+            store.load("thread-legacy")[-1].content == "delta",
+            "delta-appended message not restored in seq order",
+        )
+        store.close()
+        store.close()
+
+    return True, f"legacy migrated; rows={seqs}; repeat save inserted nothing; journal={journal_mode}"
+
+
+def check_st_codec_mixed_rows() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "checkpoints.sqlite"
+        legacy_store = SqliteCheckpointStore(db_path, codec="json")
+        first = [HumanMessage(content="plain row"), AIMessage(content="plain answer")]
+        legacy_store.save("thread-mixed", first)
+        legacy_store.close()
+
+        store = SqliteCheckpointStore(db_path, codec="zlib")
+        tool_turn = [
+            HumanMessage(content="remember python"),
+            AIMessage(
+                content="",
+                tool_calls=[{"name": "memory_upsert", "args": {"content": "python"}, "id": "c1"}],
+            ),
+        ]
+        store.save("thread-mixed", [*first, *tool_turn])
+        restored = store.load("thread-mixed")
+        with store._connect() as conn:  # noqa: SLF001
+            tags = [row[0] for row in conn.execute("SELECT codec FROM thread_messages ORDER BY seq")]
+            # Rows tagged before the dictionary version was recorded still
+            # decode; a version this build does not know is reported.
+            conn.execute("UPDATE thread_messages SET codec = 'zlib' WHERE seq = 2")
+        unversioned = store.load("thread-mixed")[2].content
+        with store._connect() as conn:  # noqa: SLF001
+            conn.execute("UPDATE thread_messages SET codec = 'zlib99' WHERE seq = 2")
+        try:
+            store.load("thread-mixed")
+            unknown_error = ""
+        except CheckpointStoreError as exc:
+            unknown_error = str(exc)
+        store.close()
+
+    require(tags == ["json", "json", "zlib1", "zlib1"], f"unexpected per-row codec tags: {tags}")
+    require(unversioned == "remember python", f"unversioned zlib row not decoded: {unversioned!r}")
+    require("zlib99" in unknown_error, f"unknown dictionary version not reported: {unknown_error!r}")
+    require(
+        [m.content for m in restored[:3]] == ["plain row", "plain answer", "remember python"],
+        "mixed legacy/encoded rows did not round-trip",
+    )
+    require(
+        restored[-1].tool_calls and restored[-1].tool_calls[0]["id"] == "c1",
+        "tool calls lost through codec round-trip",
+    )
+    return True, f"tags={tags}"
+
+
+def check_st_lazy_tail_restore() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteCheckpointStore(Path(tmp) / "checkpoints.sqlite")
+        history: List[Any] = []
+        for idx in range(10):
+            call_id = f"call-{idx}"
+            history.extend(
+                [
+                    HumanMessage(content=f"q{idx}"),
+                    AIMessage(
+                        content="",
+                        tool_calls=[{"name": "memory_upsert", "args": {}, "id": call_id}],
+                    ),
+                    ToolMessage(content=f"saved {idx}", tool_call_id=call_id),
+                    AIMessage(content=f"a{idx}"),
+                ]
+            )
+        store.save("thread-long", history)
+
+        offset, window = store.load_tail("thread-long", 2)
+        require(offset == 37 and len(window) == 3, f"tail widened wrongly: offset={offset}")
+        require(window[0].type == "ai" and window[0].tool_calls, "tail split a tool-call pair")
+
+        context = RuntimeContext(
+            adapter=None,  # type: ignore[arg-type]
+            history=window,
+            history_offset=offset,
+            history_pager=lambda start, end: store.load_range("thread-long", start, end),
+        )
+        paged = context.page_in_older(6)
+        require(paged == 6 and context.history_offset == 31, "page_in_older did not page")
+        require(context.history[0].content == "a7" and context.total_messages == 40, "paged order wrong")
+
+        context.history.extend([HumanMessage(content="q10"), AIMessage(content="a10")])
+        store.save(
+            "thread-long",
+            context.history,
+            start_seq=context.history_offset,
+            summary=("earlier turns condensed", 30),
+        )
+        require(store.count("thread-long") == 42, "windowed save did not append delta")
+        require(store.load("thread-long")[-1].content == "a10", "windowed save order wrong")
+        require(
+            store.load_summary("thread-long") == ("earlier turns condensed", 30),
+            "context summary not persisted next to checkpoint",
+        )
+        store.clear("thread-long")
+        require(store.load_summary("thread-long") == ("", 0), "clear left context summary behind")
+        store.close()
+
+    return True, f"tail_offset={offset}; paged={paged}; total=42"
+
+
+def check_context_window_summary() -> tuple[bool, str]:
+    class RecordingBoundModel:
+        def __init__(self) -> None:
+            self.prompts: List[List[Any]] = []
+
+        def stream(self, messages: List[Any], config: dict[str, Any] | None = None):
+            _ = config
+            self.prompts.append(list(messages))
+            yield AIMessageChunk(content="windowed answer")
+
+    class SummaryModel:
+        def __init__(self) -> None:
+            self.calls = 0
+
+        def invoke(self, _messages: List[Any], config: dict[str, Any] | None = None):
+            _ = config
+            self.calls += 1
+            return AIMessage(content=f"summary-v{self.calls}")
+
+    bound_model = RecordingBoundModel()
+    summary_model = SummaryModel()
+    history: List[Any] = []
+    for idx in range(30):
+        call_id = f"call-{idx}"
+        history.extend(
+            [
+                HumanMessage(content=f"question {idx} " + "x" * 200),
+                AIMessage(content="", tool_calls=[{"name": "noop", "args": {}, "id": call_id}]),
+                ToolMessage(content="ok", tool_call_id=call_id),
+                AIMessage(content=f"answer {idx} " + "y" * 200),
+            ]
+        )
+    history.append(HumanMessage(content="latest question"))
+    context = RuntimeContext(
+        adapter=FakeAdapter(bound_model),  # type: ignore[arg-type]
+        history=history,
+        session_model=summary_model,
+        session_bound_model=bound_model,
+    )
+    config = ContextWindowConfig(token_budget=1_000, keep_last=6)
+    with redirect_stdout(io.StringIO()):
+        run_agent_turn(context, "system", ToolRegistry(), context_window=config)
+        context.history.extend([AIMessage(content="windowed answer"), HumanMessage(content="next")])
+        run_agent_turn(context, "system", ToolRegistry(), context_window=config)
+
+    first, second = bound_model.prompts
+    require(summary_model.calls == 1, f"summary recomputed: calls={summary_model.calls}")
+    require(context.summary_dirty and context.summary == "summary-v1", "summary not cached on context")
+    require("summary-v1" in first[1].content, "summary not injected after system prompt")
+    for prompt in (first, second):
+        window = prompt[2:]
+        require(window[0].type != "tool", "window starts with orphaned ToolMessage")
+        require(window[-1].content in {"latest question", "next"}, "latest user message missing")
+    tokens = context.turn_stats.get("prompt_tokens_est", 0)
+    require(0 < tokens <= config.token_budget, f"prompt over budget: {tokens}")
+
+    # A thread restored from its tail with no summary: the older messages are
+    # paged in and summarized on the first turn instead of being dropped.
+    pages: List[tuple[int, int]] = []
+
+    def pager(start: int, end: int) -> List[Any]:
+        pages.append((start, end))
+        return [HumanMessage(content=f"old message {idx}") for idx in range(start, end)]
+
+    backlog_model = SummaryModel()
+    backlog_bound = RecordingBoundModel()
+    resumed = RuntimeContext(
+        adapter=FakeAdapter(backlog_bound),  # type: ignore[arg-type]
+        history=[HumanMessage(content="resumed question")],
+        session_model=backlog_model,
+        session_bound_model=backlog_bound,
+        history_offset=250,
+        history_pager=pager,
+    )
+    with redirect_stdout(io.StringIO()):
+        run_agent_turn(resumed, "system", ToolRegistry(), context_window=ContextWindowConfig())
+        resumed.history.extend([AIMessage(content="windowed answer"), HumanMessage(content="again")])
+        run_agent_turn(resumed, "system", ToolRegistry(), context_window=ContextWindowConfig())
+    require(pages == [(0, 200), (200, 250)], f"backlog not paged once in order: {pages}")
+    require(
+        backlog_model.calls == 2 and resumed.summary_upto == 250 and resumed.summary_dirty,
+        f"backlog not summarized: calls={backlog_model.calls} upto={resumed.summary_upto}",
+    )
+    require(
+        "summary-v2" in backlog_bound.prompts[0][1].content,
+        "backlog summary missing from the first resumed prompt",
+    )
+    return True, (
+        f"window={len(first) - 2}/{len(history)} msgs; summary_upto={context.summary_upto}; "
+        f"tokens~{tokens}; unsummarized backlog paged in"
+    )
+
+
+def check_st_write_behind_flush_and_errors() -> tuple[bool, str]:
+    class FlakyStore:
+        def __init__(self, inner: SqliteCheckpointStore) -> None:
+            self.inner = inner
+            self.save_calls = 0
+            self.fail_next = False
+
+        def save(
+            self,
+            thread_id: str,
+            history: List[Any],
+            start_seq: int = 0,
+            summary: Any = None,
+        ) -> None:
+            self.save_calls += 1
+            if self.fail_next:
+                self.fail_next = False
+                raise CheckpointStoreError("forced write failure for harness")
+            self.inner.save(thread_id, history, start_seq=start_seq, summary=summary)
+
+        def load(self, thread_id: str) -> List[Any]:
+            return self.inner.load(thread_id)
+
+        def clear(self, thread_id: str) -> bool:
+            return self.inner.clear(thread_id)
+
+        def close(self) -> None:
+            self.inner.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flaky = FlakyStore(SqliteCheckpointStore(Path(tmp) / "checkpoints.sqlite"))
+        writer = WriteBehindCheckpointStore(flaky)
+        history: List[Any] = []
+        for idx in range(20):
+            history = [*history, HumanMessage(content=f"q{idx}"), AIMessage(content=f"a{idx}")]
+            writer.save("thread-a", history)
+        require(writer.flush(timeout=5), "write-behind queue did not drain")
+        require(len(writer.load("thread-a")) == 40, "flushed history incomplete")
+        require(flaky.save_calls <= 20, "saves were not bounded by submissions")
+
+        flaky.fail_next = True
+        writer.save("thread-a", [*history, HumanMessage(content="lost")])
+        writer.flush(timeout=5)
+        error = writer.take_error()
+        require(error is not None, "background write failure was not surfaced")
+        require(writer.take_error() is None, "write failure surfaced more than once")
+
+        writer.save("thread-a", history)
+        require(writer.clear("thread-a") is True, "clear after queued save failed")
+        require(writer.load("thread-a") == [], "queued save resurrected cleared thread")
+        writer.save("thread-a", history[:2])
+        writer.close()
+        reopened = SqliteCheckpointStore(Path(tmp) / "checkpoints.sqlite")
+        require(len(reopened.load("thread-a")) == 2, "close did not flush pending save")
+        reopened.close()
+
+    return True, f"save_calls={flaky.save_calls} for 22 submissions; error surfaced once; close flushed"
+
+
 def check_stage3_lt_restore_isolation_clear() -> tuple[bool, str]:
     with tempfile.TemporaryDirectory() as tmp:
         store = JsonlLongTermMemoryStore(Path(tmp) / "memory")
@@ -210,13 +1448,596 @@ def check_stage3_lt_restore_isolation_clear() -> tuple[bool, str]:
     return True, "restore/isolation/clear-idempotent verified"
 
 
+def check_lt_tail_read_newest_first() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JsonlLongTermMemoryStore(Path(tmp) / "memory")
+        path = store._user_path("user-tail")  # noqa: SLF001
+        lines = ["{not json"]
+        for idx in range(5_000):
+            lines.append(
+                json.dumps(
+                    {
+                        "id": f"id-{idx}",
+                        "user_id": "user-tail",
+                        "content": f"fact {idx}",
+                        "kind": "semantic",
+                        "created_at": "2026-01-01T00:00:00Z",
+                        "updated_at": "2026-01-01T00:00:00Z",
+                    }
+                )
+            )
+        lines.insert(4_990, '{"id": "partial"}')
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            recent = store.load_recent("user-tail", k=3)
+            older = store.load_recent("user-tail", k=12)
+        warnings = stdout.getvalue()
+
+    require(
+        [record["content"] for record in recent] == ["fact 4999", "fact 4998", "fact 4997"],
+        f"tail read order wrong: {[record['content'] for record in recent]}",
+    )
+    require(len(older) == 12 and older[-1]["content"] == "fact 4988", "tail read skipped records")
+    require("malformed" not in warnings, "tail read scanned past the newest k records")
+    require(warnings.count("missing required fields") == 1, "invalid tail record not reported")
+    return True, "newest-first k=3 without touching head-of-file corruption"
+
+
+def check_lt_mmap_reader_skips_superseded() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JsonlLongTermMemoryStore(Path(tmp) / "memory")
+        path = store._user_path("user-mmap")  # noqa: SLF001
+        base = {
+            "user_id": "user-mmap",
+            "kind": "semantic",
+            "created_at": "2026-01-01T00:00:00Z",
+            "updated_at": "2026-01-01T00:00:00Z",
+        }
+        lines = [
+            # Superseded versions are skipped by id, so this is never decoded.
+            '{"id": "a", "content": "old a", broken',
+            json.dumps({"id": "b", **base, "content": "plain b"}),
+            json.dumps({"op": "tombstone", "id": "a", "user_id": "user-mmap"}),
+            json.dumps({"id": "a", **base, "content": "new a"}),
+            # Non-canonical key order is still read; missing keys are rejected.
+            json.dumps({**base, "content": "reordered c", "id": "c"}, indent=None),
+            json.dumps({"user_id": "user-mmap", "content": "no id"}),
+        ]
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            recent = [record["content"] for record in store.load_recent("user-mmap", k=10)]
+            hits = [record["content"] for record in store.search("user-mmap", "plain new reordered", k=5)]
+            records, stale = store._scan_all(path, "user-mmap")  # noqa: SLF001
+        warnings = stdout.getvalue()
+
+    require(recent == ["reordered c", "new a", "plain b"], f"mmap reader order wrong: {recent}")
+    require(sorted(hits) == ["new a", "plain b", "reordered c"], f"full scan lost records: {hits}")
+    require(len(records) == 3 and stale == 2, f"stale lines miscounted: {stale}")
+    require("malformed" not in warnings, "superseded line was decoded")
+    require("missing required fields" in warnings, "invalid line not rejected")
+    return True, "superseded lines skipped undecoded; non-canonical lines validated"
+
+
+def check_lt_cache_stat_invalidation() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JsonlLongTermMemoryStore(Path(tmp) / "memory", cache_max_users=2)
+        store.append("user-a", "likes tea")
+        store.append("user-a", "uses vim")
+        first = store.load_recent("user-a", k=3)
+        second = store.load_recent("user-a", k=3)
+        require(store.cache_stats()["misses"] == 0, "own appends did not seed the cache")
+        require(first == second and first[0]["content"] == "uses vim", "cached order wrong")
+
+        store.append("user-a", "prefers python")
+        require(
+            store.load_recent("user-a", k=1)[0]["content"] == "prefers python",
+            "own append not folded into cache",
+        )
+        require(store.cache_stats()["misses"] == 0, "own append invalidated the cache")
+
+        other_writer = JsonlLongTermMemoryStore(Path(tmp) / "memory")
+        other_writer.append("user-a", "written by another process")
+        require(
+            store.load_recent("user-a", k=1)[0]["content"] == "written by another process",
+            "external write not detected via file stat",
+        )
+        misses_after_external = store.cache_stats()["misses"]
+
+        store.append("user-b", "b fact")
+        store.append("user-c", "c fact")
+        stats = store.cache_stats()
+    require(misses_after_external == 1, "external write did not cause exactly one miss")
+    require(stats["users"] == 2 and stats["evictions"] == 1, f"LRU bound not enforced: {stats}")
+    return True, f"stats={stats}"
+
+
+def check_lt_bm25_search() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JsonlLongTermMemoryStore(Path(tmp) / "memory")
+        # Small corpora keep terms found in most records searchable.
+        store.append("user-small", "user prefers dark mode")
+        hits = [hit["content"] for hit in store.search("user-small", "dark mode", k=3)]
+        require(hits == ["user prefers dark mode"], f"single-record search missed: {hits}")
+        store.append("user-small", "user works in dark rooms")
+        hits = [hit["content"] for hit in store.search("user-small", "dark mode", k=3)]
+        require(
+            hits == ["user prefers dark mode", "user works in dark rooms"],
+            f"small-corpus search dropped a common term: {hits}",
+        )
+
+        store.append("user-a", "Favorite database is PostgreSQL.")
+        for idx in range(50):
+            store.append("user-a", f"Filler fact number {idx} about hobbies.")
+        store.append("user-a", "Prefers tabs over spaces.")
+
+        hits = store.search("user-a", "Which database do I like?", k=3)
+        require(hits and hits[0]["content"] == "Favorite database is PostgreSQL.", "BM25 missed old fact")
+        store.append("user-a", "Backup database is SQLite.")
+        hits = store.search("user-a", "database", k=2)
+        require(
+            [hit["content"] for hit in hits]
+            == ["Backup database is SQLite.", "Favorite database is PostgreSQL."],
+            f"append not indexed or recency tie-break wrong: {[hit['content'] for hit in hits]}",
+        )
+        require(store.search("user-a", "quantum physics", k=3) == [], "unrelated query matched")
+        require(store.search("user-b", "database", k=3) == [], "search leaked across users")
+
+        start = time.perf_counter_ns()
+        for _ in range(100):
+            store.search("user-a", "Which database do I like?", k=3)
+        per_query_ms = (time.perf_counter_ns() - start) / 100 / 1_000_000
+    return True, f"old fact recalled past recency window; {per_query_ms:.3f} ms/query"
+
+
+def check_lt_semantic_search() -> tuple[bool, str]:
+    try:
+        embedder = HashingEmbedder()
+    except VectorIndexError as exc:
+        return True, f"skipped: {exc}"
+    with tempfile.TemporaryDirectory() as tmp:
+        memory_dir = Path(tmp) / "memory"
+        JsonlLongTermMemoryStore(memory_dir).append("user-a", "Favorite database is PostgreSQL.")
+        store = JsonlLongTermMemoryStore(memory_dir, embedder=embedder)
+        for idx in range(50):
+            store.append("user-a", f"Filler fact number {idx} about hobbies.")
+        store.append("user-a", "Prefers tabs over spaces.")
+
+        hits = store.semantic_search("user-a", "my favorite database", k=3)
+        require(hits and hits[0]["content"] == "Favorite database is PostgreSQL.", "semantic missed old fact")
+        ids_path = next(memory_dir.glob("*.vec.ids"))
+        rows = len(ids_path.read_text(encoding="utf-8").splitlines())
+        require(rows == 52, f"pre-existing record not embedded exactly once: rows={rows}")
+        store.append("user-a", "Tabs are preferred over spaces.")
+        store.semantic_search("user-a", "tabs or spaces", k=3)
+        rows = len(ids_path.read_text(encoding="utf-8").splitlines())
+        require(rows == 53, f"append not embedded incrementally: rows={rows}")
+
+        reopened = JsonlLongTermMemoryStore(memory_dir, embedder=embedder)
+        hits = reopened.semantic_search("user-a", "tabs or spaces", k=2)
+        require(
+            {hit["content"] for hit in hits}
+            == {"Prefers tabs over spaces.", "Tabs are preferred over spaces."},
+            f"reopened index ranked wrong: {[hit['content'] for hit in hits]}",
+        )
+        require(reopened.semantic_search("user-b", "database", k=3) == [], "semantic leaked across users")
+        require(reopened.clear("user-a"), "clear returned false")
+        require(not list(memory_dir.glob("*.vec.*")), "clear left vector sidecars behind")
+
+        # Two stores (as two processes would) sync the same unembedded file at
+        # once: the second opens the sidecar under the lock after the first's
+        # rows landed, so every record is embedded exactly once.
+        import threading
+
+        plain = JsonlLongTermMemoryStore(memory_dir)
+        for idx in range(40):
+            plain.append("user-c", f"Unembedded fact number {idx}.")
+        syncers = [
+            threading.Thread(
+                target=JsonlLongTermMemoryStore(memory_dir, embedder=embedder).semantic_search,
+                args=("user-c", "fact", 3),
+            )
+            for _ in range(2)
+        ]
+        for syncer in syncers:
+            syncer.start()
+        for syncer in syncers:
+            syncer.join(timeout=10)
+        ids_path = next(memory_dir.glob("*.vec.ids"))
+        synced = ids_path.read_text(encoding="utf-8").splitlines()
+        matrix_rows = ids_path.with_suffix(".f32").stat().st_size // (4 * embedder.dim)
+        require(
+            len(synced) == len(set(synced)) == matrix_rows == 40,
+            f"concurrent sync duplicated or misaligned rows: ids={len(synced)} rows={matrix_rows}",
+        )
+    return True, "records embedded once at append/first sync, also when synced concurrently; sidecars cleared"
+
+
+def check_lt_compaction() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        memory_dir = Path(tmp) / "memory"
+        store = JsonlLongTermMemoryStore(memory_dir)
+        first = store.append("user-a", "User prefers Python for scripting")
+        for idx in range(20):
+            store.append("user-a", f"Distinct fact number {idx}.")
+        store.append("user-a", "user prefers python for scripting!")
+        near = store.append("user-a", "The user prefers Python for scripting")
+        for _ in range(6):
+            store.append("user-a", "Works in the Berlin office.")
+
+        report = store.maybe_compact("user-a")
+        require(report is not None and report.merged == 7, f"unexpected merge report: {report}")
+        require(report.reclaimed_bytes > 0, f"no bytes reclaimed: {report}")
+        require(not list(memory_dir.glob("*.tmp")), "temp file left behind")
+        records = list(reversed(store.load_recent("user-a", k=100)))
+        require(len(records) == 22, f"expected 22 records after compaction, got {len(records)}")
+        python = [record for record in records if "python" in record["content"].lower()]
+        require(
+            len(python) == 1
+            and python[0]["id"] == near["id"]
+            and python[0]["created_at"] == first["created_at"],
+            f"duplicate group did not keep newest record with earliest created_at: {python}",
+        )
+        require(store.search("user-a", "python", k=1)[0]["id"] == near["id"], "index stale after compaction")
+        require(store.maybe_compact("user-a") is None, "compacted again without new duplicates")
+
+        # After a turn, compaction runs on a worker: the checkpoint save does
+        # not wait for it, and its report is printed before the next turn.
+        import threading
+
+        import main as cli_main
+
+        release = threading.Event()
+        saves: List[int] = []
+
+        def slow_compact(user_id: str) -> Any:
+            release.wait(timeout=5)
+            return report
+
+        class RecordingCheckpoints:
+            def save(self, _thread_id: str, history: list, **_kwargs: Any) -> None:
+                saves.append(len(history))
+
+        state: dict[str, Any] = {
+            "identity": {"user_id": "user-a", "thread_id": "thread-a"},
+            "lt_store": store,
+            "checkpoint_store": RecordingCheckpoints(),
+        }
+        context = RuntimeContext(adapter=None, state=state)  # type: ignore[arg-type]
+        with patch.object(store, "maybe_compact", side_effect=slow_compact):
+            started = time.perf_counter()
+            cli_main._on_after_turn(context, [])  # noqa: SLF001
+            after_turn_s = time.perf_counter() - started
+            require(saves == [0] and after_turn_s < 1.0, f"after-turn waited for compaction: {after_turn_s:.2f}s")
+            release.set()
+            state["lt_compactor"].join(timeout=5)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            cli_main._report_lt_compaction(state)  # noqa: SLF001
+        require(f"merged={report.merged}" in out.getvalue(), f"compaction report lost: {out.getvalue()!r}")
+    return True, f"merged={report.merged} reclaimed_bytes={report.reclaimed_bytes}; runs off the turn path"
+
+
+def check_lt_upsert_tombstones() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        memory_dir = Path(tmp) / "memory"
+        store = JsonlLongTermMemoryStore(memory_dir)
+        first, updated = store.upsert("user-a", "User prefers Python.")
+        require(not updated, "first upsert reported an update")
+        store.upsert("user-a", "Uses vim.")
+        again, updated = store.upsert("user-a", "user prefers python", confidence=0.9)
+        require(updated and again["id"] == first["id"], "same content did not update in place")
+        require(again["created_at"] == first["created_at"], "update lost created_at")
+        color, _ = store.upsert("user-a", "Favorite color is blue.", subject="favorite color")
+        green, updated = store.upsert("user-a", "Favorite color is green.", subject="Favorite Color")
+        require(updated and green["id"] == color["id"], "same subject did not update in place")
+
+        path = next(memory_dir.glob("*.jsonl"))
+        lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+        tombstones = [line for line in lines if line.get("op") == "tombstone"]
+        require(len(lines) == 7 and len(tombstones) == 2, f"unexpected log lines: {lines}")
+        for reader in (store, JsonlLongTermMemoryStore(memory_dir)):
+            recent = [record["content"] for record in reader.load_recent("user-a", k=10)]
+            require(
+                recent == ["Favorite color is green.", "user prefers python", "Uses vim."],
+                f"superseded versions visible: {recent}",
+            )
+            hits = [record["content"] for record in reader.search("user-a", "color blue", k=3)]
+            require(hits == ["Favorite color is green."], f"stale version searchable: {hits}")
+
+        report = store.compact("user-a")
+        require(report is not None and report.folded_lines == 4, f"tombstones not folded: {report}")
+        require(
+            len(path.read_text(encoding="utf-8").splitlines()) == 3,
+            "compaction left tombstone lines",
+        )
+        _record, updated = store.upsert("user-a", "Uses vim.")
+        require(updated, "hash index lost after compaction")
+
+        # Superseding the newest holder of a content key hands the key back
+        # to an older live record with the same content.
+        older = store.append("user-d", "Likes jazz.")
+        store.append("user-d", "Likes jazz.", subject="music")
+        store.upsert("user-d", "Likes blues.", subject="music")
+        jazz, updated = store.upsert("user-d", "likes jazz")
+        require(updated and jazz["id"] == older["id"], "content key dropped with an older duplicate live")
+    return True, f"2 updates logged as tombstone+append; compaction folded {report.folded_lines} lines"
+
+
+def check_lt_sqlite_backend_and_transfer() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "memory.sqlite"
+        store = SqliteLongTermMemoryStore(db_path)
+        store.append("user-a", "Favorite database is PostgreSQL.")
+        for idx in range(50):
+            store.append("user-a", f"Filler fact number {idx} about hobbies.")
+        store.append("user-b", "likes coffee")
+
+        recent = [record["content"] for record in store.load_recent("user-a", k=2)]
+        require(
+            recent == ["Filler fact number 49 about hobbies.", "Filler fact number 48 about hobbies."],
+            f"recency order wrong: {recent}",
+        )
+        hits = store.search("user-a", "Which database do I like?", k=3)
+        require([hit["content"] for hit in hits] == ["Favorite database is PostgreSQL."], "FTS missed fact")
+        require(store.search("user-b", "database", k=3) == [], "FTS leaked across users")
+        color, _ = store.upsert("user-a", "Favorite color is blue.", subject="favorite color")
+        green, updated = store.upsert("user-a", "Favorite color is green.", subject="favorite color")
+        require(updated and green["id"] == color["id"], "sqlite upsert did not update in place")
+        hits = store.search("user-a", "color blue", k=3)
+        require([hit["content"] for hit in hits] == ["Favorite color is green."], "FTS kept stale content")
+
+        other_process = SqliteLongTermMemoryStore(db_path)
+        other_process.append("user-a", "written by another process")
+        require(
+            store.load_recent("user-a", k=1)[0]["content"] == "written by another process",
+            "second connection's write not visible",
+        )
+        other_process.close()
+
+        memory_dir = Path(tmp) / "memory"
+        jsonl = JsonlLongTermMemoryStore(memory_dir)
+        exported = jsonl.import_records(store.iter_all_records())
+        require(exported == 54, f"exported {exported} records")
+        require(
+            jsonl.load_recent("user-a", k=1)[0]["id"] == store.load_recent("user-a", k=1)[0]["id"],
+            "export did not preserve newest record",
+        )
+        restored = SqliteLongTermMemoryStore(Path(tmp) / "restored.sqlite")
+        imported = restored.import_records(jsonl.iter_all_records())
+        imported += restored.import_records(jsonl.iter_all_records())
+        require(imported == 108 and len(restored.load_recent("user-a", k=100)) == 53, "re-import duplicated")
+        require(store.clear("user-a") and not store.clear("user-a"), "clear not idempotent")
+        require(store.load_recent("user-b", k=3)[0]["content"] == "likes coffee", "clear leaked across users")
+
+        # Re-importing an id under another user moves it there, FTS included;
+        # a batch with an invalid record writes nothing.
+        moved = {**restored.load_recent("user-b", k=1)[0], "user_id": "user-c", "content": "likes tea"}
+        restored.import_records([moved])
+        require(restored.load_recent("user-b", k=3) == [], "re-imported id left with its old user")
+        require(
+            [hit["id"] for hit in restored.search("user-c", "tea", k=3)] == [moved["id"]]
+            and restored.search("user-b", "tea", k=3) == [],
+            "re-imported id searchable under the wrong user",
+        )
+        try:
+            restored.import_records([{**moved, "id": "fresh"}, {"id": "broken", "user_id": "user-c"}])
+            rejected = False
+        except LongTermMemoryStoreError:
+            rejected = True
+        require(
+            rejected and len(restored.load_recent("user-c", k=10)) == 1,
+            "invalid import not rejected as a whole",
+        )
+        store.close()
+        restored.close()
+    return True, (
+        "FTS5 search, upsert, cross-connection reads, jsonl<->sqlite round trip, "
+        "validated cross-user import"
+    )
+
+
+LT_WRITER_SNIPPET = """
+import sys
+from pathlib import Path
+sys.path.insert(0, sys.argv[1])
+from cli_core.lt_memory import JsonlLongTermMemoryStore
+store = JsonlLongTermMemoryStore(Path(sys.argv[2]))
+for idx in range(int(sys.argv[4])):
+    store.append("user-a", f"writer {sys.argv[3]} fact {idx} " + "x" * 2000)
+"""
+
+
+def check_lt_multiprocess_appends_and_torn_tail() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        memory_dir = Path(tmp) / "memory"
+        writers, per_writer = 4, 100
+        procs = [
+            subprocess.Popen(
+                [sys.executable, "-c", LT_WRITER_SNIPPET, str(ROOT), str(memory_dir), str(idx), str(per_writer)]
+            )
+            for idx in range(writers)
+        ]
+        for proc in procs:
+            require(proc.wait(timeout=60) == 0, "writer process failed")
+        path = next(memory_dir.glob("*.jsonl"))
+        lines = path.read_bytes().split(b"\n")
+        require(lines[-1] == b"", "file does not end with a newline")
+        parsed = [json.loads(line) for line in lines[:-1]]
+        require(len(parsed) == writers * per_writer, f"lost appends: {len(parsed)}")
+
+        with path.open("ab") as handle:
+            handle.write(b'{"id": "torn", "user_id": "user-a", "cont')
+        store = JsonlLongTermMemoryStore(memory_dir)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            store.load_recent("user-a", k=3)
+            store.load_recent("user-a", k=50)
+            JsonlLongTermMemoryStore(memory_dir).load_recent("user-a", k=3)
+        warnings = out.getvalue()
+        require(warnings.count("torn trailing line") == 1, f"unexpected warnings: {warnings!r}")
+        require("malformed" not in warnings, f"torn line re-warned as malformed: {warnings!r}")
+        store.append("user-a", "after repair")
+        require(store.load_recent("user-a", k=1)[0]["content"] == "after repair", "append after repair lost")
+
+        complete = {"id": "whole", "user_id": "user-a", "content": "no newline", "kind": "semantic",
+                    "created_at": "2026-01-01T00:00:00Z", "updated_at": "2026-01-01T00:00:00Z"}
+        with path.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(complete))
+        fresh = JsonlLongTermMemoryStore(memory_dir)
+        fresh.append("user-a", "next fact")
+        recent = [record["content"] for record in fresh.load_recent("user-a", k=2)]
+        require(recent == ["next fact", "no newline"], f"complete unterminated record lost: {recent}")
+
+        # Another process holds user-a's lock: this process's writer waits on
+        # it, while readers of the same store still answer at once.
+        import fcntl
+        import threading
+
+        fresh.append("user-b", "other user")
+        lock_fd = os.open(memory_dir / f"{path.stem}.lock", os.O_RDWR)
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        try:
+            writer = threading.Thread(target=fresh.append, args=("user-a", "waited for lock"))
+            writer.start()
+            time.sleep(0.1)
+            started = time.perf_counter()
+            fresh.load_recent("user-a", k=50)
+            fresh.search("user-b", "other user")
+            fresh.load_recent("user-b", k=1)
+            read_s = time.perf_counter() - started
+            require(writer.is_alive(), "writer did not wait for the held lock")
+            require(read_s < 0.5, f"readers blocked behind a waiting writer: {read_s:.2f}s")
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+        writer.join(timeout=5)
+        latest = fresh.load_recent("user-a", k=1)[0]["content"]
+        require(latest == "waited for lock", f"write after lock release lost: {latest}")
+    return True, (
+        f"{writers}x{per_writer} concurrent appends intact; torn tail truncated once; "
+        "readers not blocked by a waiting writer"
+    )
+
+
+def check_lt_retention_sweep() -> tuple[bool, str]:
+    def record(idx: int, kind: str, day: int) -> dict[str, Any]:
+        stamp = f"2026-01-{day:02d}T00:00:00Z"
+        return {
+            "id": f"id-{idx}",
+            "user_id": "user-ret",
+            "content": f"{kind} fact number {idx}",
+            "kind": kind,
+            "created_at": stamp,
+            "updated_at": stamp,
+        }
+
+    now = datetime(2026, 1, 31, tzinfo=timezone.utc)
+    with tempfile.TemporaryDirectory() as tmp:
+        memory_dir = Path(tmp) / "memory"
+        policy = RetentionPolicy(
+            max_records=4,
+            max_age_s=20 * 86400,
+            kind_ttls_s={"episodic": 3 * 86400},
+        )
+        store = JsonlLongTermMemoryStore(memory_dir, retention=policy)
+        store.import_records(
+            [record(0, "semantic", 1)]  # older than max_age
+            + [record(idx, "episodic", 20 + idx) for idx in range(1, 6)]  # days 21..25
+            + [record(idx, "semantic", 20 + idx) for idx in range(6, 11)]  # days 26..30
+        )
+        require(len(store.load_recent("user-ret", k=20)) == 11, "setup records missing")
+        result = store.enforce_retention("user-ret", now=now)
+        require(result is not None, "policy not applied")
+        require(result.aged_out == 6, f"expected 6 aged out, got {result.aged_out}")
+        require(result.evicted == 1, f"expected 1 evicted over max_records, got {result.evicted}")
+        live = {item["id"] for item in store.load_recent("user-ret", k=20)}
+        require(live == {"id-7", "id-8", "id-9", "id-10"}, f"wrong survivors: {sorted(live)}")
+        fresh = JsonlLongTermMemoryStore(memory_dir)
+        recent = [item["id"] for item in fresh.load_recent("user-ret", k=10)]
+        require(recent == ["id-10", "id-9", "id-8", "id-7"], f"tombstones not durable: {recent}")
+
+        store.append("user-ret", "a brand new semantic fact")
+        path = store._user_path("user-ret")  # noqa: SLF001
+        size_before = path.stat().st_size
+        sweeper = RetentionSweeper(store, interval_s=0.05)
+        try:
+            deadline = time.monotonic() + 5
+            while sweeper.stats()["sweeps"] == 0 and time.monotonic() < deadline:
+                time.sleep(0.02)
+        finally:
+            sweeper.close()
+        require(sweeper.take_error() is None, "sweeper reported an error")
+        stats = sweeper.stats()
+        # By the wall clock every January record is past max_age by now.
+        require(stats["sweeps"] >= 1 and stats["aged_out"] == 4, f"sweeper did not expire: {stats}")
+        lines = path.read_text(encoding="utf-8").splitlines()
+        require(len(lines) == 1, f"sweep did not compact deleted lines: {len(lines)} lines")
+        require(path.stat().st_size < size_before, "sweep did not reclaim bytes")
+        require(
+            store.load_recent("user-ret", k=1)[0]["content"] == "a brand new semantic fact",
+            "sweeper evicted the newest record",
+        )
+
+        # A sweep deleting a few records out of many leaves its tombstones on
+        # disk; compaction waits until they reach the tombstone threshold.
+        big_dir = Path(tmp) / "big"
+        JsonlLongTermMemoryStore(big_dir).import_records(
+            [{**record(idx, "semantic", 30), "user_id": "user-big"} for idx in range(20)]
+        )
+        for max_records, expected_lines in ((19, 21), (15, 15)):
+            bounded = JsonlLongTermMemoryStore(big_dir, retention=RetentionPolicy(max_records=max_records))
+            manual = RetentionSweeper(bounded, interval_s=3600)
+            try:
+                require(manual.sweep_once() == "user-big", "manual sweep skipped the user")
+            finally:
+                manual.close()
+            big_path = bounded._user_path("user-big")  # noqa: SLF001
+            lines = len(big_path.read_text(encoding="utf-8").splitlines())
+            require(
+                lines == expected_lines,
+                f"max_records={max_records}: expected {expected_lines} lines, got {lines}",
+            )
+    return True, (
+        f"aged_out={result.aged_out} evicted={result.evicted}; background sweep compacted; "
+        "small batches wait for the tombstone threshold"
+    )
+
+
 def run_checks() -> Iterable[tuple[str, bool, str]]:
     checks = [
         ("startup command surface", check_startup_command_surface),
         ("spinner cleanup on stream failure", check_spinner_cleanup_on_stream_failure),
+        ("streaming render + first-token spinner stop", check_streaming_render_and_first_token),
         ("turn error fail-open + model reuse", check_turn_failure_recovery_and_model_reuse),
+        ("parallel tool calls + upsert guard", check_parallel_tool_calls),
+        ("async runtime Ctrl-C cancels turn", check_async_runtime_cancel_keeps_session),
+        ("model retries + timeouts + hedging", check_model_retry_timeouts_and_hedging),
+        ("response cache replay + TTL/LRU", check_response_cache_replay),
+        ("turn profiler spans + JSONL export", check_turn_profiler_spans),
+        ("idle LT prefetch + invalidation", check_idle_lt_prefetch),
+        ("stable prompt prefix + cached tokens", check_stable_prompt_prefix_and_cached_tokens),
+        ("provider connection reuse + warm-up", check_provider_connection_reuse),
         ("stage2 ST restore/isolation", check_stage2_st_restore_isolation),
+        ("ST delta append + legacy migration", check_st_delta_append_and_legacy_migration),
+        ("ST codec mixed rows", check_st_codec_mixed_rows),
+        ("ST lazy tail restore + paging", check_st_lazy_tail_restore),
+        ("context window + rolling summary", check_context_window_summary),
+        ("ST write-behind flush/errors", check_st_write_behind_flush_and_errors),
         ("stage3 LT restore/isolation/clear", check_stage3_lt_restore_isolation_clear),
+        ("LT O(k) tail read", check_lt_tail_read_newest_first),
+        ("LT mmap reader skips superseded", check_lt_mmap_reader_skips_superseded),
+        ("LT cache stat invalidation + LRU", check_lt_cache_stat_invalidation),
+        ("LT BM25 search", check_lt_bm25_search),
+        ("LT semantic search", check_lt_semantic_search),
+        ("LT dedup compaction", check_lt_compaction),
+        ("LT upsert tombstones", check_lt_upsert_tombstones),
+        ("LT sqlite backend + transfer", check_lt_sqlite_backend_and_transfer),
+        ("LT multi-process appends + torn tail", check_lt_multiprocess_appends_and_torn_tail),
+        ("LT retention + background sweep", check_lt_retention_sweep),
     ]
     for name, fn in checks:
         try:
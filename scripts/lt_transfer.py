@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from cli_core.lt_memory import JsonlLongTermMemoryStore
+from cli_core.lt_sqlite import SqliteLongTermMemoryStore
+
+DEFAULT_MEMORY_DIR = ROOT / "data" / "memory"
+DEFAULT_DB = ROOT / "data" / "memory.sqlite"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Copy long-term memory between the JSONL files and the SQLite backend."
+    )
+    parser.add_argument("direction", choices=("to-sqlite", "to-jsonl"))
+    parser.add_argument("--memory-dir", type=Path, default=DEFAULT_MEMORY_DIR)
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB)
+    args = parser.parse_args()
+
+    jsonl_store = JsonlLongTermMemoryStore(args.memory_dir)
+    sqlite_store = SqliteLongTermMemoryStore(args.db)
+    try:
+        if args.direction == "to-sqlite":
+            count = sqlite_store.import_records(jsonl_store.iter_all_records())
+            print(f"Imported {count} records from {args.memory_dir} into {args.db}.")
+        else:
+            count = jsonl_store.import_records(sqlite_store.iter_all_records())
+            print(f"Exported {count} records from {args.db} into {args.memory_dir}.")
+    finally:
+        sqlite_store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())